@@ -6,63 +6,585 @@
 """
 
 Usage:
-  ./archive_images.py -a path_to_archiver -d input_output_dir
+  ./archive_images.py [-a path_to_archiver] [-c compression] [-j jobs]
+                      -d input_output_dir
 
   input_output_dir should points to the directory where images are created by
   build_images.py. The script outputs archives to input_output_dir.
 
-  path_to_archiver should points to the tool which bundles files into a blob,
-  which can be unpacked by Depthcharge.
+  The archives are written in the format of the archive tool of coreboot utils,
+  which bundles files into a blob that can be unpacked by Depthcharge. If
+  path_to_archiver is given, that tool is run instead of the built-in writer.
+
+  If compression ('lz4' or 'lzma') is given, compressed archives are written
+  instead, in which each file is compressed separately and can be looked up by
+  name through a hash table. This needs firmware support for the format.
+
+  Archives are created in parallel by up to `jobs` threads.
 """
 
 from collections import defaultdict
+from collections import namedtuple
+from concurrent import futures
 import getopt
 import glob
+import lzma
 import os
+import shutil
+import struct
 import subprocess
 import sys
 
+import lz4_block
+
 
 LOCALE_DIR = 'locale'
 LOCALE_RO_DIR = os.path.join(LOCALE_DIR, 'ro')
 LOCALE_RW_DIR = os.path.join(LOCALE_DIR, 'rw')
 
+# The archive format of the archive tool. See util/archive/archive.h in
+# coreboot.
+ARCHIVE_MAGIC = b'CBAR'
+ARCHIVE_VERSION = 0
+# Size of the name field of a directory entry, including the terminating NUL.
+ARCHIVE_NAME_LENGTH = 32
+
+# Directory header: magic, version, total size, number of entries.
+_HEADER = struct.Struct('<4sIII')
+# Directory entry: name, offset and size of the data.
+_ENTRY = struct.Struct(f'<{ARCHIVE_NAME_LENGTH}sII')
+
+# Sizes of the directory header and of each directory entry of an archive.
+ARCHIVE_HEADER_SIZE = _HEADER.size
+ARCHIVE_ENTRY_SIZE = _ENTRY.size
+
+# An entry of an archive.
+#   name: Name of the file.
+#   offset: Offset of the data from the start of the archive.
+#   size: Size of the data.
+ArchiveEntry = namedtuple('ArchiveEntry', ['name', 'offset', 'size'])
+
+# The compressed archive format, which is laid out as a directory header, the
+# directory entries, a hash table of the entries and the data.
+COMPRESSED_ARCHIVE_MAGIC = b'CBAZ'
+COMPRESSED_ARCHIVE_VERSION = 1
+
+# Compression of the files of compressed archives. Each file is compressed
+# separately, and stored uncompressed if compression does not make it smaller.
+COMPRESSION_NONE = 'none'
+# LZ4 block format.
+COMPRESSION_LZ4 = 'lz4'
+# LZMA in the .lzma (LZMA_Alone) format, as decompressed by coreboot.
+COMPRESSION_LZMA = 'lzma'
+
+COMPRESSIONS = (COMPRESSION_LZ4, COMPRESSION_LZMA)
+
+# Values of the compression field of the directory entries.
+_COMPRESSION_IDS = {
+    COMPRESSION_NONE: 0,
+    COMPRESSION_LZ4: 1,
+    COMPRESSION_LZMA: 2,
+}
+_COMPRESSION_NAMES = {value: key for key, value in _COMPRESSION_IDS.items()}
+
+# Minimum dictionary size of LZMA.
+_MIN_LZMA_DICT_SIZE = 4096
+
+# Directory header: magic, version, total size, number of entries, number of
+# slots of the hash table.
+_COMPRESSED_HEADER = struct.Struct('<4sIIII')
+# Directory entry: name, offset and size of the compressed data, size of the
+# file and compression.
+_COMPRESSED_ENTRY = struct.Struct(f'<{ARCHIVE_NAME_LENGTH}sIIII')
+# Slot of the hash table: index of an entry, or `_EMPTY_SLOT`.
+_SLOT = struct.Struct('<I')
+_EMPTY_SLOT = 0xFFFFFFFF
+
+# Sizes of the directory header, of each directory entry and of each slot of
+# the hash table of a compressed archive.
+COMPRESSED_ARCHIVE_HEADER_SIZE = _COMPRESSED_HEADER.size
+COMPRESSED_ARCHIVE_ENTRY_SIZE = _COMPRESSED_ENTRY.size
+COMPRESSED_ARCHIVE_SLOT_SIZE = _SLOT.size
+
+# Parameters of the 32-bit FNV-1a hash of the names.
+_FNV_OFFSET_BASIS = 0x811C9DC5
+_FNV_PRIME = 0x01000193
+
+# An entry of a compressed archive.
+#   name: Name of the file.
+#   offset: Offset of the compressed data from the start of the archive.
+#   size: Size of the compressed data.
+#   raw_size: Size of the file.
+#   compression: Compression of the data, one of `COMPRESSION_*`.
+CompressedArchiveEntry = namedtuple(
+    'CompressedArchiveEntry',
+    ['name', 'offset', 'size', 'raw_size', 'compression'],
+)
+
+
+class ArchiveError(Exception):
+    """Exception for invalid archives or files that cannot be archived."""
+
+
+def write_archive(archive, files):
+    """Writes an archive of `files`, like `archive <archive> create <files>`.
+
+    The archive is written to a temporary file, which replaces `archive` once
+    complete. The contents of the files are copied straight into it.
+
+    Args:
+        archive: path of the archive file
+        files: list of files to be archived, in order
+    """
+    sizes = [os.path.getsize(file) for file in files]
+    offset = ARCHIVE_HEADER_SIZE + ARCHIVE_ENTRY_SIZE * len(files)
+    entries = []
+    for file, size in zip(files, sizes):
+        name = os.path.basename(file).encode()
+        if len(name) >= ARCHIVE_NAME_LENGTH:
+            raise ArchiveError(f'File name too long: {file}')
+        entries.append(_ENTRY.pack(name, offset, size))
+        offset += size
+
+    temp_archive = archive + '.tmp'
+    try:
+        with open(temp_archive, 'wb') as f:
+            f.write(
+                _HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, offset, len(files))
+            )
+            f.write(b''.join(entries))
+            for file, size in zip(files, sizes):
+                start = f.tell()
+                with open(file, 'rb') as src:
+                    shutil.copyfileobj(src, f)
+                if f.tell() - start != size:
+                    raise ArchiveError(f'File changed while archiving: {file}')
+        os.replace(temp_archive, archive)
+    except BaseException:
+        if os.path.exists(temp_archive):
+            os.unlink(temp_archive)
+        raise
+
+
+def parse_archive(data):
+    """Parses the directory of an archive.
+
+    Args:
+        data: the archive as a bytes-like object
+
+    Returns:
+        A list of `ArchiveEntry` objects, in order.
+    """
+    if len(data) < ARCHIVE_HEADER_SIZE:
+        raise ArchiveError('Archive too short')
+    magic, version, size, count = _HEADER.unpack_from(data)
+    if magic != ARCHIVE_MAGIC:
+        raise ArchiveError('Not an archive')
+    if version != ARCHIVE_VERSION:
+        raise ArchiveError(f'Unsupported archive version {version}')
+    if size != len(data):
+        raise ArchiveError(f'Archive size {len(data)} != {size} in header')
+    if ARCHIVE_HEADER_SIZE + ARCHIVE_ENTRY_SIZE * count > size:
+        raise ArchiveError(f'Directory of {count} entries exceeds archive')
+    entries = []
+    for i in range(count):
+        name, offset, entry_size = _ENTRY.unpack_from(
+            data, ARCHIVE_HEADER_SIZE + ARCHIVE_ENTRY_SIZE * i
+        )
+        name = name.split(b'\0', 1)[0].decode()
+        if offset + entry_size > size:
+            raise ArchiveError(f'Entry {name!r} exceeds archive')
+        entries.append(ArchiveEntry(name, offset, entry_size))
+    return entries
+
+
+def read_archive(archive):
+    """Reads the files of an archive.
+
+    Args:
+        archive: path of the archive file
+
+    Returns:
+        A dict mapping file names to their contents, in order.
+    """
+    with open(archive, 'rb') as f:
+        data = f.read()
+    try:
+        entries = parse_archive(data)
+    except ArchiveError as e:
+        raise ArchiveError(f'{archive}: {e}') from e
+    return {
+        entry.name: data[entry.offset : entry.offset + entry.size]
+        for entry in entries
+    }
+
+
+def verify_archive(archive, files):
+    """Checks that an archive contains exactly `files`, in order.
+
+    Args:
+        archive: path of the archive file
+        files: list of the archived files
+    """
+    contents = read_archive(archive)
+    names = [os.path.basename(file) for file in files]
+    if list(contents) != names:
+        raise ArchiveError(f'{archive}: Files differ from {names}')
+    for file, name in zip(files, names):
+        with open(file, 'rb') as f:
+            if f.read() != contents[name]:
+                raise ArchiveError(f'{archive}: Content of {name} differs')
+
+
+def hash_name(name):
+    """Gets the 32-bit FNV-1a hash of a file name in a compressed archive.
+
+    Args:
+        name: the file name as bytes
+    """
+    value = _FNV_OFFSET_BASIS
+    for byte in name:
+        value = ((value ^ byte) * _FNV_PRIME) & 0xFFFFFFFF
+    return value
+
+
+def get_num_slots(count):
+    """Gets the number of slots of the hash table of `count` entries.
+
+    The table is a power of two at most half full, so that lookups take few
+    probes.
+    """
+    slots = 1
+    while slots < 2 * count:
+        slots *= 2
+    return slots
+
+
+def compress_data(data, compression):
+    """Compresses the data of a file.
+
+    Args:
+        data: the contents of the file
+        compression: one of `COMPRESSION_*`
+
+    Returns:
+        The compressed data as bytes.
+    """
+    if compression == COMPRESSION_LZ4:
+        return lz4_block.compress(data)
+    if compression == COMPRESSION_LZMA:
+        # The dictionary need not be larger than the file, which also bounds
+        # the memory needed to decompress it.
+        dict_size = _MIN_LZMA_DICT_SIZE
+        while dict_size < len(data):
+            dict_size *= 2
+        filters = [
+            {
+                'id': lzma.FILTER_LZMA1,
+                'preset': 9 | lzma.PRESET_EXTREME,
+                'dict_size': dict_size,
+            }
+        ]
+        return lzma.compress(data, format=lzma.FORMAT_ALONE, filters=filters)
+    if compression == COMPRESSION_NONE:
+        return bytes(data)
+    raise ArchiveError(f'Unknown compression {compression!r}')
+
+
+def decompress_data(data, compression, raw_size):
+    """Decompresses the data of a file compressed by `compress_data()`.
+
+    Args:
+        data: the compressed data
+        compression: one of `COMPRESSION_*`
+        raw_size: size of the file
+
+    Returns:
+        The contents of the file as bytes.
+    """
+    try:
+        if compression == COMPRESSION_LZ4:
+            out = lz4_block.decompress(data, raw_size)
+        elif compression == COMPRESSION_LZMA:
+            out = lzma.decompress(data, format=lzma.FORMAT_ALONE)
+        elif compression == COMPRESSION_NONE:
+            out = bytes(data)
+        else:
+            raise ArchiveError(f'Unknown compression {compression!r}')
+    except (lz4_block.Lz4Error, lzma.LZMAError) as e:
+        raise ArchiveError(f'Failed to decompress: {e}') from e
+    if len(out) != raw_size:
+        raise ArchiveError(f'Decompressed size {len(out)} != {raw_size}')
+    return out
+
+
+def build_compressed_archive(contents, compression):
+    """Builds a compressed archive in memory.
+
+    Args:
+        contents: list of (name, data) of the files to be archived, in order
+        compression: one of `COMPRESSIONS`, used for each file that it makes
+            smaller
+
+    Returns:
+        The archive as bytes.
+    """
+    slots = [_EMPTY_SLOT] * get_num_slots(len(contents))
+    offset = (
+        COMPRESSED_ARCHIVE_HEADER_SIZE
+        + COMPRESSED_ARCHIVE_ENTRY_SIZE * len(contents)
+        + COMPRESSED_ARCHIVE_SLOT_SIZE * len(slots)
+    )
+    entries = []
+    blobs = []
+    for index, (name, data) in enumerate(contents):
+        name = name.encode()
+        if len(name) >= ARCHIVE_NAME_LENGTH:
+            raise ArchiveError(f'File name too long: {name.decode()}')
+        blob = compress_data(data, compression)
+        entry_compression = compression
+        if len(blob) >= len(data):
+            blob = bytes(data)
+            entry_compression = COMPRESSION_NONE
+        entries.append(
+            _COMPRESSED_ENTRY.pack(
+                name,
+                offset,
+                len(blob),
+                len(data),
+                _COMPRESSION_IDS[entry_compression],
+            )
+        )
+        blobs.append(blob)
+        offset += len(blob)
+
+        slot = hash_name(name) & (len(slots) - 1)
+        while slots[slot] != _EMPTY_SLOT:
+            slot = (slot + 1) & (len(slots) - 1)
+        slots[slot] = index
+
+    header = _COMPRESSED_HEADER.pack(
+        COMPRESSED_ARCHIVE_MAGIC,
+        COMPRESSED_ARCHIVE_VERSION,
+        offset,
+        len(contents),
+        len(slots),
+    )
+    return b''.join(
+        [header] + entries + [_SLOT.pack(index) for index in slots] + blobs
+    )
+
+
+def write_compressed_archive(archive, files, compression):
+    """Writes a compressed archive of `files`.
+
+    Args:
+        archive: path of the archive file
+        files: list of files to be archived, in order
+        compression: one of `COMPRESSIONS`
+    """
+    contents = []
+    for file in files:
+        with open(file, 'rb') as f:
+            contents.append((os.path.basename(file), f.read()))
+    data = build_compressed_archive(contents, compression)
+
+    temp_archive = archive + '.tmp'
+    try:
+        with open(temp_archive, 'wb') as f:
+            f.write(data)
+        os.replace(temp_archive, archive)
+    except BaseException:
+        if os.path.exists(temp_archive):
+            os.unlink(temp_archive)
+        raise
+
+
+def _parse_compressed_header(data):
+    """Parses the directory header of a compressed archive.
+
+    Returns:
+        A tuple of the number of entries and the number of slots.
+    """
+    if len(data) < COMPRESSED_ARCHIVE_HEADER_SIZE:
+        raise ArchiveError('Archive too short')
+    magic, version, size, count, num_slots = _COMPRESSED_HEADER.unpack_from(
+        data
+    )
+    if magic != COMPRESSED_ARCHIVE_MAGIC:
+        raise ArchiveError('Not a compressed archive')
+    if version != COMPRESSED_ARCHIVE_VERSION:
+        raise ArchiveError(f'Unsupported archive version {version}')
+    if size != len(data):
+        raise ArchiveError(f'Archive size {len(data)} != {size} in header')
+    if num_slots & (num_slots - 1) or num_slots < count:
+        raise ArchiveError(f'Invalid hash table of {num_slots} slots')
+    if (
+        COMPRESSED_ARCHIVE_HEADER_SIZE
+        + COMPRESSED_ARCHIVE_ENTRY_SIZE * count
+        + COMPRESSED_ARCHIVE_SLOT_SIZE * num_slots
+        > size
+    ):
+        raise ArchiveError(f'Directory of {count} entries exceeds archive')
+    return count, num_slots
+
+
+def _get_compressed_entry(data, index):
+    """Gets the `index`-th directory entry of a compressed archive."""
+    name, offset, size, raw_size, compression_id = (
+        _COMPRESSED_ENTRY.unpack_from(
+            data,
+            COMPRESSED_ARCHIVE_HEADER_SIZE
+            + COMPRESSED_ARCHIVE_ENTRY_SIZE * index,
+        )
+    )
+    name = name.split(b'\0', 1)[0].decode()
+    if offset + size > len(data):
+        raise ArchiveError(f'Entry {name!r} exceeds archive')
+    if compression_id not in _COMPRESSION_NAMES:
+        raise ArchiveError(
+            f'Entry {name!r} has unknown compression {compression_id}'
+        )
+    return CompressedArchiveEntry(
+        name, offset, size, raw_size, _COMPRESSION_NAMES[compression_id]
+    )
+
 
-def archive_images(archiver, output, name, files):
+def parse_compressed_archive(data):
+    """Parses the directory of a compressed archive.
+
+    Args:
+        data: the archive as a bytes-like object
+
+    Returns:
+        A list of `CompressedArchiveEntry` objects, in order.
+    """
+    count, _ = _parse_compressed_header(data)
+    return [_get_compressed_entry(data, index) for index in range(count)]
+
+
+def find_compressed_entry(data, name):
+    """Looks up a file in a compressed archive by the hash table.
+
+    This is how the firmware finds a file, without scanning the directory.
+
+    Args:
+        data: the archive as a bytes-like object
+        name: the file name
+
+    Returns:
+        A `CompressedArchiveEntry`, or None if there is no such file.
+    """
+    count, num_slots = _parse_compressed_header(data)
+    slots_offset = (
+        COMPRESSED_ARCHIVE_HEADER_SIZE + COMPRESSED_ARCHIVE_ENTRY_SIZE * count
+    )
+    slot = hash_name(name.encode()) & (num_slots - 1)
+    for _ in range(num_slots):
+        (index,) = _SLOT.unpack_from(
+            data, slots_offset + COMPRESSED_ARCHIVE_SLOT_SIZE * slot
+        )
+        if index == _EMPTY_SLOT:
+            return None
+        if index >= count:
+            raise ArchiveError(f'Invalid entry {index} in hash table')
+        entry = _get_compressed_entry(data, index)
+        if entry.name == name:
+            return entry
+        slot = (slot + 1) & (num_slots - 1)
+    return None
+
+
+def read_compressed_entry(data, entry):
+    """Reads and decompresses a file of a compressed archive.
+
+    Args:
+        data: the archive as a bytes-like object
+        entry: a `CompressedArchiveEntry` of the archive
+
+    Returns:
+        The contents of the file as bytes.
+    """
+    try:
+        return decompress_data(
+            data[entry.offset : entry.offset + entry.size],
+            entry.compression,
+            entry.raw_size,
+        )
+    except ArchiveError as e:
+        raise ArchiveError(f'Entry {entry.name!r}: {e}') from e
+
+
+def read_compressed_archive(archive):
+    """Reads the files of a compressed archive.
+
+    Args:
+        archive: path of the archive file
+
+    Returns:
+        A dict mapping file names to their contents, in order.
+    """
+    with open(archive, 'rb') as f:
+        data = f.read()
+    try:
+        return {
+            entry.name: read_compressed_entry(data, entry)
+            for entry in parse_compressed_archive(data)
+        }
+    except ArchiveError as e:
+        raise ArchiveError(f'{archive}: {e}') from e
+
+
+def archive_images(archiver, output, name, files, compression=None):
     """Archives files.
 
     Args:
-        archiver: path to the archive tool
+        archiver: path to the archive tool, or None to use the built-in writer
         output: path to the output directory
         name: name of the archive file
         files: list of files to be archived
+        compression: one of `COMPRESSIONS` to write a compressed archive, or
+            None
     """
     archive = os.path.join(output, name)
-    args = ' '.join(files)
-    command = f'{archiver} {archive} create {args}'
-    subprocess.check_call(command, shell=True)
+    # Sort the files, so that the archives are reproducible.
+    files = sorted(files)
+    if compression:
+        write_compressed_archive(archive, files, compression)
+    elif archiver:
+        subprocess.check_call([archiver, archive, 'create'] + files)
+    else:
+        write_archive(archive, files)
 
 
-def archive_base(archiver, output):
-    """Archives base (locale-independent) images.
+def get_archive_size(files):
+    """Gets the size of the archive of `files` created by the archive tool.
 
     Args:
-        archiver: path to the archive tool
-        output: path to the output directory
+        files: list of files to be archived
     """
-    base_images = glob.glob(os.path.join(output, '*.bmp'))
+    return ARCHIVE_HEADER_SIZE + sum(
+        ARCHIVE_ENTRY_SIZE + os.path.getsize(file) for file in files
+    )
 
-    # create archive of base images
-    archive_images(archiver, output, 'vbgfx.bin', base_images)
 
+def get_base_images(output):
+    """Gets base (locale-independent) images.
 
-def archive_localized(archiver, output, pattern):
-    """Archives localized images.
+    Args:
+        output: path to the output directory
+    """
+    return glob.glob(os.path.join(output, '*.bmp'))
+
+
+def get_localized_images(output):
+    """Gets localized images.
 
     Args:
-        archiver: path to the archive tool
         output: path to the output directory
-        pattern: filename with a '%s' to fill in the locale code
+
+    Returns:
+        A dict mapping each locale to the list of its images.
     """
     locale_images = defaultdict(lambda: [])
 
@@ -71,37 +593,138 @@ def archive_localized(archiver, output, pattern):
         locale = os.path.basename(path)
         for file in files:
             locale_images[locale].append(file)
+    return locale_images
+
+
+def get_archives(output):
+    """Gets the images of each archive built from a board output directory.
+
+    This includes `font.bin` of the glyph images, which is not written by
+    `main()`, for reporting the sizes of all archives in firmware.
+
+    Args:
+        output: path to the output directory
+
+    Returns:
+        A dict mapping archive names to lists of images.
+    """
+    archives = {
+        'vbgfx.bin': get_base_images(output),
+        'font.bin': glob.glob(os.path.join(output, 'glyph', '*.bmp')),
+    }
+    for locale_dir, pattern in (
+        (LOCALE_RO_DIR, 'locale_%s.bin'),
+        (LOCALE_RW_DIR, 'rw_locale_%s.bin'),
+    ):
+        locale_images = get_localized_images(os.path.join(output, locale_dir))
+        for locale, images in locale_images.items():
+            archives[pattern % locale] = images
+    return archives
+
+
+def archive_base(archiver, output, executor, compression=None):
+    """Archives base (locale-independent) images.
+
+    Args:
+        archiver: path to the archive tool, or None
+        output: path to the output directory
+        executor: a `concurrent.futures.Executor` to archive with
+        compression: compression of the archives, see `archive_images()`
+
+    Returns:
+        A list of futures of the archives.
+    """
+    base_images = get_base_images(output)
+
+    # create archive of base images
+    return [
+        executor.submit(
+            archive_images,
+            archiver,
+            output,
+            'vbgfx.bin',
+            base_images,
+            compression,
+        )
+    ]
+
+
+def archive_localized(archiver, output, pattern, executor, compression=None):
+    """Archives localized images.
+
+    Args:
+        archiver: path to the archive tool, or None
+        output: path to the output directory
+        pattern: filename with a '%s' to fill in the locale code
+        executor: a `concurrent.futures.Executor` to archive with
+        compression: compression of the archives, see `archive_images()`
+
+    Returns:
+        A list of futures of the archives.
+    """
+    locale_images = get_localized_images(output)
 
     # create archives of localized images
-    for locale, images in locale_images.items():
-        archive_images(archiver, output, pattern % locale, images)
+    return [
+        executor.submit(
+            archive_images,
+            archiver,
+            output,
+            pattern % locale,
+            images,
+            compression,
+        )
+        for locale, images in locale_images.items()
+    ]
 
 
 def main(args):
     """Archives images."""
-    opts, args = getopt.getopt(args, 'a:d:')
-    archiver = ''
+    opts, args = getopt.getopt(args, 'a:c:d:j:')
+    archiver = None
+    compression = None
     output = ''
+    jobs = None
 
     for opt, arg in opts:
         if opt == '-a':
             archiver = arg
+        elif opt == '-c':
+            compression = arg
         elif opt == '-d':
             output = arg
+        elif opt == '-j':
+            jobs = int(arg)
         else:
             assert False, 'Invalid option'
-    if args or not archiver or not output:
+    if args or not output:
         assert False, 'Invalid usage'
+    if compression:
+        assert compression in COMPRESSIONS, 'Invalid compression'
+        assert not archiver, 'The archive tool cannot compress'
 
-    print('Archiving vbfgx.bin', file=sys.stderr, flush=True)
-    archive_base(archiver, output)
-    print('Archiving locales for RO', file=sys.stderr, flush=True)
-    ro_locale_dir = os.path.join(output, LOCALE_RO_DIR)
-    rw_locale_dir = os.path.join(output, LOCALE_RW_DIR)
-    archive_localized(archiver, ro_locale_dir, 'locale_%s.bin')
-    if os.path.exists(rw_locale_dir):
-        print('Archiving locales for RW', file=sys.stderr, flush=True)
-        archive_localized(archiver, rw_locale_dir, 'rw_locale_%s.bin')
+    # The archives are written by threads, since the built-in writer mostly
+    # copies files and the archive tool runs in its own process.
+    with futures.ThreadPoolExecutor(jobs) as executor:
+        print('Archiving vbfgx.bin', file=sys.stderr, flush=True)
+        tasks = archive_base(archiver, output, executor, compression)
+        print('Archiving locales for RO', file=sys.stderr, flush=True)
+        ro_locale_dir = os.path.join(output, LOCALE_RO_DIR)
+        rw_locale_dir = os.path.join(output, LOCALE_RW_DIR)
+        tasks += archive_localized(
+            archiver, ro_locale_dir, 'locale_%s.bin', executor, compression
+        )
+        if os.path.exists(rw_locale_dir):
+            print('Archiving locales for RW', file=sys.stderr, flush=True)
+            tasks += archive_localized(
+                archiver,
+                rw_locale_dir,
+                'rw_locale_%s.bin',
+                executor,
+                compression,
+            )
+        for task in tasks:
+            task.result()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,573 @@
+#!/usr/bin/env python
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Hermetic benchmark of the converter.
+
+The converter is driven end to end with a deterministic stand-in for the text
+renderer and the SVG rasterizer, so neither pango-view, rsvg-convert nor any
+font is needed. The stub renderer follows the metrics of Pango
+closely enough that the DPI and width searches take realistic steps: the font
+size scales with the height and DPI, glyphs are hinted to whole pixels, and
+lines are wrapped at the layout width.
+
+Each scenario builds one board config for one set of locales in a separate
+process, and records the number of renders by the searches, the total size of
+the bitmaps, the wall time and the peak RSS. The results can be compared with a
+baseline file to flag regressions. The first two are deterministic and always
+compared, while the others depend on the host and are only compared on request.
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zlib
+
+from PIL import Image
+from PIL import ImageDraw
+import yaml
+
+import build
+import renderers
+import svg_rasterizers
+
+
+BASELINE_FILE = os.path.join(build.SCRIPT_BASE, 'benchmark_baseline.json')
+BASELINE_VERSION = 2
+
+# Scenarios: name -> (board, locales). None for the locales of the board.
+SCENARIOS = {
+    'asurada-en': ('asurada', ['en']),
+    'asurada-latin': ('asurada', ['en', 'de', 'fr', 'es-419', 'pt-BR', 'fi']),
+    'asurada-cjk': ('asurada', ['ja', 'ko', 'zh-CN', 'zh-TW']),
+    'asurada-complex': ('asurada', ['ar', 'he', 'fa', 'hi', 'ta', 'th']),
+    'grunt-all': ('grunt', None),
+    'myst-all': ('myst', None),
+}
+DEFAULT_SCENARIOS = ['asurada-en', 'asurada-latin', 'asurada-cjk', 'grunt-all']
+
+# Metrics of a scenario.
+METRIC_PROBES = 'probes'
+METRIC_BYTES = 'bytes'
+METRIC_WALL_TIME = 'wall_time'
+METRIC_PEAK_RSS = 'peak_rss_kib'
+METRIC_PEAK_WORKER_RSS = 'peak_worker_rss_kib'
+# Metrics that are the same in every run, so that any growth is a regression.
+COUNTERS = (METRIC_PROBES, METRIC_BYTES)
+# Metrics of the resource usage, which depend on the host and its load, and the
+# default factors by which they may grow before they are reported.
+RESOURCE_TOLERANCES = {
+    METRIC_WALL_TIME: 1.25,
+    METRIC_PEAK_RSS: 1.25,
+    METRIC_PEAK_WORKER_RSS: 1.25,
+}
+
+# Fonts are not read, so all fonts have the same hash.
+STUB_FONT_HASH = 'stub'
+
+# Font metrics of the stub renderer relative to the font size in pixels.
+_ASCENT = 0.95
+_DESCENT = 0.3
+# Scripts with tall ascenders or descenders have taller lines.
+_TALL_SCRIPTS_ASCENT = 1.25
+# Advances of narrow and wide (CJK) characters.
+_NARROW_ADVANCE = 0.45
+_WIDE_ADVANCE = 1.0
+# Tokens of line wrapping: runs of spaces, single characters of scripts which
+# may be wrapped between any characters (Thai and wide characters), and words.
+_TOKEN_PATTERN = re.compile(
+    r' +|[\u0e00-\u0e7f\u1100-\U0010ffff]|[^ \u0e00-\u0e7f\u1100-\U0010ffff]+'
+)
+
+
+def _is_wide(char):
+    """Returns True if `char` is drawn at full width, like CJK characters."""
+    return ord(char) >= 0x1100
+
+
+def _is_tall(char):
+    """Returns True if `char` is of a script with tall lines."""
+    return 0x0900 <= ord(char) < 0x1100
+
+
+class StubRenderer(renderers.TextRenderer):
+    """Deterministic text renderer drawing a box for each character.
+
+    The font size and the line wrapping follow `PangoCairoRenderer`. With full
+    hinting, the font size is rounded to whole pixels, so the image height is a
+    step function of the DPI as with real fonts.
+    """
+
+    NAME = 'stub'
+
+    @classmethod
+    def _get_font_size_px(cls, height, dpi, hinting):
+        size_px = height / 2 * (dpi or renderers.DEFAULT_DPI) / 72
+        return round(size_px) if hinting == 'full' else size_px
+
+    @classmethod
+    def _get_advance(cls, char, size_px):
+        if char == ' ':
+            return size_px * _NARROW_ADVANCE * 0.6
+        if _is_wide(char):
+            return size_px * _WIDE_ADVANCE
+        # Vary the widths of narrow characters like proportional fonts.
+        return size_px * (_NARROW_ADVANCE + ord(char) % 7 * 0.03)
+
+    @classmethod
+    def _get_line_height(cls, text, size_px):
+        ascent = _TALL_SCRIPTS_ASCENT if any(map(_is_tall, text)) else _ASCENT
+        return round(size_px * (ascent + _DESCENT))
+
+    @classmethod
+    def _wrap(cls, text, size_px, width_px):
+        """Wraps `text` into lines of at most `width_px`, if not None.
+
+        Returns:
+            A list of lines, each a list of (x, char).
+        """
+        lines = []
+        for paragraph in text.split('\n'):
+            tokens = _TOKEN_PATTERN.findall(paragraph)
+            line = []
+            x = 0
+            for token in tokens:
+                advances = [cls._get_advance(c, size_px) for c in token]
+                if (
+                    width_px is not None
+                    and line
+                    and token[0] != ' '
+                    and x + sum(advances) > width_px
+                ):
+                    lines.append(line)
+                    line = []
+                    x = 0
+                if not line and token[0] == ' ':
+                    continue
+                for char, advance in zip(token, advances):
+                    line.append((x, char))
+                    x += advance
+            lines.append(line)
+        return lines
+
+    @classmethod
+    def _get_line_width(cls, line, size_px):
+        if not line:
+            return 0
+        x, char = line[-1]
+        return x + cls._get_advance(char, size_px)
+
+    def _draw(self, draw, lines, size_px, line_height, fgcolor, scale=1):
+        for i, line in enumerate(lines):
+            top = i * line_height
+            for x, char in line:
+                if char == ' ':
+                    continue
+                advance = self._get_advance(char, size_px)
+                # Vary the glyph heights between x-height and cap height.
+                glyph_top = top + size_px * (0.2 + ord(char) % 3 * 0.15)
+                draw.rectangle(
+                    [
+                        (x + advance * 0.1) * scale,
+                        glyph_top * scale,
+                        (x + advance * 0.85) * scale - 1,
+                        (top + size_px * _ASCENT) * scale - 1,
+                    ],
+                    fill=fgcolor,
+                )
+
+    def render(
+        self,
+        text,
+        locale,
+        font,
+        height,
+        width_pt,
+        dpi,
+        bgcolor,
+        fgcolor,
+        hinting='full',
+    ):
+        size_px = self._get_font_size_px(height, dpi, hinting)
+        if size_px <= 0:
+            return renderers.RenderedText(None, (0, 0, 0, 0))
+        dpi = dpi or renderers.DEFAULT_DPI
+        layout_width = None
+        if width_pt:
+            layout_width = -(-(width_pt * dpi + 36) // 72)
+        lines = self._wrap(text, size_px, layout_width)
+        line_height = self._get_line_height(text, size_px)
+        width = max(
+            round(self._get_line_width(line, size_px)) for line in lines
+        )
+        if layout_width is not None:
+            width = max(width, layout_width)
+        height_px = line_height * len(lines)
+        if width <= 0 or height_px <= 0:
+            return renderers.RenderedText(None, (0, 0, width, height_px))
+        image = Image.new('RGB', (width, height_px), bgcolor)
+        self._draw(ImageDraw.Draw(image), lines, size_px, line_height, fgcolor)
+        return renderers.RenderedText(image, (0, 0, width, height_px))
+
+    def render_svg(self, text, locale, font, height, bgcolor, fgcolor):
+        # Like Cairo SVG surfaces, the document is sized in points at 72 DPI.
+        size = height / 2
+        lines = self._wrap(text, size, None)
+        line_height = size * (_ASCENT + _DESCENT)
+        width = max(self._get_line_width(line, size) for line in lines)
+        rects = []
+        for i, line in enumerate(lines):
+            top = i * line_height
+            for x, char in line:
+                if char == ' ':
+                    continue
+                advance = self._get_advance(char, size)
+                glyph_top = top + size * (0.2 + ord(char) % 3 * 0.15)
+                rects.append(
+                    f'<rect x="{x + advance * 0.1:.3f}" '
+                    f'y="{glyph_top:.3f}" width="{advance * 0.75:.3f}" '
+                    f'height="{top + size * _ASCENT - glyph_top:.3f}" '
+                    f'fill="{fgcolor}"/>'
+                )
+        return (
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            f'width="{max(width, 1):.3f}pt" '
+            f'height="{line_height * len(lines):.3f}pt">'
+            f'<rect width="100%" height="100%" fill="{bgcolor}"/>'
+            f'{"".join(rects)}</svg>'
+        ).encode()
+
+
+class StubRasterizer(svg_rasterizers.SvgRasterizer):
+    """Deterministic SVG rasterizer.
+
+    Rectangles with explicit positions, as written by `StubRenderer`, are drawn
+    anti-aliased. Any other document, such as a sprite, is drawn as a pattern
+    derived from its content.
+    """
+
+    NAME = 'stub'
+
+    # Supersampling factor for anti-aliasing.
+    _SUPERSAMPLING = 4
+
+    def rasterize(self, svg_data, height_px, bgcolor):
+        width, height = svg_rasterizers.get_svg_size(svg_data)
+        width_px = svg_rasterizers.get_scaled_width(width, height, height_px)
+        scale = height_px / height * self._SUPERSAMPLING
+        image = Image.new(
+            'RGB',
+            (
+                width_px * self._SUPERSAMPLING,
+                height_px * self._SUPERSAMPLING,
+            ),
+            bgcolor,
+        )
+        draw = ImageDraw.Draw(image)
+        rects = [
+            element
+            for element in ET.fromstring(svg_data).iter()
+            if element.tag.endswith('rect') and element.get('x') is not None
+        ]
+        for rect in rects:
+            x, y, w, h = (
+                float(rect.get(key)) * scale
+                for key in ('x', 'y', 'width', 'height')
+            )
+            draw.rectangle([x, y, x + w - 1, y + h - 1], fill=rect.get('fill'))
+        if not rects:
+            self._draw_pattern(draw, svg_data, image.size)
+        return image.resize((width_px, height_px), Image.BOX)
+
+    @classmethod
+    def _draw_pattern(cls, draw, svg_data, size):
+        seed = zlib.crc32(svg_data)
+        width, height = size
+        for i in range(4):
+            value = zlib.crc32(bytes([i]), seed)
+            color = f'#{value & 0xFFFFFF:06x}'
+            inset = (i + 1) * min(width, height) // 10
+            draw.ellipse(
+                [inset, inset, width - inset - 1, height - inset - 1],
+                fill=color,
+            )
+
+
+def _get_stub_font_hash(font):
+    """Replaces `build.get_font_hash()`, which runs fontconfig."""
+    del font  # Unused.
+    return STUB_FONT_HASH
+
+
+def run_scenario(name, jobs, output_dir):
+    """Builds scenario `name` in this process and returns its metrics.
+
+    Since the peak RSS is that of the whole process, each scenario should run
+    in a new process; see `run_scenario_process()`.
+    """
+    board, locales = SCENARIOS[name]
+    if locales:
+        os.environ['LOCALES'] = ' '.join(locales)
+    else:
+        os.environ.pop('LOCALES', None)
+    os.environ.setdefault('PHYSICAL_PRESENCE', 'keyboard')
+    build.get_font_hash = _get_stub_font_hash
+
+    with open(
+        os.path.join(build.SCRIPT_BASE, build.FORMAT_FILE), encoding='utf-8'
+    ) as f:
+        formats = yaml.safe_load(f)
+    board_config = build.load_board_config(
+        os.path.join(build.SCRIPT_BASE, build.BOARDS_CONFIG_FILE), board
+    )
+    converter = build.Converter(
+        board,
+        formats,
+        board_config,
+        output_dir,
+        renderer=StubRenderer(),
+        rasterizer=StubRasterizer(),
+        jobs=jobs,
+    )
+    start = time.perf_counter()
+    converter.build(clean=True)
+    wall_time = time.perf_counter() - start
+    return {
+        METRIC_WALL_TIME: round(wall_time, 3),
+        METRIC_PROBES: sum(converter.search_probes.values()),
+        'searched_images': len(converter.search_probes),
+        'images': len(converter.manifest.outputs),
+        METRIC_BYTES: sum(
+            os.path.getsize(os.path.join(converter.output_dir, output))
+            for output in converter.manifest.outputs
+        ),
+        # ru_maxrss is in KiB on Linux.
+        METRIC_PEAK_RSS: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        METRIC_PEAK_WORKER_RSS: resource.getrusage(
+            resource.RUSAGE_CHILDREN
+        ).ru_maxrss,
+    }
+
+
+def run_scenario_process(name, jobs):
+    """Runs scenario `name` in a new process and returns its metrics."""
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as temp_dir:
+        result_file = os.path.join(temp_dir, 'result.json')
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.abspath(__file__),
+                '--run-scenario',
+                name,
+                '--jobs',
+                str(jobs),
+                '--output',
+                result_file,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            cwd=temp_dir,
+        )
+        with open(result_file, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def run_benchmark(names, jobs, repeat):
+    """Runs scenarios `names`, each `repeat` times.
+
+    Returns:
+        A dict mapping scenario names to their metrics. The wall time and the
+        peak RSS are the minimums of the runs, which are the least noisy.
+    """
+    results = {}
+    for name in names:
+        runs = []
+        for i in range(repeat):
+            print(f'Running {name} ({i + 1}/{repeat})...', flush=True)
+            runs.append(run_scenario_process(name, jobs))
+        result = runs[0]
+        for metric in (
+            METRIC_WALL_TIME,
+            METRIC_PEAK_RSS,
+            METRIC_PEAK_WORKER_RSS,
+        ):
+            result[metric] = min(run[metric] for run in runs)
+        result['jobs'] = jobs
+        results[name] = result
+        print(
+            f'  {result[METRIC_WALL_TIME]:.2f}s, '
+            f'{result[METRIC_PROBES]} probes for '
+            f'{result["searched_images"]} images, '
+            f'{result[METRIC_BYTES]} bytes, '
+            f'peak RSS {result[METRIC_PEAK_RSS]} KiB '
+            f'(workers {result[METRIC_PEAK_WORKER_RSS]} KiB)'
+        )
+    return results
+
+
+def load_baseline(path):
+    """Loads the scenario results of baseline file `path`."""
+    with open(path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError(f'{path}: Unsupported baseline version')
+    return baseline['scenarios']
+
+
+def save_baseline(path, results):
+    """Saves scenario `results` to baseline file `path`."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(
+            {'version': BASELINE_VERSION, 'scenarios': results},
+            f,
+            indent=1,
+            sort_keys=True,
+        )
+        f.write('\n')
+
+
+def compare_results(baseline, results, tolerances):
+    """Compares `results` with `baseline`.
+
+    Args:
+        baseline: A dict mapping scenario names to baseline metrics.
+        results: A dict mapping scenario names to metrics.
+        tolerances: A dict mapping metrics to the factors by which they may
+            grow from the baseline.
+
+    Returns:
+        A list of messages describing the regressions.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        for metric, tolerance in sorted(tolerances.items()):
+            old, new = expected[metric], result[metric]
+            if new > old * tolerance:
+                regressions.append(
+                    f'{name}: {metric} regressed from {old} to {new} '
+                    f'({(new - old) / old if old else 1:+.1%})'
+                )
+    return regressions
+
+
+def main():
+    """Runs the benchmark and compares it with the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--scenarios',
+        help='Comma-separated scenarios to run, from '
+        f'{", ".join(SCENARIOS)} (default: {",".join(DEFAULT_SCENARIOS)})',
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        help='Number of worker processes (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Number of runs of each scenario (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--baseline',
+        default=BASELINE_FILE,
+        help='Baseline file (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--update-baseline',
+        action='store_true',
+        help='Write the results to the baseline file instead of comparing',
+    )
+    parser.add_argument(
+        '--check-resources',
+        action='store_true',
+        help='Also fail if the wall time or the peak RSS regressed, which is '
+        'only meaningful with a baseline recorded on the same host',
+    )
+    parser.add_argument(
+        '--time-tolerance',
+        type=float,
+        default=RESOURCE_TOLERANCES[METRIC_WALL_TIME],
+        help='Factor by which the wall time may grow (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Write the results to FILE as JSON',
+    )
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        with tempfile.TemporaryDirectory(prefix='benchmark_') as output_dir:
+            result = run_scenario(args.run_scenario, args.jobs, output_dir)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    names = args.scenarios.split(',') if args.scenarios else DEFAULT_SCENARIOS
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+    results = run_benchmark(names, args.jobs, args.repeat)
+    if args.output:
+        save_baseline(args.output, results)
+
+    if args.update_baseline:
+        results = dict(
+            (
+                load_baseline(args.baseline)
+                if os.path.exists(args.baseline)
+                else {}
+            ),
+            **results,
+        )
+        save_baseline(args.baseline, results)
+        print(f'Baseline written to {args.baseline}')
+        return
+    if not os.path.exists(args.baseline):
+        print(f'No baseline file {args.baseline}')
+        return
+    baseline = load_baseline(args.baseline)
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            print(f'{name}: Not in baseline')
+        elif baseline[name].get('jobs') != result.get('jobs'):
+            print(
+                f'{name}: Baseline was run with {baseline[name].get("jobs")} '
+                'jobs, the resource usage may differ'
+            )
+    tolerances = dict.fromkeys(COUNTERS, 1)
+    resource_tolerances = dict(
+        RESOURCE_TOLERANCES, **{METRIC_WALL_TIME: args.time_tolerance}
+    )
+    if args.check_resources:
+        tolerances.update(resource_tolerances)
+    else:
+        for regression in compare_results(
+            baseline, results, resource_tolerances
+        ):
+            print(f'{regression} (not checked)')
+    regressions = compare_results(baseline, results, tolerances)
+    for regression in regressions:
+        print(regression)
+    if regressions:
+        sys.exit(f'{len(regressions)} regressions from {args.baseline}')
+    print(f'No regressions from {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Benchmark of compressed archives of the bitmaps of boards.
+
+For each board output directory built by build.py, the archives are built in
+memory with each compression of `archive_images.COMPRESSIONS`, and compared with
+the uncompressed archives written by default. The size of each archive and the
+time to decompress each of its files are reported. Files are decompressed by
+liblzma for LZMA and by `lz4_block` for LZ4, which uses the `lz4` package if
+installed and a pure Python decoder otherwise.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import archive_images
+import lz4_block
+
+
+# Archives stored in RO CBFS, as opposed to `rw_locale_*.bin`.
+RO_ARCHIVE_PREFIXES = ('vbgfx.bin', 'font.bin', 'locale_')
+
+
+def benchmark_archive(files, compression, repeat):
+    """Benchmarks the compressed archive of `files`.
+
+    Args:
+        files: list of files to be archived, in order
+        compression: one of `archive_images.COMPRESSIONS`
+        repeat: number of times each file is decompressed, of which the fastest
+            time is reported
+
+    Returns:
+        A dict of the size of the archive and a dict of the raw size, compressed
+        size, compression and decompression time in microseconds of each file.
+    """
+    contents = []
+    for file in files:
+        with open(file, 'rb') as f:
+            contents.append((os.path.basename(file), f.read()))
+    data = archive_images.build_compressed_archive(contents, compression)
+
+    entries = {}
+    for entry, (_, raw) in zip(
+        archive_images.parse_compressed_archive(data), contents
+    ):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            decompressed = archive_images.read_compressed_entry(data, entry)
+            times.append(time.perf_counter_ns() - start)
+        if decompressed != raw:
+            raise archive_images.ArchiveError(
+                f'Entry {entry.name!r} differs after decompression'
+            )
+        entries[entry.name] = {
+            'raw_size': entry.raw_size,
+            'size': entry.size,
+            'compression': entry.compression,
+            'decode_us': min(times) / 1000,
+        }
+    return {'size': len(data), 'entries': entries}
+
+
+def benchmark_board(output, compressions, repeat):
+    """Benchmarks the archives of a board.
+
+    Args:
+        output: path to the output directory of the board
+        compressions: list of compressions to benchmark
+        repeat: see `benchmark_archive()`
+
+    Returns:
+        A dict mapping archive names to a dict of the size of the uncompressed
+        archive and the results of `benchmark_archive()` by compression.
+    """
+    results = {}
+    for name, files in sorted(archive_images.get_archives(output).items()):
+        files = sorted(files)
+        results[name] = {
+            'raw_size': archive_images.get_archive_size(files),
+            'compressions': {
+                compression: benchmark_archive(files, compression, repeat)
+                for compression in compressions
+            },
+        }
+    return results
+
+
+def _format_row(name, raw_size, size, decode_us, max_decode_us):
+    """Formats a row of the table of `print_board_results()`."""
+    return (
+        f'  {name:<22} {raw_size:>10} {size:>10} {size / raw_size:>6.1%} '
+        f'{decode_us / 1000:>10.2f} {max_decode_us / 1000:>8.2f}'
+    )
+
+
+def print_board_results(board, results, compressions):
+    """Prints the results of `benchmark_board()` of `board` as tables."""
+    for compression in compressions:
+        print(f'{board}: {compression}')
+        print(
+            f'  {"Archive":<22} {"Raw":>10} {"Compressed":>10} {"Ratio":>6} '
+            f'{"Decode ms":>10} {"Max ms":>8}'
+        )
+        totals = {}
+        for name, result in results.items():
+            archive = result['compressions'][compression]
+            times = [
+                entry['decode_us'] for entry in archive['entries'].values()
+            ]
+            row = (result['raw_size'], archive['size'], sum(times), max(times))
+            print(_format_row(name, *row))
+            groups = ['total']
+            if name.startswith(RO_ARCHIVE_PREFIXES):
+                groups.append('total RO')
+            for group in groups:
+                total = totals.setdefault(group, [0, 0, 0, 0])
+                total[0] += row[0]
+                total[1] += row[1]
+                total[2] += row[2]
+                total[3] = max(total[3], row[3])
+        for group in sorted(totals):
+            print(_format_row(f'({group})', *totals[group]))
+
+
+def main():
+    """Runs the benchmark on the given board output directories."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'outputs',
+        nargs='+',
+        metavar='OUTPUT',
+        help='Output directory of a board, e.g. build/asurada',
+    )
+    parser.add_argument(
+        '--compressions',
+        default=','.join(archive_images.COMPRESSIONS),
+        help='Comma-separated compressions to benchmark (default: '
+        '%(default)s)',
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of times each file is decompressed; the fastest time is '
+        'reported (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Write the results, with the sizes and times of each file, to '
+        'FILE as JSON',
+    )
+    args = parser.parse_args()
+
+    compressions = args.compressions.split(',')
+    unknown = set(compressions) - set(archive_images.COMPRESSIONS)
+    if unknown:
+        parser.error(f'Unknown compressions: {", ".join(sorted(unknown))}')
+    if args.repeat < 1:
+        parser.error('--repeat must be positive')
+    for output in args.outputs:
+        if not os.path.isdir(output):
+            parser.error(f'Not a directory: {output}')
+
+    print(f'LZ4 decoder: {lz4_block.DECODER}', file=sys.stderr)
+    results = {}
+    for output in args.outputs:
+        board = os.path.basename(os.path.normpath(output))
+        print(f'Benchmarking {board}...', file=sys.stderr, flush=True)
+        results[board] = benchmark_board(output, compressions, args.repeat)
+        print_board_results(board, results[board], compressions)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(
+                {'lz4_decoder': lz4_block.DECODER, 'boards': results},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Encoder of indexed BMP files for the firmware."""
+
+import collections
+import itertools
+import struct
+
+
+# The firmware reads the number of lines of a text image from the first
+# reserved byte of the BMP file header.
+HEADER_OFFSET_NUM_LINES = 6
+
+# Compression of the pixel data.
+COMPRESSION_NONE = 'none'
+# BI_RLE4 if the palette has at most 16 colors, and BI_RLE8 otherwise. The
+# bitmap is stored uncompressed if RLE does not make it smaller.
+COMPRESSION_RLE = 'rle'
+
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_RLE)
+
+# Values of the compression field of the info header.
+_BI_RGB = 0
+_BI_RLE8 = 1
+_BI_RLE4 = 2
+
+# File header: magic, file size, reserved (number of lines), reserved, offset
+# of pixel data.
+_FILE_HEADER = struct.Struct('<2sIBBHI')
+# BITMAPINFOHEADER: header size, width, height, planes, bits per pixel,
+# compression, size of pixel data, horizontal and vertical resolutions, colors
+# used, important colors.
+_INFO_HEADER = struct.Struct('<IiiHHIIiiII')
+
+# Size of the file header and the info header.
+HEADER_SIZE = _FILE_HEADER.size + _INFO_HEADER.size
+
+BmpHeader = collections.namedtuple(
+    'BmpHeader',
+    [
+        'file_size',
+        'num_lines',
+        'width',
+        'height',
+        'bits',
+        'compression',
+        'image_size',
+        'colors',
+    ],
+)
+
+# 96 DPI, the default resolution of PIL.
+_PIXELS_PER_METER = 3780
+
+# Maximum number of pixels in one RLE run or absolute block.
+_MAX_RUN = 255
+# Minimum number of pixels in an RLE absolute block.
+_MIN_ABSOLUTE = 3
+
+
+class BmpError(Exception):
+    """Exception for errors in encoding or parsing BMP files."""
+
+
+def parse_header(data):
+    """Parses the headers of a BMP file without decoding the pixels.
+
+    Args:
+        data: The first `HEADER_SIZE` or more bytes of the BMP file.
+
+    Returns:
+        A `BmpHeader`. `colors` is the number of palette entries.
+    """
+    if len(data) < HEADER_SIZE:
+        raise BmpError('BMP file too short')
+    magic, file_size, num_lines, _, _, _ = _FILE_HEADER.unpack_from(data)
+    if magic != b'BM':
+        raise BmpError('Not a BMP file')
+    (
+        header_size,
+        width,
+        height,
+        _,
+        bits,
+        compression,
+        image_size,
+        _,
+        _,
+        colors,
+        _,
+    ) = _INFO_HEADER.unpack_from(data, _FILE_HEADER.size)
+    if header_size < _INFO_HEADER.size:
+        raise BmpError(f'Unsupported BMP info header size {header_size}')
+    if not colors and bits <= 8:
+        colors = 1 << bits
+    return BmpHeader(
+        file_size,
+        num_lines,
+        width,
+        height,
+        bits,
+        compression,
+        image_size,
+        colors,
+    )
+
+
+def read_header(path):
+    """Reads the headers of BMP file `path`, see `parse_header()`."""
+    with open(path, 'rb') as f:
+        return parse_header(f.read(HEADER_SIZE))
+
+
+def _get_stride(width, bits):
+    """Gets the size of a row of uncompressed pixels, padded to 4 bytes."""
+    return (width * bits + 31) // 32 * 4
+
+
+def _pack_nibbles(pixels):
+    """Packs 4-bit pixels two per byte, high nibble first."""
+    if len(pixels) % 2:
+        pixels += b'\0'
+    return bytes(hi << 4 | lo for hi, lo in zip(pixels[::2], pixels[1::2]))
+
+
+def _encode_absolute(pixels, bits):
+    """Encodes `pixels` in RLE absolute mode, padded to 2 bytes."""
+    data = pixels if bits == 8 else _pack_nibbles(pixels)
+    return bytes((0, len(pixels))) + data + b'\0' * (len(data) % 2)
+
+
+def _encode_row(row, bits):
+    """Encodes a row of pixels with BI_RLE8 (`bits` = 8) or BI_RLE4 (4)."""
+    output = bytearray()
+    literal = bytearray()
+
+    def flush_literal():
+        start = 0
+        while True:
+            count = min(len(literal) - start, _MAX_RUN)
+            if bits == 4:
+                # Some decoders (e.g. PIL) drop the last pixel of an absolute
+                # block with an odd number of 4-bit pixels.
+                count -= count % 2
+            if count < _MIN_ABSOLUTE:
+                break
+            output.extend(
+                _encode_absolute(bytes(literal[start : start + count]), bits)
+            )
+            start += count
+        # Fewer pixels than an absolute block are stored as runs of one.
+        for value in literal[start:]:
+            output.extend((1, value if bits == 8 else value << 4 | value))
+        literal.clear()
+
+    for value, group in itertools.groupby(row):
+        count = len(list(group))
+        if count == 1:
+            literal.append(value)
+            continue
+        flush_literal()
+        if bits == 4:
+            value = value << 4 | value
+        while count:
+            run = min(count, _MAX_RUN)
+            output.extend((run, value))
+            count -= run
+    flush_literal()
+    return bytes(output)
+
+
+def _encode_rle(image, bits):
+    """Encodes the pixels of `image` with BI_RLE8 or BI_RLE4, bottom-up."""
+    width, height = image.size
+    pixels = image.tobytes()
+    rows = []
+    for y in reversed(range(height)):
+        rows.append(_encode_row(pixels[y * width : (y + 1) * width], bits))
+        # End of line.
+        rows.append(b'\0\0')
+    # Replace the last end of line with end of bitmap.
+    rows[-1] = b'\0\1'
+    return b''.join(rows)
+
+
+def encode_bmp(image, num_lines=1, compression=COMPRESSION_NONE):
+    """Encodes an indexed image into a BMP file.
+
+    Uncompressed bitmaps are identical to those saved by PIL, with the number
+    of lines stored in the file header.
+
+    Args:
+        image: A PIL image in P mode.
+        num_lines: Number of lines of text in the image.
+        compression: One of `COMPRESSIONS`.
+
+    Returns:
+        The BMP file as bytes.
+    """
+    if image.mode != 'P':
+        raise BmpError(f'Image with {image.mode} mode is not supported')
+    if compression not in COMPRESSIONS:
+        raise BmpError(f'Unknown BMP compression {compression!r}')
+    if not 0 <= num_lines <= 0xFF:
+        raise BmpError(f'Invalid number of lines {num_lines}')
+    width, height = image.size
+    palette = image.getpalette('RGB')
+    colors = len(palette) // 3
+    palette_data = b''.join(
+        bytes((b, g, r, 0))
+        for r, g, b in zip(palette[::3], palette[1::3], palette[2::3])
+    )
+
+    bits = 8
+    method = _BI_RGB
+    stride = _get_stride(width, bits)
+    pixel_data = image.tobytes('raw', 'P', stride, -1)
+    if compression == COMPRESSION_RLE:
+        rle_bits = 4 if colors <= 16 else 8
+        rle_data = _encode_rle(image, rle_bits)
+        if len(rle_data) < len(pixel_data):
+            bits = rle_bits
+            method = _BI_RLE4 if rle_bits == 4 else _BI_RLE8
+            pixel_data = rle_data
+
+    offset = _FILE_HEADER.size + _INFO_HEADER.size + len(palette_data)
+    return b''.join(
+        (
+            _FILE_HEADER.pack(
+                b'BM', offset + len(pixel_data), num_lines, 0, 0, offset
+            ),
+            _INFO_HEADER.pack(
+                _INFO_HEADER.size,
+                width,
+                height,
+                1,
+                bits,
+                method,
+                len(pixel_data),
+                _PIXELS_PER_METER,
+                _PIXELS_PER_METER,
+                colors,
+                colors,
+            ),
+            palette_data,
+            pixel_data,
+        )
+    )
@@ -9,28 +9,57 @@ import argparse
 from collections import Counter
 from collections import defaultdict
 from collections import namedtuple
-from concurrent.futures import ProcessPoolExecutor
+from concurrent import futures
+import contextlib
 import copy
+import functools
 import glob
+import io
 import json
+import mmap
 import os
+import pickle
 import re
 import shutil
+import signal
+import socket
 import subprocess
 import sys
+import tempfile
 
 from PIL import Image
+from PIL import ImageChops
+from PIL import ImageColor
+from PIL import ImageStat
 import yaml
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import archive_images
+import bmp
+import build_manifest
+import render_cache
+import renderers
+import search
+import shards
+import size_report
+import string_compiler
+import svg_rasterizers
+import task_graph
+import tracing
+
 
 SCRIPT_BASE = os.path.dirname(os.path.abspath(__file__))
 
 STRINGS_GRD_FILE = 'firmware_strings.grd'
-STRINGS_JSON_FILE_TMPL = '%s.json'
 FORMAT_FILE = 'format.yaml'
 BOARDS_CONFIG_FILE = 'boards.yaml'
 
 OUTPUT_DIR = os.getenv('OUTPUT', os.path.join(SCRIPT_BASE, 'build'))
+CACHE_DIR_NAME = '.cache'
 
 ONE_LINE_DIR = 'one_line'
 SVG_FILES = '*.svg'
@@ -59,7 +88,17 @@ KEY_RTL = 'rtl'
 KEY_RW_OVERRIDE = 'rw_override'
 KEY_SPLIT_RATIO = 'split_ratio'
 
-BMP_HEADER_OFFSET_NUM_LINES = 6
+
+# Printable ASCII characters, built as glyphs.
+GLYPH_CODES = range(ord(' '), ord('~') + 1)
+# Maximum mean absolute difference (out of 255) per glyph between the glyphs
+# sliced from the glyph atlas and those rendered one by one.
+GLYPH_ATLAS_TOLERANCE = 8
+
+# Quantizer of text images. Texts are blends of their background and foreground
+# colors, so with NumPy they are quantized to a fixed gradient between the two.
+# Otherwise, PIL's adaptive palette is used.
+TEXT_QUANTIZER = 'adaptive' if np is None else 'gradient'
 
 # Regular expressions used to eliminate spurious spaces and newlines in
 # translation strings.
@@ -68,8 +107,48 @@ NEWLINE_REPLACEMENT = r'\1 \2'
 CRLF_PATTERN = re.compile(r'\r\n')
 MULTIBLANK_PATTERN = re.compile(r'   *')
 
+# Languages whose region subtag selects other forms of the same characters,
+# such as the simplified and traditional Han characters of Chinese. Identical
+# strings of their locales are only shared within the same region.
+REGION_SHAPING_LANGUAGES = frozenset(['zh'])
+# Number of locale pairs listed in the summary of shared strings.
+NUM_SHARED_LOCALE_PAIRS = 5
+
+# Environment variables passed by clients to the build server, which set the
+# locales and the rename map of the builds.
+SERVER_ENV_VARS = ('LOCALES', 'PHYSICAL_PRESENCE', 'DETACHABLE')
+# Keyword arguments of `Converter` passed by clients to the build server. The
+# backend options (see `add_backend_arguments()`) are those of the server.
+SERVER_BUILD_OPTIONS = (
+    'search_mode',
+    'glyph_atlas',
+    'check_glyph_atlas',
+    'debug_stage',
+    'bmp_compression',
+)
+# Default path of the Unix socket of the build server.
+DEFAULT_SERVER_SOCKET = os.path.join(
+    tempfile.gettempdir(), f'bmpblk-build-{os.getuid()}.sock'
+)
+# Command of build.py running the build server.
+SERVE_COMMAND = 'serve'
+# Command of build.py merging the outputs of shards.
+MERGE_SHARDS_COMMAND = 'merge-shards'
+
+# Estimated cost of a work item of a shard build (see `shards.ShardPlanner`),
+# in units of a character of its text. Strings are searched over several
+# renders, which take longer for longer strings, while sprites and glyphs are
+# rasterized once.
+SHARD_ITEM_COST = 10
+
 LocaleInfo = namedtuple('LocaleInfo', ['code', 'rtl'])
 
+# A bitmap to verify.
+#   path: Path of the bitmap.
+#   max_colors: Maximum number of palette entries.
+#   style: The style of a text bitmap, or None for sprites and glyphs.
+BitmapSpec = namedtuple('BitmapSpec', ['path', 'max_colors', 'style'])
+
 
 class BuildImageError(Exception):
     """Exception for all errors generated during build image process."""
@@ -89,6 +168,28 @@ def get_config_with_defaults(configs, key):
     return config
 
 
+# Parsed YAML files by path, as tuples (modification time, content).
+_yaml_cache = {}
+
+
+def load_yaml(filename):
+    """Loads YAML file `filename`.
+
+    The parsed file is cached until the file is modified, so that the build
+    server parses the config files only once.
+
+    Returns:
+        A copy of the content, which may be modified.
+    """
+    mtime = os.stat(filename).st_mtime_ns
+    cached = _yaml_cache.get(filename)
+    if not cached or cached[0] != mtime:
+        with open(filename, 'rb') as file:
+            cached = (mtime, yaml.safe_load(file))
+        _yaml_cache[filename] = cached
+    return copy.deepcopy(cached[1])
+
+
 def load_board_config(filename, board):
     """Loads the configuration of `board` from `filename`.
 
@@ -99,10 +200,9 @@ def load_board_config(filename, board):
     Returns:
         A dictionary mapping each board name to its config.
     """
-    with open(filename, 'rb') as file:
-        raw = yaml.safe_load(file)
+    raw = load_yaml(filename)
 
-    config = copy.deepcopy(raw[KEY_DEFAULT])
+    config = raw[KEY_DEFAULT]
     for boards, params in raw.items():
         if boards == KEY_DEFAULT:
             continue
@@ -117,6 +217,112 @@ def load_board_config(filename, board):
     return config
 
 
+def load_board_names(filename):
+    """Loads the names of all boards from `filename`.
+
+    Args:
+        filename: File name of a YAML config file.
+
+    Returns:
+        A list of board names, in the order they appear in the file.
+    """
+    raw = load_yaml(filename)
+
+    names = []
+    for boards in raw:
+        if boards == KEY_DEFAULT:
+            continue
+        names.extend(boards.split(','))
+    return names
+
+
+def group_boards(filename, boards):
+    """Groups `boards` into classes of equivalent configs.
+
+    Boards in the same class have identical effective configs (screen, dpi,
+    sdcard, locales, rtl, etc.), and hence identical bitmaps.
+
+    Args:
+        filename: File name of a YAML config file.
+        boards: List of board names.
+
+    Returns:
+        A list of (config, board_names) tuples, in the order of first
+        appearance in `boards`.
+    """
+    groups = {}
+    for board in boards:
+        config = load_board_config(filename, board)
+        key = json.dumps(config, sort_keys=True)
+        groups.setdefault(key, (config, []))
+        if board not in groups[key][1]:
+            groups[key][1].append(board)
+    return list(groups.values())
+
+
+def _link_or_copy(src, dst):
+    """Hardlinks `src` to `dst`, falling back to copying."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _copy_output_file(src, dst):
+    """Copies an output file, hardlinking the bitmaps when possible.
+
+    Bitmaps are never modified in place (see `_replace_file()`), so they can
+    be shared by the outputs of several boards. Other files, such as the locale
+    list, the manifest and the size report, are copied.
+    """
+    if src.endswith('.bmp'):
+        _link_or_copy(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def copy_board_output(src_dir, dst_dir):
+    """Replaces `dst_dir` with a copy of board output directory `src_dir`.
+
+    Bitmaps are hardlinked when possible.
+    """
+    if os.path.exists(dst_dir):
+        shutil.rmtree(dst_dir)
+    shutil.copytree(src_dir, dst_dir, copy_function=_copy_output_file)
+
+
+def _replace_file(path, data):
+    """Writes `data` to `path` atomically.
+
+    The data is written to a new file, which replaces `path`, so that other
+    hardlinks of `path`, e.g. in the outputs of other boards, are unchanged.
+    """
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_bmp_header(path):
+    """Reads the headers of BMP file `path` from a memory map of the file.
+
+    Returns:
+        A tuple of the `bmp.BmpHeader` and the size of the file.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < bmp.HEADER_SIZE:
+            raise bmp.BmpError('BMP file too short')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return bmp.parse_header(data), size
+
+
 def check_fonts(fonts):
     """Checks if all fonts are available."""
     for locale, font in fonts.items():
@@ -126,68 +332,28 @@ def check_fonts(fonts):
             )
 
 
-def run_pango_view(
-    input_file,
-    output_file,
-    locale,
-    font,
-    height,
-    width_pt,
-    dpi,
-    bgcolor,
-    fgcolor,
-    hinting='full',
-):
-    """Runs pango-view."""
-    command = ['pango-view', '-q']
-    if locale:
-        command += ['--language', locale]
-
-    # Font size should be proportional to the height. Here we use 2 as the
-    # divisor so that setting dpi to 96 (pango-view's default) in boards.yaml
-    # will be roughly equivalent to setting the screen resolution to 1366x768.
-    font_size = height / 2
-    font_spec = f'{font} {font_size!r}'
-    command += ['--font', font_spec]
-
-    if width_pt:
-        command.append(f'--width={width_pt:d}')
-    if dpi:
-        command.append(f'--dpi={dpi:d}')
-    command.append('--margin=0')
-    command += ['--background', bgcolor]
-    command += ['--foreground', fgcolor]
-    command += ['--hinting', hinting]
-
-    command += ['--output', output_file]
-    command.append(input_file)
-
-    subprocess.check_call(command, stdout=subprocess.PIPE)
-
-
-def parse_locale_json_file(locale, json_dir):
-    """Parses given firmware string json file.
+@functools.lru_cache(maxsize=None)
+def get_font_hash(font):
+    """Gets the hash of the font file fontconfig selects for `font`."""
+    font_file = subprocess.run(
+        ['fc-match', '-f', '%{file}', font],
+        check=True,
+        stdout=subprocess.PIPE,
+        encoding='utf-8',
+    ).stdout
+    if not font_file or not os.path.exists(font_file):
+        raise BuildImageError(f'Font file not found for {font!r}')
+    return render_cache.hash_file(font_file)
 
-    Args:
-        locale: The name of the locale, e.g. "da" or "pt-BR".
-        json_dir: Directory containing json output from grit.
 
-    Returns:
-        A dictionary for mapping of "name to content" for files to be generated.
-    """
-    result = {}
-    filename = os.path.join(json_dir, STRINGS_JSON_FILE_TMPL % locale)
-    with open(filename, encoding='utf-8-sig') as input_file:
-        for tag, msgdict in json.load(input_file).items():
-            msgtext = msgdict['message']
-            msgtext = re.sub(CRLF_PATTERN, '\n', msgtext)
-            msgtext = re.sub(NEWLINE_PATTERN, NEWLINE_REPLACEMENT, msgtext)
-            msgtext = re.sub(MULTIBLANK_PATTERN, ' ', msgtext)
-            # Strip any trailing whitespace.  A trailing newline appears to make
-            # Pango report a larger layout size than what's actually visible.
-            msgtext = msgtext.strip()
-            result[tag] = msgtext
-    return result
+def normalize_string(msgtext):
+    """Eliminates spurious spaces and newlines in a translation string."""
+    msgtext = re.sub(CRLF_PATTERN, '\n', msgtext)
+    msgtext = re.sub(NEWLINE_PATTERN, NEWLINE_REPLACEMENT, msgtext)
+    msgtext = re.sub(MULTIBLANK_PATTERN, ' ', msgtext)
+    # Strip any trailing whitespace.  A trailing newline appears to make
+    # Pango report a larger layout size than what's actually visible.
+    return msgtext.strip()
 
 
 class Converter:
@@ -209,7 +375,26 @@ class Converter:
     SPRITE_MAX_COLORS = 128
     GLYPH_MAX_COLORS = 7
 
-    def __init__(self, board, formats, board_config, output):
+    def __init__(
+        self,
+        board,
+        formats,
+        board_config,
+        output,
+        renderer=None,
+        rasterizer=None,
+        cache=None,
+        search_mode=search.BISECT,
+        sprite_store=None,
+        glyph_atlas=False,
+        check_glyph_atlas=False,
+        debug_stage=False,
+        bmp_compression=bmp.COMPRESSION_NONE,
+        jobs=None,
+        executor=None,
+        progress=None,
+        shard=None,
+    ):
         """Inits converter.
 
         Args:
@@ -217,16 +402,74 @@ class Converter:
             formats: A dictionary of string formats.
             board_config: A dictionary of board configurations.
             output: Output directory.
+            renderer: A `renderers.TextRenderer` object. If None, the default
+                renderer will be used.
+            rasterizer: A `svg_rasterizers.SvgRasterizer` object. If None, the
+                default rasterizer will be used.
+            cache: A `render_cache.RenderCache` object for reusing rendered
+                bitmaps, or None to disable caching.
+            search_mode: Mode of the DPI searches, one of `search.MODES`. The
+                width searches always bisect.
+            sprite_store: A dict mapping sprite keys to finished sprite bitmaps,
+                shared by the converters of several boards for reusing the
+                sprites, or None to only reuse sprites within this board.
+            glyph_atlas: If True, render all glyphs at once into an atlas and
+                slice it into glyph bitmaps, instead of rendering each glyph.
+            check_glyph_atlas: If True, check the glyphs sliced from the atlas
+                against those rendered one by one.
+            debug_stage: If True, store intermediate files of rendering in the
+                stage directory for debugging.
+            bmp_compression: Compression of the bitmaps, one of
+                `bmp.COMPRESSIONS`.
+            jobs: Number of worker processes, or None for the number of CPUs.
+            executor: A pool of `jobs` long-running worker processes created by
+                `create_worker_pool()` to build on, or None to start new worker
+                processes for each build.
+            progress: A function called with the number of finished tasks and
+                the number of all tasks of a build whenever a task finishes, or
+                None.
+            shard: A tuple (K, N) to build only shard K of N shards of the work
+                items, see `shards.ShardPlanner`, or None to build everything.
         """
         self.board = board
         self.formats = formats
         self.config = board_config
+        self.renderer = renderer or renderers.get_renderer()
+        self.rasterizer = rasterizer or svg_rasterizers.get_rasterizer()
+        self.cache = cache
+        self.search = search_mode
+        # Number of renders by the searches for each output image.
+        self.search_probes = {}
+        self.sprite_store = {} if sprite_store is None else sprite_store
+        self.num_reused_sprites = 0
+        self.glyph_atlas = glyph_atlas
+        self.check_glyph_atlas = check_glyph_atlas
+        self.debug_stage = debug_stage
+        self.bmp_compression = bmp_compression
+        self.jobs = jobs
+        self.executor = executor
+        self.progress = progress
+        # Path of the pickled converter loaded by the workers of `executor`.
+        self.worker_state_file = None
+        self.shard = shard
+        self.shard_planner = None
         self.set_dirs(output)
+        self.string_compiler = string_compiler.StringCompiler(
+            os.path.join(self.locale_dir, STRINGS_GRD_FILE)
+        )
+        self.manifest = None
         self.set_screen()
         self.set_rename_map()
         self.set_locales()
         self.text_max_colors = self.get_text_colors(self.config[KEY_DPI])
 
+    def __getstate__(self):
+        # The worker pool and the progress callback stay in the main process.
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['progress'] = None
+        return state
+
     def set_dirs(self, output):
         """Sets board output directory and stage directory.
 
@@ -240,10 +483,6 @@ class Converter:
         self.output_ro_dir = os.path.join(self.output_dir, 'locale', 'ro')
         self.output_rw_dir = os.path.join(self.output_dir, 'locale', 'rw')
         self.stage_dir = os.path.join(output, '.stage')
-        self.stage_grit_dir = os.path.join(self.stage_dir, 'grit')
-        self.stage_locale_dir = os.path.join(self.stage_dir, 'locale')
-        self.stage_glyph_dir = os.path.join(self.stage_dir, 'glyph')
-        self.stage_sprite_dir = os.path.join(self.stage_dir, 'sprite')
 
     def set_screen(self):
         """Sets screen width and height."""
@@ -383,88 +622,118 @@ class Converter:
         """Converts the relative coordinate to absolute one in pixels."""
         return int(self.canvas_px * length / self.SCALE_BASE) * num_lines
 
-    def _get_runtime_width_px(self, height, num_lines, file):
-        """Gets the width in pixels `file` will be rendered at runtime."""
+    def _get_runtime_width_px(self, height, num_lines, size):
+        """Gets the width in pixels an image of `size` will be rendered at
+        runtime."""
         # This is different from _to_px(height, num_lines)
         height_px = self._to_px(height * num_lines)
-        with Image.open(file) as image:
-            return height_px * image.size[0] // image.size[1]
+        return height_px * size[0] // size[1]
 
     @classmethod
-    def _get_png_height(cls, png_file):
-        # With small DPI, pango-view may generate an empty file
-        if os.path.getsize(png_file) == 0:
-            return 0
-        with Image.open(png_file) as image:
-            return image.size[1]
-
-    def get_num_lines(self, file, one_line_dir):
-        """Gets the number of lines of text in `file`."""
-        name, _ = os.path.splitext(os.path.basename(file))
-        png_name = name + '.png'
-        multi_line_file = os.path.join(os.path.dirname(file), png_name)
-        one_line_file = os.path.join(one_line_dir, png_name)
-        # The number of lines is determined by comparing the height of
-        # `multi_line_file` with `one_line_file`, where the latter is generated
-        # without the '--width' option passed to pango-view.
-        height = self._get_png_height(multi_line_file)
-        line_height = self._get_png_height(one_line_file)
+    def get_num_lines(cls, image, one_line_image):
+        """Gets the number of lines of text in `image`.
+
+        The number of lines is determined by comparing the height of `image`
+        with `one_line_image`, where the latter is rendered without line
+        wrapping. With small DPI, the renderer may render nothing, in which case
+        the image is None.
+        """
+        height = image.size[1] if image else 0
+        line_height = one_line_image.size[1] if one_line_image else 0
         return int(round(height / line_height))
 
-    def convert_svg_to_png(
-        self, svg_file, png_file, height, bgcolor, num_lines=1
-    ):
-        """Converts SVG to PNG file."""
-        # If the width/height of the SVG file is specified in points, the
-        # rsvg-convert command with default 90DPI will potentially cause the
-        # pixels at the right/bottom border of the output image to be
-        # transparent (or filled with the specified background color).  This
-        # seems like an rsvg-convert issue regarding image scaling.  Therefore,
-        # use 72DPI here to avoid the scaling.
-        command = [
-            'rsvg-convert',
-            '--background-color',
-            f"'{bgcolor}'",
-            '--dpi-x',
-            '72',
-            '--dpi-y',
-            '72',
-            '-o',
-            png_file,
-        ]
+    def _get_svg_height_px(self, name, height, num_lines=1):
         height_px = self._to_px(height, num_lines)
         if height_px <= 0:
-            raise BuildImageError(
-                f'Height of {os.path.basename(svg_file)!r} '
-                f'<= 0 ({height_px:d}px)'
-            )
-        command.extend(['--height', f'{height_px:d}'])
-        command.append(svg_file)
-        subprocess.check_call(' '.join(command), shell=True)
-
-    def convert_png_to_bmp(self, png_file, bmp_file, max_colors, num_lines=1):
-        """Converts PNG to BMP file."""
-        image = Image.open(png_file)
+            raise BuildImageError(f'Height of {name!r} <= 0 ({height_px:d}px)')
+        return height_px
+
+    def rasterize_svg(self, svg_data, name, height, bgcolor, num_lines=1):
+        """Rasterizes SVG document `svg_data` into an in-memory image."""
+        height_px = self._get_svg_height_px(name, height, num_lines)
+        with tracing.span(
+            'rasterize', 'rasterize', rasterizer=self.rasterizer.NAME
+        ):
+            return self.rasterizer.rasterize(svg_data, height_px, bgcolor)
 
+    @classmethod
+    def _convert_to_rgb(cls, image):
+        """Converts `image` to RGB mode, rejecting transparent images."""
         # Process alpha channel and transparency.
         if image.mode == 'RGBA':
-            raise BuildImageError('PNG with RGBA mode is not supported')
+            raise BuildImageError('Image with RGBA mode is not supported')
         if image.mode == 'P' and 'transparency' in image.info:
-            raise BuildImageError('PNG with RGBA palette is not supported')
+            raise BuildImageError('Image with RGBA palette is not supported')
         if image.mode != 'RGB':
             image = image.convert('RGB')
+        return image
 
-        # Export and downsample color space.
-        image.convert(
+    @classmethod
+    def _quantize_image(cls, image, max_colors):
+        """Downsamples the color space of `image` to `max_colors`."""
+        return cls._convert_to_rgb(image).convert(
             'P', dither=None, colors=max_colors, palette=Image.ADAPTIVE
-        ).save(bmp_file)
+        )
+
+    @classmethod
+    def _quantize_text_image(cls, image, max_colors, bgcolor, fgcolor):
+        """Quantizes text `image` to a gradient from `bgcolor` to `fgcolor`.
+
+        Each pixel is projected onto the line from `bgcolor` to `fgcolor` in
+        the RGB space, and snapped to the nearest of `max_colors` evenly spaced
+        colors on the line. Hence all the texts with the same colors share the
+        same palette. Falls back to `_quantize_image()` without NumPy.
+        """
+        if np is None or max_colors < 2:
+            return cls._quantize_image(image, max_colors)
+        image = cls._convert_to_rgb(image)
+        bg = np.array(ImageColor.getrgb(bgcolor), dtype=np.float64)
+        fg = np.array(ImageColor.getrgb(fgcolor), dtype=np.float64)
+        direction = fg - bg
+        norm = direction @ direction
+        pixels = np.asarray(image)
+        if norm:
+            # Index of the nearest palette color, i.e. the rounded projection
+            # (pixel - bg) . direction / norm * (max_colors - 1).
+            weights = direction * ((max_colors - 1) / norm)
+            steps = pixels @ weights + (0.5 - bg @ weights)
+            indices = np.clip(np.floor(steps), 0, max_colors - 1)
+        else:
+            indices = np.zeros(pixels.shape[:2])
+        palette = np.outer(np.linspace(0, 1, max_colors), direction) + bg
+        result = Image.frombytes(
+            'P', image.size, indices.astype(np.uint8).tobytes()
+        )
+        result.putpalette(np.floor(palette + 0.5).astype(np.uint8).tobytes())
+        return result
 
-        with open(bmp_file, 'rb+') as f:
-            f.seek(BMP_HEADER_OFFSET_NUM_LINES)
-            f.write(bytearray([num_lines]))
+    def convert_image_to_bmp(
+        self, image, bmp_file, max_colors, num_lines=1, text_colors=None
+    ):
+        """Converts in-memory image `image` to BMP file.
+
+        Args:
+            image: The image to convert.
+            bmp_file: Path of output BMP file.
+            max_colors: Maximum colors of the bitmap.
+            num_lines: Number of lines of text in the image.
+            text_colors: A tuple (`bgcolor`, `fgcolor`) if `image` is a text
+                rendered with these colors, which is quantized by
+                `_quantize_text_image()`.
+        """
+        with tracing.span('quantize', 'quantize', quantizer=TEXT_QUANTIZER):
+            if text_colors:
+                image = self._quantize_text_image(
+                    image, max_colors, *text_colors
+                )
+            else:
+                image = self._quantize_image(image, max_colors)
+        with tracing.span('encode', 'encode', compression=self.bmp_compression):
+            data = bmp.encode_bmp(image, num_lines, self.bmp_compression)
+        _replace_file(bmp_file, data)
 
     @classmethod
-    def _bisect_dpi(cls, max_dpi, initial_dpi, max_height_px, get_height):
+    def _bisect_dpi(cls, max_dpi, initial_dpi, max_height_px, prober):
         """Bisects to find the DPI that produces image height `max_height_px`.
 
         Args:
@@ -472,8 +741,8 @@ class Converter:
             initial_dpi: Initial DPI to try with in binary search.
                 If specified, the value must be no larger than `max_dpi`.
             max_height_px: Maximum (target) height to search for.
-            get_height: A function converting DPI to height. The function is
-                called once before returning.
+            prober: A `search.Prober` converting DPI to height. The returned
+                DPI is the last one probed.
 
         Returns:
             The best integer DPI within [1, `max_dpi`].
@@ -481,7 +750,7 @@ class Converter:
         min_dpi = 1
         first_iter = True
 
-        min_height_px = get_height(min_dpi)
+        min_height_px = prober.get(min_dpi)
         if min_height_px > max_height_px:
             # For some font such as "Noto Sans CJK SC", the generated height
             # cannot go below a certain value. In this case, find max DPI with
@@ -491,205 +760,375 @@ class Converter:
                     mid_dpi = initial_dpi
                 else:
                     mid_dpi = (min_dpi + max_dpi + 1) // 2
-                height_px = get_height(mid_dpi)
-                if height_px > min_height_px:
+                if prober.compare(mid_dpi, min_height_px) > 0:
                     max_dpi = mid_dpi - 1
                 else:
                     min_dpi = mid_dpi
                 first_iter = False
-            get_height(max_dpi)
+            prober.finalize(max_dpi)
             return max_dpi
 
-        # Find min DPI with height_px == max_height_px
+        # Find min DPI with height_px == max_height_px. Like in
+        # `_bisect_width()`, the steps from `initial_dpi` grow exponentially
+        # until the height crosses `max_height_px`.
+        mid_dpi = initial_dpi or (min_dpi + max_dpi) // 2
+        # Direction of the steps from `initial_dpi`, or 0 when bisecting.
+        direction = None if initial_dpi else 0
+        step = 1
         while min_dpi < max_dpi:
-            if first_iter and initial_dpi:
-                mid_dpi = initial_dpi
-            else:
-                mid_dpi = (min_dpi + max_dpi) // 2
-            height_px = get_height(mid_dpi)
-            if height_px == max_height_px:
+            result = prober.compare(mid_dpi, max_height_px)
+            if result == 0:
+                prober.finalize(mid_dpi)
                 return mid_dpi
-            if height_px < max_height_px:
+            if result < 0:
                 min_dpi = mid_dpi + 1
             else:
                 max_dpi = mid_dpi
-            first_iter = False
-        get_height(min_dpi)
+            if direction in (None, result):
+                direction = result
+                mid_dpi = min(
+                    max(mid_dpi - result * step, min_dpi), max_dpi - 1
+                )
+                step *= 2
+            else:
+                direction = 0
+                mid_dpi = (min_dpi + max_dpi) // 2
+        prober.finalize(min_dpi)
         return min_dpi
 
     @classmethod
-    def _bisect_width(cls, initial_width_pt, max_width_px, get_width_px):
+    def _bisect_width(cls, initial_width_pt, max_width_px, prober):
         """Bisects to find the width that produces image width `max_width_px`.
 
         Args:
             initial_width_pt: Initial width_pt to try with in binary search.
             max_width_px: Maximum (target) width to search for.
-            get_width_px: A function converting width_pt to width_px. The
-                function is called once before returning.
+            prober: A `search.Prober` converting width_pt to width_px. The
+                returned width_pt is the last one probed.
 
         Returns:
             The best integer width_pt.
         """
-        min_width_pt = 1
+        # Widen the range around the initial value exponentially until it is
+        # bounded on both sides, so that a good initial value needs few steps.
+        min_width_pt = max_width_pt = None
         width_pt = initial_width_pt
-        width_px = get_width_px(width_pt)
-        while width_px < max_width_px:
-            min_width_pt = width_pt
-            width_pt *= 2
-            width_px = get_width_px(width_pt)
-        if width_px == max_width_px:
-            return width_pt
-
-        max_width_pt = width_pt
+        step = 1
+        while min_width_pt is None or max_width_pt is None:
+            result = prober.compare(width_pt, max_width_px)
+            if result == 0:
+                prober.finalize(width_pt)
+                return width_pt
+            if result < 0:
+                min_width_pt = width_pt
+                width_pt += step
+            else:
+                max_width_pt = max(width_pt - 1, 1)
+                if width_pt == 1:
+                    min_width_pt = 1
+                width_pt = max(width_pt - step, 1)
+            step *= 2
+
         # Find maximum width_pt with get_width_px(width_pt) <= max_width_px
         while min_width_pt < max_width_pt:
             width_pt = (min_width_pt + max_width_pt + 1) // 2
-            width_px = get_width_px(width_pt)
-            if width_px > max_width_px:
+            if prober.compare(width_pt, max_width_px) > 0:
                 max_width_pt = width_pt - 1
             else:
                 min_width_pt = width_pt
-        get_width_px(max_width_pt)
+        prober.finalize(max_width_pt)
         return max_width_pt
 
     def convert_text_to_image(
         self,
         locale,
-        input_file,
+        text,
         output_file,
         font,
-        stage_dir,
         max_colors,
         height=None,
         max_width=None,
-        initial_width_pt=None,
         dpi=None,
-        initial_dpi=None,
         bgcolor='#000000',
         fgcolor='#ffffff',
         use_svg=False,
+        stage_dir=None,
     ):
-        """Converts text file `input_file` into image file.
+        """Converts `text` into image file.
 
-        Because pango-view does not support assigning output format options for
-        bitmap, we must create images in SVG/PNG format and then post-process
-        them (e.g. convert into BMP by ImageMagick).
+        The text is rendered by `self.renderer` into an in-memory image, and
+        then post-processed (e.g. converted into BMP). Only the output image
+        file is written.
 
         Args:
             locale: Locale (language) to select implicit rendering options. None
                 for locale-independent strings.
-            input_file: Path of input text file.
+            text: The text to render.
             output_file: Path of output image file.
             font: Font name.
-            stage_dir: Directory to store intermediate file(s).
             max_colors: Maximum colors to convert to bitmap.
             height: Image height relative to the screen resolution.
             max_width: Maximum image width relative to the screen resolution.
-            initial_width_pt: Initial width_pt to try with in binary search.
-            dpi: DPI value passed to pango-view.
-            initial_dpi: Initial DPI to try with in binary search.
+            dpi: DPI value passed to the renderer.
             bgcolor: Background color (#rrggbb).
             fgcolor: Foreground color (#rrggbb).
-            use_svg: If set to True, generate SVG file. Otherwise, generate PNG
-                file.
+            use_svg: If set to True, render SVG and rasterize it. Otherwise,
+                render the image directly.
+            stage_dir: Directory to store intermediate files for debugging, or
+                None to not store them.
 
         Returns:
             A tuple (`eff_dpi`, `width_pt`) of effective DPI and the width
-            passed to pango-view. Both `eff_dpi` and `width_pt` might be `None`
-            when not applicable.
+            passed to the renderer. Both `eff_dpi` and `width_pt` might be
+            `None` when not applicable.
         """
-        one_line_dir = os.path.join(stage_dir, ONE_LINE_DIR)
-        os.makedirs(one_line_dir, exist_ok=True)
-
-        name, _ = os.path.splitext(os.path.basename(input_file))
-        svg_file = os.path.join(stage_dir, name + '.svg')
-        png_file = os.path.join(stage_dir, name + '.png')
-        png_file_one_line = os.path.join(one_line_dir, name + '.png')
-
-        def get_one_line_png_height(dpi):
-            """Generates a one-line PNG with `dpi` and returns its height."""
-            run_pango_view(
-                input_file,
-                png_file_one_line,
-                locale,
-                font,
-                height,
-                0,
-                dpi,
-                bgcolor,
-                fgcolor,
+        name, _ = os.path.splitext(os.path.basename(output_file))
+
+        cache_key = None
+        if self.cache:
+            # The searches start from values derived from these parameters
+            # only, so they determine the result. Changes to the searches must
+            # bump `render_cache.CACHE_VERSION`.
+            cache_key = self.cache.make_key(
+                text=text,
+                locale=locale,
+                font=font,
+                font_hash=get_font_hash(font),
+                canvas_px=self.canvas_px,
+                height=height,
+                max_width=max_width,
+                dpi=dpi,
+                bgcolor=bgcolor,
+                fgcolor=fgcolor,
+                max_colors=max_colors,
+                quantizer=TEXT_QUANTIZER,
+                hinting='none' if use_svg else 'full',
+                renderer=self.renderer.NAME,
+                rasterizer=self.rasterizer.NAME if use_svg else None,
+                search=None if use_svg else self.search,
+                bmp_compression=self.bmp_compression,
             )
-            return self._get_png_height(png_file_one_line)
+            metadata = self.cache.get(cache_key, output_file)
+            if metadata is not None:
+                return metadata['eff_dpi'], metadata['width_pt']
+
+        # Probers of the DPI and width searches.
+        probers = []
+
+        def done(eff_dpi, width_pt):
+            """Adds `output_file` to the cache and returns the results."""
+            if probers:
+                output = os.path.relpath(output_file, self.output_dir)
+                self.search_probes[output] = sum(
+                    prober.num_probes for prober in probers
+                )
+            if cache_key:
+                self.cache.put(
+                    cache_key,
+                    output_file,
+                    {'eff_dpi': eff_dpi, 'width_pt': width_pt},
+                )
+            return eff_dpi, width_pt
+
+        if stage_dir:
+            os.makedirs(stage_dir, exist_ok=True)
+            with open(
+                os.path.join(stage_dir, name + '.txt'), 'w', encoding='utf-8'
+            ) as f:
+                f.write(text + '\n')
 
         if use_svg:
-            run_pango_view(
-                input_file,
-                svg_file,
-                locale,
-                font,
-                height,
-                0,
-                dpi,
-                bgcolor,
-                fgcolor,
-                hinting='none',
+            with tracing.span('render_svg', 'render', font=font):
+                svg_data = self.renderer.render_svg(
+                    text, locale, font, height, bgcolor, fgcolor
+                )
+            if stage_dir:
+                with open(os.path.join(stage_dir, name + '.svg'), 'wb') as f:
+                    f.write(svg_data)
+            image = self.rasterize_svg(svg_data, name, height, bgcolor)
+            self.convert_image_to_bmp(
+                image, output_file, max_colors, text_colors=(bgcolor, fgcolor)
             )
-            self.convert_svg_to_png(svg_file, png_file, height, bgcolor)
-            self.convert_png_to_bmp(png_file, output_file, max_colors)
-            return None, None
+            return done(None, None)
+
+        # The last rendered images without and with line wrapping. The searches
+        # always render the result last.
+        images = {}
+
+        def render(wrap, width_pt, dpi):
+            """Renders the text and returns the height of the image."""
+            with tracing.span(
+                'render', 'render', font=font, width_pt=width_pt, dpi=dpi
+            ):
+                rendered = self.renderer.render(
+                    text, locale, font, height, width_pt, dpi, bgcolor, fgcolor
+                )
+            images[wrap] = rendered.image
+            return rendered.image.size[1] if rendered.image else 0
+
+        def get_one_line_height(dpi):
+            """Renders the text in one line and returns its height."""
+            return render(False, 0, dpi)
 
         if not dpi:
             raise BuildImageError('DPI must be specified with use_svg=False')
         eff_dpi = dpi
         max_height_px = self._to_px(height)
-        height_px = get_one_line_png_height(dpi)
+        one_line_prober = search.Prober(get_one_line_height, self.search)
+        probers.append(one_line_prober)
+        height_px = one_line_prober.get(dpi)
         if height_px > max_height_px:
-            eff_dpi = self._bisect_dpi(
-                dpi, initial_dpi, max_height_px, get_one_line_png_height
+            # The height is roughly proportional to the DPI. The initial value
+            # only depends on the text, so that the result does not depend on
+            # other strings.
+            initial_dpi = max(1, dpi * max_height_px // height_px)
+            eff_dpi = search.run(
+                functools.partial(
+                    self._bisect_dpi, dpi, initial_dpi, max_height_px
+                ),
+                one_line_prober,
             )
 
         def get_width_px(width_pt):
-            run_pango_view(
-                input_file,
-                png_file,
-                locale,
-                font,
-                height,
-                width_pt,
-                eff_dpi,
-                bgcolor,
-                fgcolor,
+            render(True, width_pt, eff_dpi)
+            num_lines = self.get_num_lines(images[True], images[False])
+            return self._get_runtime_width_px(
+                height, num_lines, images[True].size
             )
-            num_lines = self.get_num_lines(png_file, one_line_dir)
-            return self._get_runtime_width_px(height, num_lines, png_file)
 
         if max_width:
-            # NOTE: With the same DPI, the height of multi-line PNG is not
-            # necessarily a multiple of the height of one-line PNG. Therefore,
+            # NOTE: With the same DPI, the height of multi-line image is not
+            # necessarily a multiple of the height of one-line image. Therefore,
             # even with the binary search, the height of the resulting
-            # multi-line PNG might be less than "one_line_height * num_lines".
-            # We cannot binary-search DPI for multi-line PNGs because
+            # multi-line image might be less than "one_line_height * num_lines".
+            # We cannot binary-search DPI for multi-line images because
             # "num_lines" is dependent on DPI.
             max_width_px = self._to_px(max_width)
-            if not initial_width_pt:
-                # max_width is not in points, but this should be good enough
-                # as an initial value.
+            # The width is not monotone in width_pt, as a wider layout may
+            # break the lines differently and change the scaling to the runtime
+            # height. An inferred comparison may then differ from the probed
+            # one without any probed value showing it, so always bisect.
+            width_prober = search.Prober(get_width_px, search.BISECT)
+            probers.append(width_prober)
+            # The rendered width is width_pt * eff_dpi / 72 pixels, which is
+            # scaled to the runtime height of the lines. Like the initial DPI,
+            # the initial width only depends on the text.
+            if images[False]:
+                initial_width_pt = max(
+                    1,
+                    max_width_px
+                    * images[False].size[1]
+                    * 72
+                    // (self._to_px(height) * eff_dpi),
+                )
+            else:
                 initial_width_pt = max_width
             width_pt = self._bisect_width(
-                initial_width_pt, max_width_px, get_width_px
+                initial_width_pt, max_width_px, width_prober
             )
-            num_lines = self.get_num_lines(png_file, one_line_dir)
+            image = images[True]
+            num_lines = self.get_num_lines(image, images[False])
         else:
             width_pt = None
-            png_file = png_file_one_line
+            image = images[False]
             num_lines = 1
-        self.convert_png_to_bmp(
-            png_file, output_file, max_colors, num_lines=num_lines
+        if image is None:
+            raise BuildImageError(f'{name}: Nothing rendered at {eff_dpi} DPI')
+        if stage_dir:
+            one_line_dir = os.path.join(stage_dir, ONE_LINE_DIR)
+            os.makedirs(one_line_dir, exist_ok=True)
+            if images[False]:
+                images[False].save(os.path.join(one_line_dir, name + '.png'))
+            image.save(os.path.join(stage_dir, name + '.png'))
+        self.convert_image_to_bmp(
+            image,
+            output_file,
+            max_colors,
+            num_lines=num_lines,
+            text_colors=(bgcolor, fgcolor),
+        )
+        return done(eff_dpi, width_pt)
+
+    def _get_stage_dir(self, *parts):
+        """Gets the stage directory for intermediate files.
+
+        Returns:
+            The directory `parts` under the stage directory, or None if
+            intermediate files are not stored for debugging.
+        """
+        if not self.debug_stage:
+            return None
+        return os.path.join(self.stage_dir, *parts)
+
+    def _is_up_to_date(self, output_file, **deps):
+        """Checks if `output_file` is up to date with its inputs `deps`.
+
+        The board config keys affecting all images are added to `deps`. Also
+        see `build_manifest.BuildManifest.is_up_to_date()`.
+        """
+        deps['board_config'] = {
+            key: self.config[key] for key in (KEY_SCREEN, KEY_DPI)
+        }
+        deps['renderer'] = self.renderer.NAME
+        deps['bmp_compression'] = self.bmp_compression
+        return self.manifest.is_up_to_date(
+            os.path.relpath(output_file, self.output_dir),
+            self.manifest.make_digest(**deps),
+        )
+
+    def _select_shard_items(self, costs):
+        """Selects the work items built by this build.
+
+        Args:
+            costs: A dict mapping names of work items to their estimated costs.
+
+        Returns:
+            A set of the names of the items in the shard of this build, or of
+            all items if the build is not sharded.
+        """
+        if not self.shard_planner:
+            return set(costs)
+        return self.shard_planner.select(costs)
+
+    def _get_sprite_key(self, svg_hash, style):
+        """Gets the key of a sprite bitmap in the sprite store and the cache.
+
+        A sprite bitmap only depends on the SVG file, the height in pixels and
+        the background color (apart from the conversion settings), so boards
+        with the same canvas size share their sprites.
+        """
+        return render_cache.RenderCache.make_key(
+            svg=svg_hash,
+            height_px=self._to_px(style[KEY_HEIGHT]),
+            bgcolor=style[KEY_BGCOLOR],
+            max_colors=self.SPRITE_MAX_COLORS,
+            rasterizer=self.rasterizer.NAME,
+            bmp_compression=self.bmp_compression,
         )
-        return eff_dpi, width_pt
 
-    def convert_sprite_images(self):
-        """Converts sprite images."""
+    def convert_sprite_image(self, name, new_name, style, svg_hash):
+        """Converts sprite image `name` to bitmap `new_name`."""
+        svg_file = os.path.join(self.sprite_dir, name + '.svg')
+        bmp_file = os.path.join(self.output_dir, new_name + '.bmp')
+        cache_key = None
+        if self.cache:
+            cache_key = self._get_sprite_key(svg_hash, style)
+            if self.cache.get(cache_key, bmp_file) is not None:
+                return
+        with open(svg_file, 'rb') as f:
+            svg_data = f.read()
+        image = self.rasterize_svg(
+            svg_data,
+            os.path.basename(svg_file),
+            style[KEY_HEIGHT],
+            style[KEY_BGCOLOR],
+        )
+        self.convert_image_to_bmp(image, bmp_file, self.SPRITE_MAX_COLORS)
+        if cache_key:
+            self.cache.put(cache_key, bmp_file)
+
+    def convert_sprite_images(self, graph):
+        """Adds tasks converting sprite images to `graph`."""
         names = self.formats[KEY_SPRITE_FILES]
         styles = self.formats[KEY_STYLES]
         # Check redundant images
@@ -699,23 +1138,59 @@ class Converter:
                 raise BuildImageError(
                     f'Sprite image {filename!r} not specified in {FORMAT_FILE}'
                 )
+        selected = self._select_shard_items(
+            {
+                name: SHARD_ITEM_COST
+                for name in names
+                if self.rename_map.get(name, name)
+            }
+        )
         # Convert images
-        os.makedirs(self.stage_sprite_dir, exist_ok=True)
         for name, category in names.items():
             new_name = self.rename_map.get(name, name)
-            if not new_name:
+            if not new_name or name not in selected:
                 continue
             style = get_config_with_defaults(styles, category)
             svg_file = os.path.join(self.sprite_dir, name + '.svg')
-            png_file = os.path.join(self.stage_sprite_dir, name + '.png')
             bmp_file = os.path.join(self.output_dir, new_name + '.bmp')
-            height = style[KEY_HEIGHT]
-            bgcolor = style[KEY_BGCOLOR]
-            self.convert_svg_to_png(svg_file, png_file, height, bgcolor)
-            self.convert_png_to_bmp(png_file, bmp_file, self.SPRITE_MAX_COLORS)
+            with open(svg_file, 'rb') as f:
+                svg_hash = render_cache.hash_bytes(f.read())
+            sprite_key = self._get_sprite_key(svg_hash, style)
+            if self._is_up_to_date(
+                bmp_file,
+                source=name,
+                svg=svg_hash,
+                style=style,
+                max_colors=self.SPRITE_MAX_COLORS,
+                rasterizer=self.rasterizer.NAME,
+            ):
+                self.sprite_store.setdefault(sprite_key, bmp_file)
+                continue
+            src_file = self.sprite_store.get(sprite_key)
+            if src_file and os.path.exists(src_file):
+                # Built for another board with the same canvas size.
+                _link_or_copy(src_file, bmp_file)
+                self.num_reused_sprites += 1
+                continue
+            self._add_worker_task(
+                graph,
+                f'sprite:{name}',
+                'convert_sprite_image',
+                name,
+                new_name,
+                style,
+                svg_hash,
+                on_done=functools.partial(
+                    self._store_sprite, sprite_key, bmp_file
+                ),
+            )
+
+    def _store_sprite(self, sprite_key, bmp_file, _):
+        """Adds a finished sprite bitmap to the sprite store."""
+        self.sprite_store.setdefault(sprite_key, bmp_file)
 
-    def build_generic_strings(self):
-        """Builds images of generic (locale-independent) strings."""
+    def build_generic_strings(self, graph):
+        """Adds tasks building images of generic strings to `graph`."""
         dpi = self.config[KEY_DPI]
 
         names = self.formats[KEY_GENERIC_FILES]
@@ -723,11 +1198,20 @@ class Converter:
         fonts = self.formats[KEY_FONTS]
         default_font = fonts[KEY_DEFAULT]
 
+        texts = {}
         for txt_file in glob.glob(os.path.join(self.strings_dir, '*.txt')):
             name, _ = os.path.splitext(os.path.basename(txt_file))
-            new_name = self.rename_map.get(name, name)
-            if not new_name:
+            if self.rename_map.get(name, name):
+                with open(txt_file, encoding='utf-8-sig') as f:
+                    texts[name] = f.read()
+        selected = self._select_shard_items(
+            {name: SHARD_ITEM_COST + len(text) for name, text in texts.items()}
+        )
+
+        for name, text in texts.items():
+            if name not in selected:
                 continue
+            new_name = self.rename_map.get(name, name)
             bmp_file = os.path.join(self.output_dir, new_name + '.bmp')
             category = names[name]
             style = get_config_with_defaults(styles, category)
@@ -739,28 +1223,200 @@ class Converter:
                     f'{name}: {KEY_MAX_WIDTH!r} should be '
                     'null for generic strings'
                 )
-            self.convert_text_to_image(
+            if self._is_up_to_date(
+                bmp_file,
+                source=name,
+                text=text,
+                style=style,
+                font=default_font,
+                font_hash=get_font_hash(default_font),
+                max_colors=self.text_max_colors,
+                quantizer=TEXT_QUANTIZER,
+                search=self.search,
+            ):
+                continue
+            self._add_worker_task(
+                graph,
+                f'generic:{name}',
+                'convert_text_to_image',
                 None,
-                txt_file,
+                # Like pango-view, ignore the trailing newline of the file.
+                text.removesuffix('\n'),
                 bmp_file,
                 default_font,
-                self.stage_dir,
                 self.text_max_colors,
                 height=style[KEY_HEIGHT],
                 max_width=None,
-                initial_width_pt=None,
                 dpi=dpi,
                 bgcolor=style[KEY_BGCOLOR],
                 fgcolor=style[KEY_FGCOLOR],
+                stage_dir=self._get_stage_dir(),
             )
 
-    def build_locale(self, locale, names):
-        """Builds images of strings for `locale`."""
+    def run_task(self, task_name, func, *args, **kwargs):
+        """Runs `func` in a worker process.
+
+        The task is traced as a span named `task_name`, whose category is the
+        prefix of `task_name` before ':'.
+
+        Returns:
+            A tuple of the result of `func`, a Counter of the render cache
+            stats, a dict of the build manifest outputs, a dict of the search
+            probe counts and a list of trace events recorded in the worker
+            process.
+        """
+        stats = self.cache.stats.copy() if self.cache else Counter()
+        outputs = self.manifest.outputs.copy()
+        self.search_probes = {}
+        category = task_name.split(':')[0]
+        with tracing.span(task_name, category) as trace_args:
+            result = func(*args, **kwargs)
+            if self.search_probes:
+                trace_args['probes'] = sum(self.search_probes.values())
+        if self.cache:
+            stats = self.cache.stats - stats
+        outputs = {
+            output: digest
+            for output, digest in self.manifest.outputs.items()
+            if output not in outputs
+        }
+        return (
+            result,
+            stats,
+            outputs,
+            self.search_probes,
+            tracing.take_events(),
+        )
+
+    def _merge_task_result(self, task_result):
+        """Merges the result of a `run_task` task into this process."""
+        result, stats, outputs, search_probes, events = task_result
+        if self.cache:
+            self.cache.stats.update(stats)
+        self.manifest.update(outputs)
+        self.search_probes.update(search_probes)
+        tracing.merge_events(events)
+        return result
+
+    def _add_worker_task(
+        self, graph, task_name, method, *args, on_done=None, **kwargs
+    ):
+        """Adds a task running `method` of the converter in a worker process.
+
+        Args:
+            graph: A `task_graph.TaskGraph` object.
+            task_name: Name of the task.
+            method: Name of the method to run.
+            *args: Positional arguments of the method.
+            on_done: A function called with the result of the method.
+            **kwargs: Keyword arguments of the method and
+                `TaskGraph.add_task()`.
+
+        Returns:
+            `task_name`.
+        """
+
+        def done(task_result):
+            result = self._merge_task_result(task_result)
+            if on_done:
+                on_done(result)
+
+        return graph.add_task(
+            task_name,
+            _run_worker_task,
+            self.worker_state_file,
+            task_name,
+            method,
+            *args,
+            on_done=done,
+            **kwargs,
+        )
+
+    def _get_localized_output(self, locale, new_name):
+        """Gets the final path of a localized image.
+
+        Localized images are generated in the RO locale directory, and then
+        possibly moved by `move_language_image()` or `copy_images_to_rw()`.
+        """
+        if new_name == 'language':
+            return os.path.join(self.output_dir, f'language_{locale}.bmp')
+        if (
+            self.config[KEY_SPLIT_RATIO] > 0
+            and new_name in self.formats[KEY_RW_ONLY]
+        ):
+            return os.path.join(self.output_rw_dir, locale, new_name + '.bmp')
+        return os.path.join(self.output_ro_dir, locale, new_name + '.bmp')
+
+    def _record_search_results(self, result):
+        """Records the result of `build_localized_string()`."""
+        eff_dpi, _ = result
         dpi = self.config[KEY_DPI]
-        styles = self.formats[KEY_STYLES]
-        fonts = self.formats[KEY_FONTS]
-        font = fonts.get(locale, fonts[KEY_DEFAULT])
-        inputs = parse_locale_json_file(locale, self.stage_grit_dir)
+        assert eff_dpi <= dpi
+        if eff_dpi != dpi:
+            self._reduced_dpis.append(eff_dpi)
+
+    def build_localized_string(
+        self,
+        locale,
+        name,
+        new_name,
+        text,
+        style,
+        font,
+        copies=(),
+    ):
+        """Builds the image of string `name` for `locale`.
+
+        Args:
+            copies: A list of (locale, new_name) of other localized images of
+                the same text, font and style, which are linked to the image.
+
+        Returns:
+            A tuple (`eff_dpi`, `width_pt`), see `convert_text_to_image()`.
+        """
+        output_dir = os.path.join(self.output_ro_dir, locale)
+        os.makedirs(output_dir, exist_ok=True)
+        output_file = os.path.join(output_dir, new_name + '.bmp')
+        if os.path.exists(output_file):
+            os.unlink(output_file)
+
+        # Convert text to image
+        result = self.convert_text_to_image(
+            locale,
+            text,
+            output_file,
+            font,
+            self.text_max_colors,
+            height=style[KEY_HEIGHT],
+            max_width=style[KEY_MAX_WIDTH],
+            dpi=self.config[KEY_DPI],
+            bgcolor=style[KEY_BGCOLOR],
+            fgcolor=style[KEY_FGCOLOR],
+            stage_dir=self._get_stage_dir('locale', locale),
+        )
+        for copy_locale, copy_name in copies:
+            copy_dir = os.path.join(self.output_ro_dir, copy_locale)
+            os.makedirs(copy_dir, exist_ok=True)
+            copy_file = os.path.join(copy_dir, copy_name + '.bmp')
+            if os.path.lexists(copy_file):
+                os.unlink(copy_file)
+            _link_or_copy(output_file, copy_file)
+        return result
+
+    def load_locale_strings(self, locale):
+        """Loads the strings of `locale`.
+
+        Returns:
+            A dict mapping names to normalized strings, including pre-generated
+            texts such as the language name.
+        """
+        try:
+            strings = self.string_compiler.compile(locale)
+        except string_compiler.StringCompilerError as e:
+            raise BuildImageError(str(e)) from e
+        inputs = {
+            name: normalize_string(text) for name, text in strings.items()
+        }
 
         # Walk locale dir to add pre-generated texts such as language names.
         for txt_file in glob.glob(
@@ -769,220 +1425,471 @@ class Converter:
             name, _ = os.path.splitext(os.path.basename(txt_file))
             with open(txt_file, 'r', encoding='utf-8-sig') as f:
                 inputs[name] = f.read().strip()
+        return inputs
 
-        stage_dir = os.path.join(self.stage_locale_dir, locale)
-        os.makedirs(stage_dir, exist_ok=True)
-        output_dir = os.path.join(self.output_ro_dir, locale)
-        os.makedirs(output_dir, exist_ok=True)
+    @classmethod
+    def get_shaping_class(cls, locale):
+        """Gets the class of locales rendering the same text identically.
 
-        eff_dpi_counters = defaultdict(Counter)
-        eff_dpi_counter = None
-        width_pt_counters = defaultdict(Counter)
-        width_pt_counter = None
-        results = []
-        for name, category in sorted(names.items()):
-            if name not in inputs:
-                raise BuildImageError(
-                    f'Locale {locale!r}: ' f'missing translation: {name!r}'
-                )
+        The renderer shapes the text for the language of the locale, e.g. with
+        localized forms ('locl' OpenType feature) such as the Cyrillic letters
+        of Bulgarian and Serbian, so only locales of the same language and
+        script, such as `es` and `es-419`, are in the same class.
 
-            new_name = self.rename_map.get(name, name)
-            if not new_name:
-                continue
-            output_file = os.path.join(output_dir, new_name + '.bmp')
+        Returns:
+            The language of `locale` with its script subtag (e.g. `sr-Latn`),
+            if any, or `locale` itself if its language is in
+            `REGION_SHAPING_LANGUAGES`.
+        """
+        language, *subtags = locale.split('-')
+        if language in REGION_SHAPING_LANGUAGES:
+            return locale
+        # Script subtags are the only subtags of four letters.
+        scripts = [
+            subtag
+            for subtag in subtags
+            if len(subtag) == 4 and subtag.isalpha()
+        ]
+        return '-'.join([language] + scripts)
 
-            # Write to text file
-            text_file = os.path.join(stage_dir, name + '.txt')
-            with open(text_file, 'w', encoding='utf-8-sig') as f:
-                f.write(inputs[name] + '\n')
+    def build_locales(self, graph, names, inputs):
+        """Adds tasks building images of strings for all locales to `graph`.
 
-            # Convert text to image
-            style = get_config_with_defaults(styles, category)
-            height = style[KEY_HEIGHT]
-            max_width = style[KEY_MAX_WIDTH]
-            eff_dpi_counter = eff_dpi_counters[height]
-            if eff_dpi_counter:
-                # Find the effective DPI that appears most times for `height`.
-                # This avoid doing the same binary search again and again. In
-                # case of a tie, pick the largest DPI.
-                best_eff_dpi = max(
-                    eff_dpi_counter, key=lambda dpi: (eff_dpi_counter[dpi], dpi)
-                )
-            else:
-                best_eff_dpi = None
-            width_pt_counter = (
-                width_pt_counters[(height, max_width)] if max_width else None
-            )
-            if width_pt_counter:
-                # Similarly, find the most frequently used `width_pt`. In case
-                # of a tie, pick the largest width.
-                best_width_pt = max(
-                    width_pt_counter, key=lambda w: (width_pt_counter[w], w)
-                )
-            else:
-                best_width_pt = None
-            eff_dpi, width_pt = self.convert_text_to_image(
-                locale,
-                text_file,
-                output_file,
-                font,
-                stage_dir,
-                self.text_max_colors,
-                height=height,
-                max_width=max_width,
-                initial_width_pt=best_width_pt,
-                dpi=dpi,
-                initial_dpi=best_eff_dpi,
-                bgcolor=style[KEY_BGCOLOR],
-                fgcolor=style[KEY_FGCOLOR],
-            )
-            eff_dpi_counter[eff_dpi] += 1
-            if width_pt:
-                width_pt_counter[width_pt] += 1
-            assert eff_dpi <= dpi
-            if eff_dpi != dpi:
-                results.append(eff_dpi)
-        return results
-
-    def _check_text_width(self, names):
-        """Checks if text image will exceed the drawing area at runtime."""
+        Strings with the same text, font, style and shaping class (see
+        `get_shaping_class()`) are rendered by a single task, whose image is
+        linked to all the outputs of the strings, in any locale. A shard build
+        only builds the strings of the groups in its shard.
+
+        Args:
+            graph: A `task_graph.TaskGraph` object.
+            names: A dict mapping names of the strings to their categories.
+            inputs: A dict mapping each locale to its strings, see
+                `load_locale_strings()`.
+        """
         styles = self.formats[KEY_STYLES]
+        fonts = self.formats[KEY_FONTS]
 
+        # Map each (text, font, style, shaping class) to its strings as a list
+        # of (locale, name, new_name, style).
+        all_groups = defaultdict(list)
         for locale_info in self.locales:
             locale = locale_info.code
-            ro_locale_dir = os.path.join(self.output_ro_dir, locale)
-            for name, category in names.items():
+            font = fonts.get(locale, fonts[KEY_DEFAULT])
+            locale_inputs = inputs[locale]
+            for name, category in sorted(names.items()):
+                if name not in locale_inputs:
+                    raise BuildImageError(
+                        f'Locale {locale!r}: ' f'missing translation: {name!r}'
+                    )
+
                 new_name = self.rename_map.get(name, name)
                 if not new_name:
                     continue
                 style = get_config_with_defaults(styles, category)
-                height = style[KEY_HEIGHT]
-                max_width = style[KEY_MAX_WIDTH]
-                if not max_width:
-                    continue
-                max_width_px = self._to_px(max_width)
-                filename = os.path.join(ro_locale_dir, f'{new_name}.bmp')
-                with open(filename, 'rb') as f:
-                    f.seek(BMP_HEADER_OFFSET_NUM_LINES)
-                    num_lines = f.read(1)[0]
-                width_px = self._get_runtime_width_px(
-                    height, num_lines, filename
+                key = (
+                    locale_inputs[name],
+                    font,
+                    json.dumps(style, sort_keys=True),
+                    self.get_shaping_class(locale),
                 )
-                if width_px > max_width_px:
-                    raise BuildImageError(
-                        f'{filename}: Image width {width_px:d}px greater'
-                        f'than max width {max_width_px:d}px'
-                    )
-
-    def build_localized_strings(self):
-        """Builds images of localized strings."""
-        # Sources are one .grd file with identifiers chosen by engineers and
-        # corresponding English texts, as well as a set of .xtb files (one for
-        # each language other than US English) with a mapping from hash to
-        # translation. Because the keys in the .xtb files are a hash of the
-        # English source text, rather than our identifiers, such as
-        # "btn_cancel", we use the "grit" command line tool to process the .grd
-        # and .xtb files, producing a set of .json files mapping our identifier
-        # to the translated string, one for every language including US English.
-
-        # This invokes the grit build command to generate JSON files from the
-        # XTB files containing translations.  The results are placed in
-        # `self.stage_grit_dir` as specified in firmware_strings.grd, i.e. one
-        # JSON file per locale.
-        os.makedirs(self.stage_grit_dir, exist_ok=True)
-        subprocess.check_call(
-            [
-                'grit',
-                '-i',
-                os.path.join(self.locale_dir, STRINGS_GRD_FILE),
-                'build',
-                '-o',
-                self.stage_grit_dir,
-            ]
+                all_groups[key].append((locale, name, new_name, style))
+
+        # Shards are planned over all strings, and each shard only builds the
+        # out-of-date strings of its groups.
+        selected = self._select_shard_items(
+            {
+                f'{strings[0][0]}:{strings[0][1]}': SHARD_ITEM_COST
+                + len(key[0])
+                for key, strings in all_groups.items()
+            }
         )
-
-        names = self.formats[KEY_LOCALIZED_FILES]
-
-        with ProcessPoolExecutor() as executor:
-            futures = []
-            for locale_info in self.locales:
-                locale = locale_info.code
-                print(locale, end=' ', flush=True)
-                futures.append(
-                    executor.submit(self.build_locale, locale, names)
+        groups = {}
+        for key, strings in all_groups.items():
+            if f'{strings[0][0]}:{strings[0][1]}' not in selected:
+                continue
+            text, font, _, shaping_class = key
+            font_hash = get_font_hash(font)
+            strings = [
+                (locale, name, new_name, style)
+                for locale, name, new_name, style in strings
+                if not self._is_up_to_date(
+                    self._get_localized_output(locale, new_name),
+                    locale=locale,
+                    shaping_class=shaping_class,
+                    source=name,
+                    text=text,
+                    style=style,
+                    font=font,
+                    font_hash=font_hash,
+                    max_colors=self.text_max_colors,
+                    quantizer=TEXT_QUANTIZER,
+                    search=self.search,
                 )
+            ]
+            if strings:
+                groups[key] = strings
+
+        locale_deps = defaultdict(list)
+        shared_pairs = Counter()
+        for (text, font, _, _), strings in groups.items():
+            locale, name, new_name, style = strings[0]
+            locales = sorted({string[0] for string in strings})
+            task = self._add_worker_task(
+                graph,
+                f'locale:{locale}:{name}',
+                'build_localized_string',
+                locale,
+                name,
+                new_name,
+                text,
+                style,
+                font,
+                copies=[(string[0], string[2]) for string in strings[1:]],
+                # Start long strings first to shorten the tail.
+                priority=len(text),
+                on_done=self._record_search_results,
+            )
+            for other_locale in locales:
+                locale_deps[other_locale].append(task)
+                if other_locale != locale:
+                    shared_pairs[(locale, other_locale)] += 1
 
-            print()
-
-            try:
-                results = [future.result() for future in futures]
-            except KeyboardInterrupt:
-                executor.shutdown(wait=False)
-                sys.exit('Aborted by user')
-
-        effective_dpi = [dpi for r in results for dpi in r if dpi]
-        if effective_dpi:
+        num_strings = sum(len(strings) for strings in groups.values())
+        if num_strings:
             print(
-                f'Reducing effective DPI to {max(effective_dpi)}, '
-                'limited by screen resolution'
+                f'Rendering {len(groups)} unique strings for {num_strings} '
+                f'localized images (dedup ratio '
+                f'{num_strings / len(groups):.2f})'
+            )
+        if shared_pairs:
+            print(
+                'Most shared strings: '
+                + ', '.join(
+                    f'{locale}/{other_locale}: {count}'
+                    for (locale, other_locale), count in (
+                        shared_pairs.most_common(NUM_SHARED_LOCALE_PAIRS)
+                    )
+                )
             )
 
-        self._check_text_width(names)
+        if self.shard:
+            # The images are finished by `merge_shards()`.
+            return
+        for locale_info in self.locales:
+            self._add_locale_check_tasks(
+                graph, locale_info.code, names, locale_deps[locale_info.code]
+            )
 
-    def move_language_images(self):
-        """Renames language bitmaps and move to self.output_dir.
+    def _add_locale_check_tasks(self, graph, locale, names, deps):
+        """Adds the tasks finishing the images of `locale` to `graph`.
 
-        The directory self.output_dir contains locale-independent images, and is
-        used for creating vbgfx.bin by archive_images.py.
+        The width check, the move of the language image and the copy to RW run
+        after all strings of the locale, given by the tasks `deps`, are built.
         """
-        for locale_info in self.locales:
-            locale = locale_info.code
-            ro_locale_dir = os.path.join(self.output_ro_dir, locale)
-            old_file = os.path.join(ro_locale_dir, 'language.bmp')
-            new_file = os.path.join(self.output_dir, f'language_{locale}.bmp')
-            if os.path.exists(new_file):
-                raise BuildImageError(f'File already exists: {new_file}')
-            shutil.move(old_file, new_file)
-
-    def build_glyphs(self):
-        """Builds glyphs of ascii characters."""
-        os.makedirs(self.stage_glyph_dir, exist_ok=True)
-        output_dir = os.path.join(self.output_dir, 'glyph')
-        os.makedirs(output_dir)
+        check = graph.add_task(
+            f'check:{locale}',
+            self._check_text_width,
+            locale,
+            names,
+            deps=deps,
+            local=True,
+        )
+        move = graph.add_task(
+            f'move:{locale}',
+            self.move_language_image,
+            locale,
+            deps=[check],
+            local=True,
+        )
+        if self.config[KEY_RW_OVERRIDE] or self.config[KEY_SPLIT_RATIO]:
+            graph.add_task(
+                f'rw:{locale}',
+                self.copy_images_to_rw,
+                locale,
+                deps=[move],
+                local=True,
+            )
+
+    def _check_text_width(self, locale, names):
+        """Checks if text image will exceed the drawing area at runtime."""
+        styles = self.formats[KEY_STYLES]
+
+        ro_locale_dir = os.path.join(self.output_ro_dir, locale)
+        for name, category in names.items():
+            new_name = self.rename_map.get(name, name)
+            if not new_name:
+                continue
+            style = get_config_with_defaults(styles, category)
+            height = style[KEY_HEIGHT]
+            max_width = style[KEY_MAX_WIDTH]
+            if not max_width:
+                continue
+            max_width_px = self._to_px(max_width)
+            filename = os.path.join(ro_locale_dir, f'{new_name}.bmp')
+            if not os.path.exists(filename):
+                # Up to date and already moved by the previous build.
+                filename = self._get_localized_output(locale, new_name)
+            # Only the header is read, for the size and the number of lines.
+            header = bmp.read_header(filename)
+            size = (header.width, abs(header.height))
+            width_px = self._get_runtime_width_px(
+                height, header.num_lines, size
+            )
+            if width_px > max_width_px:
+                raise BuildImageError(
+                    f'{filename}: Image width {width_px:d}px greater'
+                    f'than max width {max_width_px:d}px'
+                )
+
+    def build_localized_strings(self, graph):
+        """Adds tasks building images of localized strings to `graph`."""
+        # Sources are one .grd file with identifiers chosen by engineers and
+        # corresponding English texts, as well as a set of .xtb files (one for
+        # each language other than US English) with a mapping from hash to
+        # translation. Because the keys in the .xtb files are a hash of the
+        # English source text, rather than our identifiers, such as
+        # "btn_cancel", the strings are compiled by `string_compiler` like the
+        # "grit" command line tool would, but only for the locales built.
+        names = self.formats[KEY_LOCALIZED_FILES]
+
+        # The strings of the locales are compiled in parallel, and the tasks
+        # rendering them are added once all are compiled, so that identical
+        # strings of different locales are found.
+        inputs = {}
+        deps = [
+            self._add_worker_task(
+                graph,
+                f'strings:{locale_info.code}',
+                'load_locale_strings',
+                locale_info.code,
+                priority=sys.maxsize,
+                on_done=functools.partial(inputs.__setitem__, locale_info.code),
+            )
+            for locale_info in self.locales
+        ]
+        graph.add_task(
+            'dedup',
+            self.build_locales,
+            graph,
+            names,
+            inputs,
+            deps=deps,
+            local=True,
+            priority=sys.maxsize,
+        )
+
+    def move_language_image(self, locale):
+        """Renames the language bitmap of `locale` and move to self.output_dir.
+
+        The directory self.output_dir contains locale-independent images, and is
+        used for creating vbgfx.bin by archive_images.py.
+        """
+        ro_locale_dir = os.path.join(self.output_ro_dir, locale)
+        old_file = os.path.join(ro_locale_dir, 'language.bmp')
+        new_file = os.path.join(self.output_dir, f'language_{locale}.bmp')
+        if not os.path.exists(old_file):
+            # Up to date since the previous build.
+            return
+        if os.path.exists(new_file):
+            raise BuildImageError(f'File already exists: {new_file}')
+        shutil.move(old_file, new_file)
+
+    @classmethod
+    def _get_glyph_name(cls, code):
+        return f'idx{code:03d}_{code:02x}'
+
+    def build_glyphs(self, graph):
+        """Adds tasks building glyphs of ascii characters to `graph`."""
+        output_dir = os.path.join(self.output_dir, 'glyph')
+        os.makedirs(output_dir, exist_ok=True)
         styles = self.formats[KEY_STYLES]
         style = get_config_with_defaults(styles, KEY_GLYPH)
         height = style[KEY_HEIGHT]
         font = self.formats[KEY_FONTS][KEY_GLYPH]
-        with ProcessPoolExecutor() as executor:
-            futures = []
-            for c in range(ord(' '), ord('~') + 1):
-                name = f'idx{c:03d}_{c:02x}'
-                txt_file = os.path.join(self.stage_glyph_dir, name + '.txt')
-                with open(txt_file, 'w', encoding='ascii') as f:
-                    f.write(chr(c))
-                    f.write('\n')
-                output_file = os.path.join(output_dir, name + '.bmp')
-                futures.append(
-                    executor.submit(
-                        self.convert_text_to_image,
-                        None,
-                        txt_file,
-                        output_file,
-                        font,
-                        self.stage_glyph_dir,
-                        self.GLYPH_MAX_COLORS,
-                        height=height,
-                        use_svg=True,
-                    )
+        font_hash = get_font_hash(font)
+        if self.glyph_atlas:
+            # The atlas is rendered by one task, hence it is one work item.
+            selected = self._select_shard_items(
+                {'atlas': SHARD_ITEM_COST + len(GLYPH_CODES)}
+            )
+            codes = GLYPH_CODES if selected else []
+        else:
+            selected = self._select_shard_items(
+                {
+                    self._get_glyph_name(c): SHARD_ITEM_COST + 1
+                    for c in GLYPH_CODES
+                }
+            )
+            codes = [
+                c for c in GLYPH_CODES if self._get_glyph_name(c) in selected
+            ]
+        atlas_codes = []
+        for c in codes:
+            name = self._get_glyph_name(c)
+            output_file = os.path.join(output_dir, name + '.bmp')
+            if self._is_up_to_date(
+                output_file,
+                text=chr(c),
+                style=style,
+                font=font,
+                font_hash=font_hash,
+                max_colors=self.GLYPH_MAX_COLORS,
+                quantizer=TEXT_QUANTIZER,
+                rasterizer=self.rasterizer.NAME,
+                atlas=self.glyph_atlas,
+            ):
+                continue
+            if self.glyph_atlas:
+                atlas_codes.append(c)
+                continue
+            self._add_worker_task(
+                graph,
+                f'glyph:{name}',
+                'convert_text_to_image',
+                None,
+                chr(c),
+                output_file,
+                font,
+                self.GLYPH_MAX_COLORS,
+                height=height,
+                use_svg=True,
+                stage_dir=self._get_stage_dir('glyph'),
+            )
+        if atlas_codes:
+            self._add_worker_task(
+                graph, 'glyph-atlas', 'build_glyph_atlas', atlas_codes
+            )
+
+    def build_glyph_atlas(self, codes):
+        """Builds glyphs of `codes` by slicing a glyph atlas.
+
+        All glyphs are rendered into one SVG in one line with the monospace
+        glyph font, and the atlas is sliced into glyphs by the advance width.
+        Each glyph has the same size as if it were rendered alone. It is also
+        pixel-identical if the rasterizer supports rasterizing cells at
+        sub-pixel offsets; otherwise the anti-aliasing may differ slightly,
+        which can be checked with `check_glyph_atlas`.
+        """
+        style = get_config_with_defaults(self.formats[KEY_STYLES], KEY_GLYPH)
+        font = self.formats[KEY_FONTS][KEY_GLYPH]
+        output_dir = os.path.join(self.output_dir, 'glyph')
+        output_files = {
+            c: os.path.join(output_dir, self._get_glyph_name(c) + '.bmp')
+            for c in codes
+        }
+
+        missing = set(codes)
+        cache_keys = {}
+        if self.cache:
+            for c in codes:
+                key = self.cache.make_key(
+                    text=chr(c),
+                    font=font,
+                    font_hash=get_font_hash(font),
+                    canvas_px=self.canvas_px,
+                    style=style,
+                    max_colors=self.GLYPH_MAX_COLORS,
+                    quantizer=TEXT_QUANTIZER,
+                    renderer=self.renderer.NAME,
+                    rasterizer=self.rasterizer.NAME,
+                    atlas=True,
+                    bmp_compression=self.bmp_compression,
                 )
-            for future in futures:
-                future.result()
+                if self.cache.get(key, output_files[c]) is None:
+                    cache_keys[c] = key
+                else:
+                    missing.remove(c)
+            if not missing:
+                return
+
+        # Always render the whole atlas, so that the glyphs do not depend on
+        # which of them are built.
+        svg_data = self.renderer.render_svg(
+            ''.join(chr(c) for c in GLYPH_CODES),
+            None,
+            font,
+            style[KEY_HEIGHT],
+            style[KEY_BGCOLOR],
+            style[KEY_FGCOLOR],
+        )
+        stage_dir = self._get_stage_dir('glyph')
+        if stage_dir:
+            os.makedirs(stage_dir, exist_ok=True)
+            with open(os.path.join(stage_dir, 'atlas.svg'), 'wb') as f:
+                f.write(svg_data)
+        svg_width, svg_height = svg_rasterizers.get_svg_size(svg_data)
+        advance = svg_width / len(GLYPH_CODES)
+        height_px = self._get_svg_height_px('atlas', style[KEY_HEIGHT])
+        # Same size as each glyph rendered alone.
+        glyph_width = svg_rasterizers.get_scaled_width(
+            advance, svg_height, height_px
+        )
+        scale = height_px / svg_height
+        built_codes = [c for c in GLYPH_CODES if c in missing]
+        glyphs = self.rasterizer.rasterize_cells(
+            svg_data,
+            height_px,
+            style[KEY_BGCOLOR],
+            [
+                (GLYPH_CODES.index(c) * advance * scale, glyph_width)
+                for c in built_codes
+            ],
+        )
+        for c, glyph in zip(built_codes, glyphs):
+            self.convert_image_to_bmp(
+                glyph,
+                output_files[c],
+                self.GLYPH_MAX_COLORS,
+                text_colors=(style[KEY_BGCOLOR], style[KEY_FGCOLOR]),
+            )
+            if c in cache_keys:
+                self.cache.put(cache_keys[c], output_files[c])
+
+        if self.check_glyph_atlas:
+            self._check_glyph_atlas(sorted(missing), output_files, style, font)
+
+    def _check_glyph_atlas(self, codes, output_files, style, font):
+        """Checks glyphs sliced from the atlas against individual renders."""
+        errors = []
+        for c in codes:
+            name = self._get_glyph_name(c)
+            svg_data = self.renderer.render_svg(
+                chr(c),
+                None,
+                font,
+                style[KEY_HEIGHT],
+                style[KEY_BGCOLOR],
+                style[KEY_FGCOLOR],
+            )
+            image = self.rasterize_svg(
+                svg_data, name, style[KEY_HEIGHT], style[KEY_BGCOLOR]
+            )
+            expected = self._quantize_text_image(
+                image,
+                self.GLYPH_MAX_COLORS,
+                style[KEY_BGCOLOR],
+                style[KEY_FGCOLOR],
+            ).convert('L')
+            with Image.open(output_files[c]) as image:
+                actual = image.convert('L')
+            if expected.size != actual.size:
+                errors.append(f'{name}: size {actual.size} != {expected.size}')
+                continue
+            diff = ImageChops.difference(expected, actual)
+            mean = ImageStat.Stat(diff).mean[0]
+            if mean > GLYPH_ATLAS_TOLERANCE:
+                errors.append(f'{name}: mean difference {mean:.2f}')
+        if errors:
+            raise BuildImageError(
+                'Glyph atlas differs from individual glyphs '
+                f'(tolerance {GLYPH_ATLAS_TOLERANCE}): ' + ', '.join(errors)
+            )
 
-    def copy_images_to_rw(self):
-        """Copies localized images specified in boards.yaml for RW override."""
+    def check_rw_config(self):
+        """Checks the config of localized images for RW."""
         split_ratio = self.config[KEY_SPLIT_RATIO]
         if not self.config[KEY_RW_OVERRIDE] and split_ratio == 0:
-            print('  No localized images are specified for RW, skipping')
+            print('No localized images are specified for RW')
             return
 
         # Check if the split ratio between RO and RW is supported.
@@ -992,25 +1899,216 @@ class Converter:
                 ' Choose either 0 (no split) or 100 (move RW_ONLY assets)'
             )
 
+    def copy_images_to_rw(self, locale):
+        """Copies localized images specified in boards.yaml for RW override."""
+        split_ratio = self.config[KEY_SPLIT_RATIO]
+        ro_locale_dir = os.path.join(self.output_ro_dir, locale)
+        rw_locale_dir = os.path.join(self.output_rw_dir, locale)
+        os.makedirs(rw_locale_dir, exist_ok=True)
+
+        # Overlapping assets in RW_OVERRIDE & RW_ONLY is not expected.
+        # Hence move any RW_ONLY asset before copying RW_OVERRIDE assets.
+        # This will help to catch any overlapping scenario during build.
+        rw_only_names = self.formats[KEY_RW_ONLY] if split_ratio > 0 else []
+        for name in rw_only_names:
+            ro_src = os.path.join(ro_locale_dir, name + '.bmp')
+            rw_dst = os.path.join(rw_locale_dir, name + '.bmp')
+            if not os.path.exists(ro_src) and os.path.exists(rw_dst):
+                # Up to date since the previous build.
+                continue
+            shutil.move(ro_src, rw_dst)
+
+        for name in self.config[KEY_RW_OVERRIDE]:
+            ro_src = os.path.join(ro_locale_dir, name + '.bmp')
+            rw_dst = os.path.join(rw_locale_dir, name + '.bmp')
+            ro_output = os.path.relpath(ro_src, self.output_dir)
+            rw_output = os.path.relpath(rw_dst, self.output_dir)
+            # The copy is always refreshed, and depends only on the source.
+            self.manifest.record(rw_output, self.manifest.outputs[ro_output])
+            if os.path.lexists(rw_dst):
+                os.unlink(rw_dst)
+            shutil.copyfile(ro_src, rw_dst)
+
+    def _get_bitmap_specs(self):
+        """Gets the bitmaps expected in the output of the board.
+
+        Returns:
+            A dict mapping the paths of the bitmaps relative to the output
+            directory to `BitmapSpec` objects.
+        """
+        styles = self.formats[KEY_STYLES]
+        specs = {}
+
+        def add(path, max_colors, category=None):
+            style = None
+            if category is not None:
+                style = get_config_with_defaults(styles, category)
+            specs[path] = BitmapSpec(
+                os.path.join(self.output_dir, path), max_colors, style
+            )
+
+        for name in self.formats[KEY_SPRITE_FILES]:
+            new_name = self.rename_map.get(name, name)
+            if new_name:
+                add(new_name + '.bmp', self.SPRITE_MAX_COLORS)
+        for name, category in self.formats[KEY_GENERIC_FILES].items():
+            new_name = self.rename_map.get(name, name)
+            if new_name:
+                add(new_name + '.bmp', self.text_max_colors, category)
+        for code in GLYPH_CODES:
+            add(
+                os.path.join('glyph', self._get_glyph_name(code) + '.bmp'),
+                self.GLYPH_MAX_COLORS,
+            )
+
+        rw_names = set(self.config[KEY_RW_OVERRIDE])
+        if self.config[KEY_SPLIT_RATIO] > 0:
+            rw_names.update(self.formats[KEY_RW_ONLY])
         for locale_info in self.locales:
             locale = locale_info.code
-            ro_locale_dir = os.path.join(self.output_ro_dir, locale)
-            rw_locale_dir = os.path.join(self.output_rw_dir, locale)
-            os.makedirs(rw_locale_dir)
-
-            # Overlapping assets in RW_OVERRIDE & RW_ONLY is not expected.
-            # Hence move any RW_ONLY asset before copying RW_OVERRIDE assets.
-            # This will help to catch any overlapping scenario during build.
-            rw_only_names = self.formats[KEY_RW_ONLY] if split_ratio > 0 else []
-            for name in rw_only_names:
-                ro_src = os.path.join(ro_locale_dir, name + '.bmp')
-                rw_dst = os.path.join(rw_locale_dir, name + '.bmp')
-                shutil.move(ro_src, rw_dst)
-
-            for name in self.config[KEY_RW_OVERRIDE]:
-                ro_src = os.path.join(ro_locale_dir, name + '.bmp')
-                rw_dst = os.path.join(rw_locale_dir, name + '.bmp')
-                shutil.copyfile(ro_src, rw_dst)
+            for name, category in self.formats[KEY_LOCALIZED_FILES].items():
+                new_name = self.rename_map.get(name, name)
+                if not new_name:
+                    continue
+                output = self._get_localized_output(locale, new_name)
+                add(
+                    os.path.relpath(output, self.output_dir),
+                    self.text_max_colors,
+                    category,
+                )
+                if new_name in rw_names:
+                    add(
+                        os.path.join(
+                            os.path.relpath(
+                                self.output_rw_dir, self.output_dir
+                            ),
+                            locale,
+                            new_name + '.bmp',
+                        ),
+                        self.text_max_colors,
+                        category,
+                    )
+        return specs
+
+    def _check_bitmap(self, spec, header, size):
+        """Checks the header of a bitmap against its spec.
+
+        Returns:
+            A list of problems.
+        """
+        problems = []
+        if header.file_size != size:
+            problems.append(f'File size {size} != {header.file_size} in header')
+        if header.colors > spec.max_colors:
+            problems.append(
+                f'{header.colors} colors, more than {spec.max_colors}'
+            )
+        if spec.style is None:
+            return problems
+
+        height = spec.style[KEY_HEIGHT]
+        if header.num_lines < 1:
+            problems.append('No lines of text')
+        elif self._to_px(height * header.num_lines) > self.canvas_px:
+            problems.append(
+                f'{header.num_lines} lines of height {height} exceed the '
+                f'canvas of {self.canvas_px}px'
+            )
+        max_width = spec.style[KEY_MAX_WIDTH]
+        if max_width and header.num_lines >= 1 and header.height:
+            width_px = self._get_runtime_width_px(
+                height, header.num_lines, (header.width, abs(header.height))
+            )
+            max_width_px = self._to_px(max_width)
+            if width_px > max_width_px:
+                problems.append(
+                    f'Image width {width_px}px greater than max width '
+                    f'{max_width_px}px'
+                )
+        return problems
+
+    def verify_output(self, executor):
+        """Verifies the output of a previous build of the board.
+
+        The bitmaps are not decoded; only their headers are parsed, from memory
+        maps of the files, in parallel. It checks that:
+        - The locale list and the locale directories match the locales.
+        - The bitmaps, including the RO and RW sets of each locale given by
+          rw_only, rw_override and split_ratio, are exactly those expected.
+        - No bitmap has more colors than allowed.
+        - Text bitmaps have lines that fit the canvas, and are not wider than
+          their max width at runtime.
+
+        Args:
+            executor: A `concurrent.futures.Executor` to parse the headers with.
+
+        Returns:
+            A tuple of the number of bitmaps checked and a list of problems.
+        """
+        problems = []
+        expected_locales = [
+            f'{locale_info.code},{locale_info.rtl:d}'
+            for locale_info in self.locales
+        ]
+        try:
+            with open(
+                os.path.join(self.output_dir, 'locales'), encoding='utf-8'
+            ) as f:
+                locales = f.read().split()
+        except OSError as e:
+            problems.append(f'Cannot read the locale list: {e}')
+        else:
+            if locales != expected_locales:
+                problems.append(
+                    f'Locale list {locales} != {expected_locales} expected'
+                )
+
+        codes = {locale_info.code for locale_info in self.locales}
+        rw_enabled = bool(
+            self.config[KEY_RW_OVERRIDE] or self.config[KEY_SPLIT_RATIO]
+        )
+        for locale_dir, expected in (
+            (self.output_ro_dir, codes),
+            (self.output_rw_dir, codes if rw_enabled else set()),
+        ):
+            found = set()
+            if os.path.isdir(locale_dir):
+                found = set(os.listdir(locale_dir))
+            relpath = os.path.relpath(locale_dir, self.output_dir)
+            for code in sorted(found - expected):
+                problems.append(f'{relpath}: Unexpected locale {code!r}')
+            for code in sorted(expected - found):
+                problems.append(f'{relpath}: Missing locale {code!r}')
+
+        specs = self._get_bitmap_specs()
+        found = {
+            os.path.relpath(path, self.output_dir)
+            for path in glob.glob(
+                os.path.join(self.output_dir, '**', '*.bmp'), recursive=True
+            )
+        }
+        for path in sorted(found - set(specs)):
+            problems.append(f'{path}: Unexpected bitmap')
+        for path in sorted(set(specs) - found):
+            problems.append(f'{path}: Missing bitmap')
+
+        paths = sorted(found & set(specs))
+
+        def read_header(path):
+            try:
+                return read_bmp_header(specs[path].path), None
+            except (OSError, ValueError, bmp.BmpError) as e:
+                return None, e
+
+        for path, (result, error) in zip(
+            paths, executor.map(read_header, paths)
+        ):
+            if error:
+                problems.append(f'{path}: {error}')
+                continue
+            for problem in self._check_bitmap(specs[path], *result):
+                problems.append(f'{path}: {problem}')
+        return len(paths), problems
 
     def create_locale_list(self):
         """Creates locale list as a CSV file.
@@ -1019,59 +2117,1097 @@ class Converter:
         - "code": language code of the locale
         - "rtl": "1" for right-to-left language, "0" otherwise
         """
-        with open(
-            os.path.join(self.output_dir, 'locales'), 'w', encoding='utf-8'
-        ) as f:
-            for locale_info in self.locales:
-                f.write(f'{locale_info.code},{locale_info.rtl:d}\n')
-
-    def build(self):
-        """Builds all images required by a board."""
+        _replace_file(
+            os.path.join(self.output_dir, 'locales'),
+            ''.join(
+                f'{locale_info.code},{locale_info.rtl:d}\n'
+                for locale_info in self.locales
+            ).encode('utf-8'),
+        )
+
+    def build(self, clean=False):
+        """Builds all images required by a board.
+
+        Only images whose inputs have changed since the previous build are
+        regenerated, as recorded in the build manifest. Images no longer
+        generated are removed.
+
+        Every sprite, generic string, localized string and glyph is built by a
+        separate task, and all tasks run concurrently on one process pool,
+        subject to their dependencies.
+
+        A shard build always builds the work items of its shard from scratch,
+        and leaves the localized images unfinished for `merge_shards()`.
+
+        Args:
+            clean: If True, remove all previous outputs and rebuild everything.
+        """
+        with tracing.span(
+            f'build:{self.board}', 'phase', dpi=self.config[KEY_DPI]
+        ):
+            self._build(clean)
+
+    def _build(self, clean):
+        """Builds all images, see `build()`."""
+        self.manifest = build_manifest.BuildManifest(self.output_dir)
+        if self.shard:
+            # The work items of the shard change with the inputs of all items,
+            # so the outputs of previous builds of the shard are not reused.
+            clean = True
+        elif not clean and not self.manifest.load():
+            if os.path.exists(self.output_dir):
+                print('No valid build manifest found, rebuilding everything')
+            clean = True
         # Clean up output/stage directories
-        for path in (self.output_dir, self.stage_dir):
+        paths = (
+            (self.output_dir, self.stage_dir) if clean else (self.stage_dir,)
+        )
+        for path in paths:
             if os.path.exists(path):
                 shutil.rmtree(path)
-        os.makedirs(self.output_dir)
-        os.makedirs(self.stage_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.debug_stage:
+            os.makedirs(self.stage_dir)
+
+        self.check_rw_config()
+        self._reduced_dpis = []
+
+        if self.shard:
+            shard, num_shards = self.shard
+            print(f'Building shard {shard}/{num_shards}')
+            self.shard_planner = shards.ShardPlanner(shard, num_shards)
+            shards.write_shard_info(
+                self.output_dir, shard, num_shards, self.get_shard_settings()
+            )
+        else:
+            print('Creating locale list file...')
+            with tracing.span('create_locale_list', 'phase'):
+                self.create_locale_list()
+
+        if self.executor:
+            # The file is passed to the tasks, and written before running them.
+            fd, self.worker_state_file = tempfile.mkstemp(
+                prefix='converter_', suffix='.pickle'
+            )
+            os.close(fd)
+        try:
+            graph = task_graph.TaskGraph(self.jobs)
+            with tracing.span('add_tasks', 'phase'):
+                self.convert_sprite_images(graph)
+                self.build_generic_strings(graph)
+                self.build_localized_strings(graph)
+                self.build_glyphs(graph)
+
+            print('Building images...')
+            num_events = len(tracing.get_events())
+            with tracing.span('run_tasks', 'phase') as trace_args:
+                if self.worker_state_file:
+                    # The warm workers load the converter on their first task.
+                    with open(self.worker_state_file, 'wb') as f:
+                        pickle.dump(self, f)
+                graph.run(
+                    initializer=_init_worker,
+                    initargs=(self, tracing.is_enabled()),
+                    executor=self.executor,
+                    progress=self.progress,
+                )
+                trace_args['num_tasks'] = len(graph.tasks)
+        except KeyboardInterrupt:
+            sys.exit('Aborted by user')
+        finally:
+            if self.worker_state_file:
+                os.unlink(self.worker_state_file)
+                self.worker_state_file = None
+        print(f'Finished {len(graph.tasks)} tasks')
+        self._trace_locales(tracing.get_events()[num_events:])
+        if self.num_reused_sprites:
+            print(f'Reused {self.num_reused_sprites} sprites of other boards')
+
+        if self._reduced_dpis:
+            print(
+                f'Reducing effective DPI to {max(self._reduced_dpis)}, '
+                'limited by screen resolution'
+            )
 
-        print('Converting sprite images...')
-        self.convert_sprite_images()
+        with tracing.span('save_manifest', 'phase'):
+            orphans = self.manifest.remove_orphans()
+            self.manifest.save()
+        num_built = sum(
+            1
+            for output, digest in self.manifest.outputs.items()
+            if self.manifest.old_outputs.get(output) != digest
+        )
+        print(
+            f'Built {num_built} of {len(self.manifest.outputs)} images, '
+            f'removed {len(orphans)} orphaned images'
+        )
 
-        print('Building generic strings...')
-        self.build_generic_strings()
+        if self.search_probes:
+            num_probes = sum(self.search_probes.values())
+            print(
+                f'Searches ({self.search}): {num_probes} renders for '
+                f'{len(self.search_probes)} images, '
+                f'{num_probes / len(self.search_probes):.2f} per image'
+            )
+
+        if self.cache:
+            num_evicted = self.cache.trim()
+            print(
+                f'Render cache: {self.cache.stats[render_cache.STAT_HITS]} '
+                f'hits, {self.cache.stats[render_cache.STAT_MISSES]} misses, '
+                f'{num_evicted} evicted'
+            )
+
+        if self.shard_planner:
+            planner = self.shard_planner
+            index = planner.shard - 1
+            print(
+                f'Shard {planner.shard}/{planner.num_shards}: '
+                f'{planner.num_items[index]} of {sum(planner.num_items)} work '
+                f'items, {planner.costs[index] / sum(planner.costs):.1%} of '
+                'the estimated cost'
+            )
+        else:
+            self.write_size_report()
+
+    @classmethod
+    def _trace_locales(cls, events):
+        """Adds a span of each locale covering the tasks of its strings.
+
+        Args:
+            events: The trace events of the tasks.
+        """
+        tasks = defaultdict(list)
+        for event in events:
+            if event['cat'] == 'locale':
+                tasks[event['name'].split(':')[1]].append(event)
+        for locale, locale_tasks in tasks.items():
+            tracing.add_summary_span(
+                f'locale:{locale}',
+                'locale_summary',
+                min(event['ts'] for event in locale_tasks),
+                max(event['ts'] + event['dur'] for event in locale_tasks),
+                num_strings=len(locale_tasks),
+                probes=sum(
+                    event['args'].get('probes', 0) for event in locale_tasks
+                ),
+            )
 
-        print('Building localized strings...')
-        self.build_localized_strings()
+    def get_shard_settings(self):
+        """Gets the settings that all shards of the board are built with.
 
-        print('Moving language images to locale-independent directory...')
-        self.move_language_images()
+        Returns:
+            A dict of the settings, normalized by a JSON round trip.
+        """
+        settings = {
+            'config': self.config,
+            'locales': self.locales,
+            'rename_map': self.rename_map,
+            'renderer': self.renderer.NAME,
+            'rasterizer': self.rasterizer.NAME,
+            'bmp_compression': self.bmp_compression,
+            'glyph_atlas': self.glyph_atlas,
+            'search': self.search,
+        }
+        return json.loads(json.dumps(settings))
+
+    def merge_shards(self, shard_dirs, settings):
+        """Merges the outputs of all shards of the board into its output.
+
+        The board output directory is replaced by the files of the shards,
+        which are hardlinked (or copied), and their build manifests are
+        merged, so that later builds of the board are incremental. Then the
+        localized images are finished like in `build()`: their widths are
+        checked, and they are moved and copied to RW. Finally, the locale list
+        and the size report are written.
+
+        Args:
+            shard_dirs: The board output directories of all shards.
+            settings: The settings of the shards, see `get_shard_settings()`.
+        """
+        own_settings = self.get_shard_settings()
+        for key in ('config', 'locales', 'rename_map'):
+            if settings[key] != own_settings[key]:
+                raise BuildImageError(
+                    f'Shards of {self.board} were built with different '
+                    f'{key}: {settings[key]} != {own_settings[key]}'
+                )
 
-        print('Creating locale list file...')
+        self.manifest = build_manifest.BuildManifest(self.output_dir)
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+        os.makedirs(self.output_dir)
+        for shard_dir in shard_dirs:
+            shard_manifest = build_manifest.BuildManifest(shard_dir)
+            if not shard_manifest.load():
+                raise BuildImageError(f'No valid build manifest in {shard_dir}')
+            self.manifest.update(shard_manifest.old_outputs)
+            for root, _, files in os.walk(shard_dir):
+                for file in files:
+                    # Skip the manifest and the shard info.
+                    if file.startswith('.'):
+                        continue
+                    src = os.path.join(root, file)
+                    output = os.path.relpath(src, shard_dir)
+                    dst = os.path.join(self.output_dir, output)
+                    if os.path.exists(dst):
+                        raise BuildImageError(
+                            f'{output} is built by several shards'
+                        )
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    _link_or_copy(src, dst)
+
+        self.check_rw_config()
         self.create_locale_list()
+        names = self.formats[KEY_LOCALIZED_FILES]
+        for locale_info in self.locales:
+            self._check_text_width(locale_info.code, names)
+            self.move_language_image(locale_info.code)
+            if self.config[KEY_RW_OVERRIDE] or self.config[KEY_SPLIT_RATIO]:
+                self.copy_images_to_rw(locale_info.code)
+
+        missing = [
+            output
+            for output in self.manifest.outputs
+            if not os.path.exists(os.path.join(self.output_dir, output))
+        ]
+        if missing:
+            raise BuildImageError(
+                f'Images missing from the shards of {self.board}: '
+                + ', '.join(sorted(missing))
+            )
+        self.manifest.save()
+        print(
+            f'Merged {len(self.manifest.outputs)} images of {len(shard_dirs)} '
+            f'shards of {self.board}'
+        )
+        self.write_size_report()
+
+    def get_size_categories(self):
+        """Gets the style categories of bitmaps for the size report.
+
+        Returns:
+            A dict mapping bitmap names (without extension) to their style
+            categories in format.yaml.
+        """
+        categories = {}
+        for key in (KEY_SPRITE_FILES, KEY_GENERIC_FILES, KEY_LOCALIZED_FILES):
+            for name, category in self.formats[key].items():
+                new_name = self.rename_map.get(name, name)
+                if new_name:
+                    categories[new_name] = category
+        for locale_info in self.locales:
+            categories[f'language_{locale_info.code}'] = categories.get(
+                'language'
+            )
+        for c in GLYPH_CODES:
+            categories[self._get_glyph_name(c)] = KEY_GLYPH
+        return categories
+
+    def write_size_report(self):
+        """Writes the size report of the board output directory.
+
+        Returns:
+            The report, see `size_report.make_report()`.
+        """
+        with tracing.span('size_report', 'phase'):
+            report = size_report.make_report(
+                self.output_dir, self.get_size_categories()
+            )
+        path = os.path.join(self.output_dir, size_report.REPORT_FILE)
+        size_report.save_report(report, path)
+        print(
+            f'Size report: {path} '
+            f'({report[size_report.KEY_RO_TOTAL]} bytes in RO, '
+            f'{report[size_report.KEY_TOTAL]} bytes in total)'
+        )
+        return report
+
+    def get_archive_sizes(self):
+        """Gets the sizes of the archives of the images stored in RO CBFS.
+
+        Returns:
+            A dict mapping archive names (vbgfx.bin, font.bin and
+            locale_<locale>.bin) to their sizes in bytes.
+        """
+        return {
+            name: archive_images.get_archive_size(files)
+            for name, files in archive_images.get_archives(
+                self.output_dir
+            ).items()
+            if not name.startswith('rw_')
+        }
+
+    def fit_budget(self, budget, clean=False):
+        """Builds all images with the largest DPI fitting in `budget`.
+
+        The DPI is searched between 1 and the DPI of the board config, assuming
+        that the total size of the archives grows with the DPI. Each trial is a
+        full build. The renders of all trials are stored in the render cache,
+        so the final build and trials of a DPI tried before mostly copy
+        bitmaps from the cache.
+
+        Args:
+            budget: Maximum total size in bytes of the archives stored in RO
+                CBFS, as returned by `get_archive_sizes()`.
+            clean: If True, remove all previous outputs before the first trial.
+
+        Returns:
+            A tuple (`dpi`, `sizes`) of the chosen DPI and the sizes of the
+            archives built with it.
+        """
+        sizes = {}
+
+        def build_with_dpi(dpi):
+            """Builds all images with `dpi` and returns the total size."""
+            print(f'Trying DPI {dpi}')
+            self.config = dict(self.config, **{KEY_DPI: dpi})
+            self.text_max_colors = self.get_text_colors(dpi)
+            self.build(clean=clean and not sizes)
+            sizes[dpi] = self.get_archive_sizes()
+            total = sum(sizes[dpi].values())
+            print(f'DPI {dpi}: {total} bytes (budget {budget} bytes)')
+            return total
+
+        prober = search.Prober(build_with_dpi, self.search)
+        min_dpi = 1
+        max_dpi = self.config[KEY_DPI]
+        # Try the configured DPI first, which fits in most cases.
+        if prober.compare(max_dpi, budget) > 0:
+            max_dpi -= 1
+            while min_dpi < max_dpi:
+                mid_dpi = (min_dpi + max_dpi + 1) // 2
+                if prober.compare(mid_dpi, budget) > 0:
+                    max_dpi = mid_dpi - 1
+                else:
+                    min_dpi = mid_dpi
+            if max_dpi < min_dpi or prober.compare(max_dpi, budget) > 0:
+                raise BuildImageError(
+                    f'Images do not fit in {budget} bytes even with DPI '
+                    f'{min_dpi}'
+                )
+        prober.finalize(max_dpi)
+        print(f'Searched DPI in {prober.num_probes} trial builds')
+        return max_dpi, sizes[max_dpi]
+
+
+# Converter of the worker process, set by _init_worker().
+_worker_converter = None
+# The file `_worker_converter` was loaded from by a warm worker process.
+_worker_state_file = None
+
+
+def _init_worker(converter, trace):
+    """Initializes a worker process of the build task graph."""
+    global _worker_converter  # pylint: disable=global-statement
+    _worker_converter = converter
+    if trace:
+        tracing.enable()
+
+
+def _run_worker_task(state_file, task_name, method, *args, **kwargs):
+    """Runs `method` of the worker converter, see `Converter.run_task()`.
+
+    Args:
+        state_file: The file of the pickled converter of the build, which a
+            warm worker process loads on its first task of the build, or None
+            if the converter was passed to `_init_worker()`.
+    """
+    # pylint: disable=global-statement
+    global _worker_converter, _worker_state_file
+    if state_file and state_file != _worker_state_file:
+        with open(state_file, 'rb') as f:
+            _worker_converter = pickle.load(f)
+        _worker_state_file = state_file
+    return _worker_converter.run_task(
+        task_name, getattr(_worker_converter, method), *args, **kwargs
+    )
+
+
+def _init_pool_worker():
+    """Initializes a worker process of `create_worker_pool()`."""
+    # The workers are shut down by the owner of the pool, so that interrupting
+    # the process group (e.g. by Ctrl-C) only stops the owner.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _warm_up_worker(renderer, fonts):
+    """Loads `fonts` in a worker process, see `create_worker_pool()`."""
+    renderer.warm_up(fonts)
+    return os.getpid()
+
 
-        print('Building glyphs...')
-        self.build_glyphs()
+def create_worker_pool(jobs, renderer, fonts):
+    """Creates a pool of worker processes to be reused by several builds.
 
-        print('Copying specified images to RW packing directory...')
-        self.copy_images_to_rw()
+    The workers are started right away, and load the fonts of `renderer`.
+
+    Args:
+        jobs: Number of worker processes, or None for the number of CPUs.
+        renderer: A `renderers.TextRenderer` object.
+        fonts: List of font names.
+
+    Returns:
+        A `concurrent.futures.ProcessPoolExecutor` object.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    executor = futures.ProcessPoolExecutor(jobs, initializer=_init_pool_worker)
+    tasks = [
+        executor.submit(_warm_up_worker, renderer, fonts) for _ in range(jobs)
+    ]
+    for task in tasks:
+        task.result()
+    return executor
+
+
+def print_fit_result(board, dpi, sizes, budget):
+    """Prints the DPI chosen by `Converter.fit_budget()` and the sizes.
+
+    Args:
+        board: Board name.
+        dpi: The chosen DPI.
+        sizes: A dict mapping archive names to their sizes in bytes.
+        budget: The budget in bytes.
+    """
+    total = sum(sizes.values())
+    print(f'Fitted DPI of {board}: {dpi} ({total} of {budget} bytes)')
+    width = max(len(name) for name in sizes)
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        print(f'  {name:<{width}} {size:>9d} {size / total:6.1%}')
+
+
+def verify_boards(boards, formats, jobs=None):
+    """Verifies the outputs of `boards` and prints one report.
+
+    See `Converter.verify_output()` for the checks.
+
+    Args:
+        boards: List of board names.
+        formats: A dictionary of string formats.
+        jobs: Number of threads parsing the bitmaps, or None for the default
+            of `concurrent.futures.ThreadPoolExecutor`.
+
+    Returns:
+        The number of problems found.
+    """
+    results = []
+    # Threads are enough, since parsing a header is cheap compared with
+    # opening and mapping the file.
+    with futures.ThreadPoolExecutor(jobs) as executor:
+        for board in boards:
+            board_config = load_board_config(BOARDS_CONFIG_FILE, board)
+            converter = Converter(
+                board, formats, board_config, OUTPUT_DIR, jobs=jobs
+            )
+            results.append((board, *converter.verify_output(executor)))
+
+    print('Verification report:')
+    num_problems = 0
+    for board, num_bitmaps, problems in results:
+        status = f'{len(problems)} problems' if problems else 'OK'
+        print(f'  {board}: {num_bitmaps} bitmaps, {status}')
+        for problem in problems:
+            print(f'    {problem}')
+        num_problems += len(problems)
+    print(
+        f'Verified {len(boards)} boards: '
+        + (f'{num_problems} problems' if num_problems else 'OK')
+    )
+    return num_problems
+
+
+class _LineWriter(io.TextIOBase):
+    """Text stream calling a function with each line written to it."""
+
+    def __init__(self, func):
+        super().__init__()
+        self.func = func
+        self.buffer = ''
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        for line in lines:
+            self.func(line)
+        return len(text)
+
+
+@contextlib.contextmanager
+def _override_environ(env):
+    """Sets the variables of `SERVER_ENV_VARS` to those in `env`."""
+    saved = {key: os.environ.get(key) for key in SERVER_ENV_VARS}
+    try:
+        for key in SERVER_ENV_VARS:
+            if env.get(key) is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = env[key]
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class BuildServer:
+    """Server building boards on requests received on a Unix socket.
+
+    The server keeps a pool of worker processes with the fonts loaded and the
+    parsed config files, which are reused by all builds. Requests are handled
+    one at a time.
+
+    A request is a JSON object on one line, with the keys:
+        boards: List of board names.
+        output: Output directory.
+        clean: If true, remove all previous outputs and rebuild everything.
+        env: The variables of `SERVER_ENV_VARS` of the client, which may be
+            null.
+        options: The options of `SERVER_BUILD_OPTIONS` to build with, where
+            missing options have the defaults of `Converter`.
+    The server replies with JSON objects, one per line: {"output": line} for
+    each line printed by the build, {"progress": [finished, total]} as the
+    tasks of a board finish, and finally {"done": true, "error": message},
+    where the message is null if the build succeeded.
+    """
+
+    def __init__(
+        self,
+        jobs=None,
+        renderer=None,
+        rasterizer=None,
+        cache_size=render_cache.DEFAULT_MAX_SIZE,
+    ):
+        """Inits the server.
+
+        Args:
+            jobs: Number of worker processes, or None for the number of CPUs.
+            renderer: A `renderers.TextRenderer` object, or None for the
+                default renderer.
+            rasterizer: A `svg_rasterizers.SvgRasterizer` object, or None for
+                the default rasterizer.
+            cache_size: Maximum size of the render cache of each output
+                directory in bytes, or None to disable the cache.
+        """
+        self.jobs = jobs or os.cpu_count() or 1
+        self.renderer = renderer or renderers.get_renderer()
+        self.rasterizer = rasterizer or svg_rasterizers.get_rasterizer()
+        self.cache_size = cache_size
+        self.executor = None
+        # The fonts configs checked by `check_fonts()`.
+        self._checked_fonts = set()
+
+    def _check_fonts(self, fonts):
+        """Checks the fonts like `check_fonts()`, once for each config."""
+        key = json.dumps(fonts, sort_keys=True)
+        if key not in self._checked_fonts:
+            check_fonts(fonts)
+            self._checked_fonts.add(key)
+
+    def serve(self, socket_path):
+        """Serves requests on `socket_path` until interrupted."""
+        formats = load_yaml(FORMAT_FILE)
+        self._check_fonts(formats[KEY_FONTS])
+        print(f'Starting {self.jobs} workers')
+        self.executor = create_worker_pool(
+            self.jobs, self.renderer, sorted(set(formats[KEY_FONTS].values()))
+        )
+        # Stop on SIGTERM like on SIGINT, removing the socket and the workers.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        with contextlib.ExitStack() as stack:
+            stack.callback(self.executor.shutdown, cancel_futures=True)
+            server = stack.enter_context(
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            )
+            _bind_server_socket(server, socket_path)
+            stack.callback(os.unlink, socket_path)
+            server.listen()
+            print(f'Serving on {socket_path}', flush=True)
+            while True:
+                connection, _ = server.accept()
+                with connection, connection.makefile('rwb') as stream:
+                    self.handle(stream)
+
+    def handle(self, stream):
+        """Handles a request read from `stream`, writing the replies to it."""
+
+        def send(**message):
+            stream.write(json.dumps(message).encode() + b'\n')
+            stream.flush()
+
+        try:
+            request = json.loads(stream.readline())
+            boards = [str(board) for board in request['boards']]
+            output = str(request['output'])
+            clean = bool(request.get('clean'))
+            env = dict(request.get('env') or {})
+            options = dict(request.get('options') or {})
+            for key in options:
+                if key not in SERVER_BUILD_OPTIONS:
+                    raise ValueError(f'Unknown option {key!r}')
+        except (ValueError, KeyError, TypeError) as e:
+            send(done=True, error=f'Invalid request: {e!r}')
+            return
+        print(f'Building {",".join(boards)} in {output}', flush=True)
+
+        # Only the progress of each whole percent is sent.
+        last_percent = [None]
+
+        def progress(num_done, num_tasks):
+            percent = num_done * 100 // num_tasks
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                send(progress=[num_done, num_tasks])
+
+        error = None
+        try:
+            with contextlib.redirect_stdout(
+                _LineWriter(lambda line: send(output=line))
+            ), _override_environ(env):
+                self.build(boards, output, clean, progress, options)
+        except (BrokenPipeError, ConnectionResetError):
+            print('Client disconnected', flush=True)
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            error = f'{type(e).__name__}: {e}'
+        print(f'Finished: {error or "OK"}', flush=True)
+        send(done=True, error=error)
+
+    def build(self, boards, output, clean, progress, options):
+        """Builds `boards` like `main()`, on the warm worker pool.
+
+        Args:
+            boards: List of board names.
+            output: Output directory.
+            clean: If True, remove all previous outputs and rebuild everything.
+            progress: The progress callback of `Converter`.
+            options: A dict of keyword arguments of `Converter` from
+                `SERVER_BUILD_OPTIONS`.
+        """
+        formats = load_yaml(FORMAT_FILE)
+        self._check_fonts(formats[KEY_FONTS])
+        groups = group_boards(BOARDS_CONFIG_FILE, boards)
+        cache = None
+        if self.cache_size:
+            cache = render_cache.RenderCache(
+                os.path.join(output, CACHE_DIR_NAME), max_size=self.cache_size
+            )
+        sprite_store = {}
+        for board_config, group in groups:
+            board = group[0]
+            print('Building for ' + board)
+            converter = Converter(
+                board,
+                formats,
+                board_config,
+                output,
+                renderer=self.renderer,
+                rasterizer=self.rasterizer,
+                cache=cache,
+                sprite_store=sprite_store,
+                jobs=self.jobs,
+                executor=self.executor,
+                progress=progress,
+                **options,
+            )
+            converter.build(clean=clean)
+            for other_board in group[1:]:
+                print(f'Copying images of {board} to {other_board}')
+                copy_board_output(
+                    converter.output_dir, os.path.join(output, other_board)
+                )
+
+
+def _bind_server_socket(server, socket_path):
+    """Binds `server` to `socket_path`, replacing a stale socket file."""
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            try:
+                client.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)
+            else:
+                raise BuildImageError(
+                    f'A build server is already running on {socket_path}'
+                )
+    server.bind(socket_path)
+
+
+def request_build(socket_path, boards, clean=False, options=None):
+    """Sends a build request to a `BuildServer` and prints its output.
+
+    The output directory and the variables of `SERVER_ENV_VARS` are those of
+    this process.
+
+    Args:
+        socket_path: Path of the Unix socket of the server.
+        boards: List of board names.
+        clean: If True, remove all previous outputs and rebuild everything.
+        options: A dict of keyword arguments of `Converter` from
+            `SERVER_BUILD_OPTIONS`, or None for the defaults.
+
+    Returns:
+        The error message of the build, or None if it succeeded.
+    """
+    request = {
+        'boards': boards,
+        'output': os.path.abspath(OUTPUT_DIR),
+        'clean': clean,
+        'env': {key: os.environ.get(key) for key in SERVER_ENV_VARS},
+        'options': options or {},
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile('rwb') as stream:
+            stream.write(json.dumps(request).encode() + b'\n')
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if 'output' in message:
+                    print(message['output'], flush=True)
+                elif 'progress' in message:
+                    num_done, num_tasks = message['progress']
+                    print(f'Finished {num_done}/{num_tasks} tasks', flush=True)
+                if message.get('done'):
+                    return message['error']
+    raise BuildImageError('Build server closed the connection')
+
+
+def add_backend_arguments(parser):
+    """Adds the arguments selecting the backends of builds to `parser`."""
+    parser.add_argument(
+        '--renderer',
+        choices=sorted(renderers.RENDERERS),
+        help='Text renderer backend (default: pangocairo if available, '
+        'otherwise pango-view)',
+    )
+    parser.add_argument(
+        '--rasterizer',
+        choices=sorted(svg_rasterizers.RASTERIZERS),
+        help='SVG rasterizer backend (default: rsvg or cairosvg if available, '
+        'otherwise rsvg-convert)',
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=render_cache.DEFAULT_MAX_SIZE // (1024 * 1024),
+        help='Maximum size of the render cache in MiB (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Disable the render cache',
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='Number of worker processes (default: number of CPUs)',
+    )
+
+
+def add_board_arguments(parser):
+    """Adds the arguments selecting the boards to `parser`."""
+    parser.add_argument('board', nargs='?', help='Target board')
+    parser.add_argument(
+        '--boards',
+        help='Comma-separated list of target boards. Boards with equivalent '
+        'configs are built only once',
+    )
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help=f'Build all boards in {BOARDS_CONFIG_FILE}',
+    )
+
+
+def get_boards(parser, args):
+    """Gets the list of boards selected by `add_board_arguments()`."""
+    if sum(map(bool, (args.board, args.boards, args.all))) != 1:
+        parser.error('Specify exactly one of board, --boards and --all')
+    if args.all:
+        return load_board_names(BOARDS_CONFIG_FILE)
+    if args.boards:
+        return args.boards.split(',')
+    return [args.board]
+
+
+def merge_shards_main(argv):
+    """Merges the outputs of the shards of boards, see `--shard`."""
+    parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} {MERGE_SHARDS_COMMAND}',
+        description='Merge the outputs of all shards of the boards, built '
+        f'with --shard in {os.path.join(OUTPUT_DIR, shards.SHARDS_DIR_NAME)}, '
+        'into the board outputs',
+    )
+    add_board_arguments(parser)
+    args = parser.parse_args(argv)
+    boards = get_boards(parser, args)
+
+    formats = load_yaml(FORMAT_FILE)
+    for board_config, group in group_boards(BOARDS_CONFIG_FILE, boards):
+        board = group[0]
+        print('Merging shards of ' + board)
+        try:
+            shard_dirs, settings = shards.find_shards(OUTPUT_DIR, board)
+        except shards.ShardError as e:
+            raise BuildImageError(str(e)) from e
+        converter = Converter(board, formats, board_config, OUTPUT_DIR)
+        converter.merge_shards(shard_dirs, settings)
+        for other_board in group[1:]:
+            print(f'Copying images of {board} to {other_board}')
+            copy_board_output(
+                converter.output_dir, os.path.join(OUTPUT_DIR, other_board)
+            )
+
+
+def serve_main(argv):
+    """Runs the build server, see `BuildServer`."""
+    parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} {SERVE_COMMAND}',
+        description='Serve build requests on a Unix socket, keeping the '
+        'worker processes and the configs loaded between builds',
+    )
+    parser.add_argument(
+        '--socket',
+        default=DEFAULT_SERVER_SOCKET,
+        help='Path of the Unix socket (default: %(default)s)',
+    )
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = BuildServer(
+        jobs=args.jobs,
+        renderer=renderers.get_renderer(args.renderer),
+        rasterizer=svg_rasterizers.get_rasterizer(args.rasterizer),
+        cache_size=None if args.no_cache else args.cache_size * 1024 * 1024,
+    )
+    print('Text renderer: ' + server.renderer.NAME)
+    print('SVG rasterizer: ' + server.rasterizer.NAME)
+    try:
+        server.serve(args.socket)
+    except KeyboardInterrupt:
+        print('Server stopped')
 
 
 def main():
     """Builds bitmaps for firmware screens."""
+    if sys.argv[1:2] == [SERVE_COMMAND]:
+        serve_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == [MERGE_SHARDS_COMMAND]:
+        merge_shards_main(sys.argv[2:])
+        return
     parser = argparse.ArgumentParser()
-    parser.add_argument('board', help='Target board')
+    add_board_arguments(parser)
+    add_backend_arguments(parser)
+    parser.add_argument(
+        '--clean',
+        action='store_true',
+        help='Remove previous outputs and rebuild all images',
+    )
+    parser.add_argument(
+        '--search',
+        choices=search.MODES,
+        default=search.BISECT,
+        help='Mode of the DPI search. With interpolate, the search needs '
+        'fewer renders and finds the same DPIs (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--glyph-atlas',
+        action='store_true',
+        help='Render all glyphs at once and slice them from the atlas',
+    )
+    parser.add_argument(
+        '--check-glyph-atlas',
+        action='store_true',
+        help='With --glyph-atlas, check the sliced glyphs against glyphs '
+        'rendered one by one',
+    )
+    parser.add_argument(
+        '--bmp-compression',
+        choices=bmp.COMPRESSIONS,
+        default=bmp.COMPRESSION_NONE,
+        help='Compression of the bitmaps. RLE requires BI_RLE4/BI_RLE8 '
+        'support in the firmware (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--fit-budget',
+        type=int,
+        metavar='BYTES',
+        help='Search for the largest DPI, up to the DPI in boards.yaml, with '
+        'which the archives in RO CBFS fit in BYTES bytes',
+    )
+    parser.add_argument(
+        '--compare',
+        metavar='FILE',
+        help='Compare the size report of the board with a previous report '
+        f'FILE ({size_report.REPORT_FILE} in the board output directory) and '
+        'show the largest growth',
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Write a trace of the build phases, tasks, renders and commands '
+        'to FILE in Chrome trace event format',
+    )
+    parser.add_argument(
+        '--debug-stage',
+        action='store_true',
+        help='Store intermediate files of rendering in the stage directory',
+    )
+    parser.add_argument(
+        '--server',
+        metavar='SOCKET',
+        help=f'Send the build to a server started by "{SERVE_COMMAND}" on '
+        'SOCKET, which builds with its own --renderer, --rasterizer, --jobs, '
+        '--cache-size and --no-cache',
+    )
+    parser.add_argument(
+        '--shard',
+        metavar='K/N',
+        help='Build only shard K of N shards of the work items of the boards, '
+        f'in {os.path.join(OUTPUT_DIR, shards.SHARDS_DIR_NAME, "K-of-N")}, '
+        'for spreading the builds over N machines. The outputs of all shards '
+        f'are merged by "{MERGE_SHARDS_COMMAND}"',
+    )
+    parser.add_argument(
+        '--verify',
+        action='store_true',
+        help='Verify the outputs of previous builds of the boards instead of '
+        'building them, by parsing the bitmap headers only',
+    )
+    parser.add_argument(
+        '--probe-report',
+        metavar='FILE',
+        help='Write the number of renders by the searches for each image, '
+        'per board, to FILE as JSON',
+    )
     args = parser.parse_args()
-    board = args.board
-
-    with open(FORMAT_FILE, encoding='utf-8') as f:
-        formats = yaml.safe_load(f)
-    board_config = load_board_config(BOARDS_CONFIG_FILE, board)
+    boards = get_boards(parser, args)
+    shard = None
+    output = OUTPUT_DIR
+    if args.shard:
+        if args.fit_budget or args.compare or args.server or args.verify:
+            parser.error(
+                '--fit-budget, --compare, --server and --verify are not '
+                'supported with --shard'
+            )
+        try:
+            shard = shards.parse_shard(args.shard)
+        except shards.ShardError as e:
+            parser.error(str(e))
+        output = shards.get_shard_dir(OUTPUT_DIR, *shard)
+    if args.verify:
+        formats = load_yaml(FORMAT_FILE)
+        if verify_boards(boards, formats, args.jobs):
+            sys.exit(1)
+        return
+    if args.server:
+        if args.fit_budget or args.compare or args.trace or args.probe_report:
+            parser.error(
+                '--fit-budget, --compare, --trace and --probe-report are not '
+                'supported with --server'
+            )
+        if (
+            args.renderer
+            or args.rasterizer
+            or args.jobs
+            or args.no_cache
+            or args.cache_size != parser.get_default('cache_size')
+        ):
+            parser.error(
+                '--renderer, --rasterizer, --jobs, --cache-size and --no-cache '
+                f'are set by "{SERVE_COMMAND}" with --server'
+            )
+        options = {
+            'search_mode': args.search,
+            'glyph_atlas': args.glyph_atlas,
+            'check_glyph_atlas': args.check_glyph_atlas,
+            'debug_stage': args.debug_stage,
+            'bmp_compression': args.bmp_compression,
+        }
+        error = request_build(
+            args.server, boards, clean=args.clean, options=options
+        )
+        if error:
+            sys.exit(error)
+        return
+    if args.trace:
+        tracing.enable()
+    if args.compare and len(boards) > 1:
+        parser.error('--compare only supports a single board')
+    # Load the previous report now, since it may be overwritten by the build.
+    previous_report = None
+    if args.compare:
+        previous_report = size_report.load_report(args.compare)
+
+    formats = load_yaml(FORMAT_FILE)
+    groups = group_boards(BOARDS_CONFIG_FILE, boards)
+    if len(boards) > 1:
+        print(f'Building {len(boards)} boards in {len(groups)} groups')
 
-    print('Building for ' + board)
     check_fonts(formats[KEY_FONTS])
-    print('Output dir: ' + OUTPUT_DIR)
-    converter = Converter(board, formats, board_config, OUTPUT_DIR)
-    converter.build()
+    print('Output dir: ' + output)
+    renderer = renderers.get_renderer(args.renderer)
+    print('Text renderer: ' + renderer.NAME)
+    rasterizer = svg_rasterizers.get_rasterizer(args.rasterizer)
+    print('SVG rasterizer: ' + rasterizer.NAME)
+    cache = None
+    if not args.no_cache:
+        cache = render_cache.RenderCache(
+            os.path.join(OUTPUT_DIR, CACHE_DIR_NAME),
+            max_size=args.cache_size * 1024 * 1024,
+        )
+        print('Render cache dir: ' + cache.cache_dir)
+    search_probes = {}
+    sprite_store = {}
+    for board_config, group in groups:
+        board = group[0]
+        print('Building for ' + board)
+        converter = Converter(
+            board,
+            formats,
+            board_config,
+            output,
+            renderer=renderer,
+            rasterizer=rasterizer,
+            cache=cache,
+            search_mode=args.search,
+            sprite_store=sprite_store,
+            glyph_atlas=args.glyph_atlas,
+            check_glyph_atlas=args.check_glyph_atlas,
+            debug_stage=args.debug_stage,
+            bmp_compression=args.bmp_compression,
+            jobs=args.jobs,
+            shard=shard,
+        )
+        if args.fit_budget:
+            dpi, sizes = converter.fit_budget(args.fit_budget, clean=args.clean)
+            print_fit_result(board, dpi, sizes, args.fit_budget)
+        else:
+            converter.build(clean=args.clean)
+        search_probes[board] = converter.search_probes
+        if previous_report:
+            print(f'Size changes of {board} from {args.compare}:')
+            report = size_report.load_report(
+                os.path.join(converter.output_dir, size_report.REPORT_FILE)
+            )
+            for line in size_report.compare_reports(previous_report, report):
+                print(line)
+        for other_board in group[1:]:
+            print(f'Copying images of {board} to {other_board}')
+            copy_board_output(
+                converter.output_dir, os.path.join(output, other_board)
+            )
+
+    if args.probe_report:
+        with open(args.probe_report, 'w', encoding='utf-8') as f:
+            json.dump(search_probes, f, indent=1, sort_keys=True)
+
+    if args.trace:
+        tracing.save(args.trace)
+        print(f'Trace written to {args.trace}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Manifest of build outputs for incremental builds."""
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+# Bump this whenever the build pipeline changes in a way that affects the
+# output bitmaps, to force a full rebuild.
+MANIFEST_VERSION = 2
+
+MANIFEST_FILE = '.manifest.json'
+
+KEY_VERSION = 'version'
+KEY_OUTPUTS = 'outputs'
+
+
+class BuildManifest:
+    """Manifest mapping each output file to the digest of its inputs.
+
+    The manifest of the previous build is loaded from `<root>/.manifest.json`.
+    During the build, each output is checked by `is_up_to_date()`, which also
+    records the digest for the current build. Outputs recorded in the previous
+    manifest but not in the current one are orphans, which are removed by
+    `remove_orphans()`.
+
+    Attributes:
+        root: Root directory of the outputs. All output paths are relative to
+            this directory.
+        old_outputs: A dict of outputs and digests of the previous build.
+        outputs: A dict of outputs and digests of the current build.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.filename = os.path.join(root, MANIFEST_FILE)
+        self.old_outputs = {}
+        self.outputs = {}
+
+    def load(self):
+        """Loads the manifest of the previous build.
+
+        Returns:
+            True if a valid manifest is loaded, False otherwise.
+        """
+        try:
+            with open(self.filename, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get(KEY_VERSION) != MANIFEST_VERSION:
+            return False
+        self.old_outputs = data[KEY_OUTPUTS]
+        return True
+
+    def save(self):
+        """Saves the manifest of the current build atomically."""
+        data = {KEY_VERSION: MANIFEST_VERSION, KEY_OUTPUTS: self.outputs}
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.filename)
+
+    @classmethod
+    def make_digest(cls, **deps):
+        """Makes a digest of the inputs of an output.
+
+        All values must be JSON serializable.
+        """
+        data = json.dumps(deps, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def is_up_to_date(self, output, digest):
+        """Checks if `output` is up to date, and records its digest.
+
+        If `output` is out of date, the existing file is removed, so that it
+        can be safely regenerated even if it is hardlinked elsewhere.
+
+        Args:
+            output: Path of the output file, relative to `self.root`.
+            digest: Digest of the inputs, from `make_digest()`.
+
+        Returns:
+            True if the output exists and its inputs are unchanged since the
+            previous build.
+        """
+        self.record(output, digest)
+        path = os.path.join(self.root, output)
+        if self.old_outputs.get(output) == digest and os.path.exists(path):
+            return True
+        if os.path.lexists(path):
+            os.unlink(path)
+        return False
+
+    def record(self, output, digest):
+        """Records `output` with `digest` without checking it."""
+        self.outputs[output] = digest
+
+    def update(self, outputs):
+        """Records `outputs` checked in another process."""
+        self.outputs.update(outputs)
+
+    def remove_orphans(self):
+        """Removes outputs of the previous build that are no longer generated.
+
+        Directories left empty are removed as well.
+
+        Returns:
+            A sorted list of removed outputs.
+        """
+        orphans = sorted(set(self.old_outputs) - set(self.outputs))
+        root = os.path.normpath(self.root)
+        for output in orphans:
+            path = os.path.join(self.root, output)
+            if os.path.lexists(path):
+                os.unlink(path)
+            dirname = os.path.normpath(os.path.dirname(path))
+            while dirname != root and os.path.isdir(dirname):
+                if os.listdir(dirname):
+                    break
+                os.rmdir(dirname)
+                dirname = os.path.dirname(dirname)
+        return orphans
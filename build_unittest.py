@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tests for build.py.
+
+The images are rendered by the stub renderer and rasterizer of benchmark.py,
+so the tests do not need the fonts.
+"""
+
+import collections
+import glob
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import yaml
+
+import benchmark
+import bmp
+import build
+import search
+
+
+# Sample board and locales of different scripts.
+BOARD = 'asurada'
+LOCALES = ['en', 'ru', 'ja', 'ar', 'hi', 'th']
+
+
+def load_formats():
+    """Loads the format config."""
+    with open(
+        os.path.join(build.SCRIPT_BASE, build.FORMAT_FILE), encoding='utf-8'
+    ) as f:
+        return yaml.safe_load(f)
+
+
+def load_board_config(board):
+    """Loads the config of `board`."""
+    return build.load_board_config(
+        os.path.join(build.SCRIPT_BASE, build.BOARDS_CONFIG_FILE), board
+    )
+
+
+class StubTestCase(unittest.TestCase):
+    """Base class of tests building images with the stubs."""
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {'PHYSICAL_PRESENCE': 'keyboard'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            build, 'get_font_hash', benchmark._get_stub_font_hash
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir = tmp_dir.name
+        self.addCleanup(tmp_dir.cleanup)
+        self.formats = load_formats()
+
+    def create_converter(self, output_dir, board=BOARD, **kwargs):
+        """Creates a `build.Converter` rendering with the stubs."""
+        return build.Converter(
+            board,
+            self.formats,
+            load_board_config(board),
+            output_dir,
+            renderer=benchmark.StubRenderer(),
+            rasterizer=benchmark.StubRasterizer(),
+            jobs=1,
+            **kwargs,
+        )
+
+
+class SearchModeTest(StubTestCase):
+    """Tests the search modes."""
+
+    def get_search_results(self, mode):
+        """Converts all strings of `LOCALES` in search mode `mode`.
+
+        Returns:
+            A dict mapping each (locale, name) to the (`eff_dpi`, `width_pt`)
+            chosen for it.
+        """
+        output_dir = os.path.join(self.tmp_dir, mode)
+        converter = self.create_converter(output_dir, search_mode=mode)
+        styles = self.formats[build.KEY_STYLES]
+        fonts = self.formats[build.KEY_FONTS]
+        names = self.formats[build.KEY_LOCALIZED_FILES]
+        results = {}
+        for locale in LOCALES:
+            strings = converter.load_locale_strings(locale)
+            font = fonts.get(locale, fonts[build.KEY_DEFAULT])
+            locale_dir = os.path.join(output_dir, locale)
+            os.makedirs(locale_dir)
+            for name, category in names.items():
+                style = build.get_config_with_defaults(styles, category)
+                results[locale, name] = converter.convert_text_to_image(
+                    locale,
+                    strings[name],
+                    os.path.join(locale_dir, name + '.bmp'),
+                    font,
+                    converter.text_max_colors,
+                    height=style[build.KEY_HEIGHT],
+                    max_width=style[build.KEY_MAX_WIDTH],
+                    dpi=converter.config[build.KEY_DPI],
+                    bgcolor=style[build.KEY_BGCOLOR],
+                    fgcolor=style[build.KEY_FGCOLOR],
+                )
+        return results
+
+    def test_modes_choose_same_results(self):
+        bisect_results = self.get_search_results(search.BISECT)
+        interpolate_results = self.get_search_results(search.INTERPOLATE)
+        self.assertEqual(interpolate_results, bisect_results)
+
+
+def hash_files(top):
+    """Hashes all files under directory `top`.
+
+    Returns:
+        A dict mapping the paths relative to `top` to the SHA-256 digests of
+        the contents.
+    """
+    files = {}
+    for root, _, names in os.walk(top):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, top)] = hashlib.sha256(
+                    f.read()
+                ).hexdigest()
+    return files
+
+
+class SharedStringsTest(StubTestCase):
+    """Tests the sharing of identical strings between locales."""
+
+    def test_shaping_classes(self):
+        self.assertEqual(build.Converter.get_shaping_class('es-419'), 'es')
+        self.assertEqual(
+            build.Converter.get_shaping_class('sr-Latn'), 'sr-Latn'
+        )
+        self.assertEqual(build.Converter.get_shaping_class('zh-TW'), 'zh-TW')
+        # Locales of different languages are never in the same class.
+        xtb_files = glob.glob(
+            os.path.join(build.SCRIPT_BASE, 'strings', 'locale', '*.xtb')
+        )
+        locales = [
+            os.path.splitext(os.path.basename(path))[0].split('_')[-1]
+            for path in xtb_files
+        ]
+        languages = collections.defaultdict(set)
+        for locale in locales:
+            languages[build.Converter.get_shaping_class(locale)].add(
+                locale.split('-')[0]
+            )
+        for shaping_class, class_languages in languages.items():
+            self.assertEqual(len(class_languages), 1, shaping_class)
+
+    def test_only_same_language_shares_images(self):
+        with mock.patch.dict(
+            os.environ, {'LOCALES': 'en de fr nl es es-419 pt-BR pt-PT'}
+        ):
+            converter = self.create_converter(self.tmp_dir)
+        converter.build(clean=True)
+        # Map each image to the locales of its hardlinks.
+        image_locales = collections.defaultdict(set)
+        for path in glob.glob(
+            os.path.join(converter.output_ro_dir, '*', '*.bmp')
+        ):
+            locale = os.path.basename(os.path.dirname(path))
+            image_locales[os.stat(path).st_ino].add(locale)
+        shared = [
+            locales for locales in image_locales.values() if len(locales) > 1
+        ]
+        self.assertIn({'es', 'es-419'}, shared)
+        for locales in shared:
+            self.assertEqual(
+                len({locale.split('-')[0] for locale in locales}), 1, locales
+            )
+
+
+class BuildServerTest(StubTestCase):
+    """Tests builds on `build.BuildServer`."""
+
+    # Options differing from the defaults of `build.Converter`.
+    OPTIONS = {
+        'search_mode': search.INTERPOLATE,
+        'glyph_atlas': True,
+        'debug_stage': True,
+        'bmp_compression': bmp.COMPRESSION_RLE,
+    }
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(os.environ, {'LOCALES': 'en ru'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The fonts are not used by the stubs.
+        patcher = mock.patch.object(build, 'check_fonts')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def build_on_server(self, output, options):
+        """Builds `BOARD` in `output` on a server with `options`."""
+        server = build.BuildServer(
+            jobs=1,
+            renderer=benchmark.StubRenderer(),
+            rasterizer=benchmark.StubRasterizer(),
+            cache_size=None,
+        )
+        socket_path = output + '.sock'
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(socket_path)
+            sock.listen()
+
+            def serve_one():
+                connection, _ = sock.accept()
+                with connection, connection.makefile('rwb') as stream:
+                    server.handle(stream)
+
+            thread = threading.Thread(target=serve_one)
+            thread.start()
+            # The server redirects the output of the build to the client, which
+            # prints it, so printing is disabled for both.
+            with mock.patch.object(build, 'OUTPUT_DIR', output), mock.patch(
+                'builtins.print'
+            ):
+                error = build.request_build(
+                    socket_path, [BOARD], clean=True, options=options
+                )
+            thread.join()
+        self.assertIsNone(error)
+
+    def test_server_build_matches_local_build(self):
+        local_output = os.path.join(self.tmp_dir, 'local')
+        self.create_converter(local_output, **self.OPTIONS).build(clean=True)
+        server_output = os.path.join(self.tmp_dir, 'server')
+        self.build_on_server(server_output, self.OPTIONS)
+        self.assertEqual(hash_files(server_output), hash_files(local_output))
+
+    def test_options_change_server_build(self):
+        default_output = os.path.join(self.tmp_dir, 'default')
+        self.build_on_server(default_output, {})
+        output = os.path.join(self.tmp_dir, 'options')
+        self.build_on_server(output, self.OPTIONS)
+        self.assertNotEqual(hash_files(output), hash_files(default_output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Compressor and decompressor of the LZ4 block format.
+
+The block format is described in
+https://github.com/lz4/lz4/blob/dev/doc/lz4_Block_format.md. The compressor is
+a plain greedy matcher, which always produces the same blocks, so that
+compressed archives are reproducible. Blocks are decompressed by the `lz4`
+package if installed, and otherwise by the reference decoder in this module.
+"""
+
+try:
+    import lz4.block as _lz4
+except ImportError:
+    _lz4 = None
+
+
+# Minimum length of a match.
+_MIN_MATCH = 4
+# Maximum offset of a match.
+_MAX_OFFSET = 0xFFFF
+# The last bytes of a block are always literals.
+_LAST_LITERALS = 5
+# The last match must start at least this many bytes before the end.
+_MF_LIMIT = 12
+# Lengths of 15 or more in the token are continued in extra bytes.
+_RUN_MASK = 15
+# Step sizes of comparing the data when extending a match.
+_EXTEND_STEPS = (4096, 256, 16, 1)
+
+# Name of the decoder used by `decompress()`.
+DECODER = 'lz4.block' if _lz4 else 'python'
+
+
+class Lz4Error(Exception):
+    """Exception for invalid LZ4 blocks."""
+
+
+def _write_length(out, length):
+    """Writes the extra bytes of a literal or match length of 15 or more."""
+    length -= _RUN_MASK
+    while length >= 255:
+        out.append(255)
+        length -= 255
+    out.append(length)
+
+
+def _write_sequence(out, literals, offset, match_length):
+    """Writes a sequence, which has no match if `match_length` is 0."""
+    literal_length = len(literals)
+    match_code = match_length - _MIN_MATCH if match_length else 0
+    out.append(
+        (min(literal_length, _RUN_MASK) << 4) | min(match_code, _RUN_MASK)
+    )
+    if literal_length >= _RUN_MASK:
+        _write_length(out, literal_length)
+    out += literals
+    if match_length:
+        out += offset.to_bytes(2, 'little')
+        if match_code >= _RUN_MASK:
+            _write_length(out, match_code)
+
+
+def compress(data):
+    """Compresses `data` into an LZ4 block.
+
+    Returns:
+        The block as bytes. Its size is not stored, see `decompress()`.
+    """
+    data = bytes(data)
+    size = len(data)
+    out = bytearray()
+    anchor = 0
+    if size > _MF_LIMIT:
+        match_limit = size - _LAST_LITERALS
+        # Last position of each 4-byte sequence.
+        positions = {}
+        pos = 0
+        while pos < size - _MF_LIMIT:
+            sequence = data[pos : pos + _MIN_MATCH]
+            ref = positions.get(sequence)
+            positions[sequence] = pos
+            if ref is None or pos - ref > _MAX_OFFSET:
+                pos += 1
+                continue
+
+            length = _MIN_MATCH
+            for step in _EXTEND_STEPS:
+                while (
+                    pos + length + step <= match_limit
+                    and data[ref + length : ref + length + step]
+                    == data[pos + length : pos + length + step]
+                ):
+                    length += step
+            _write_sequence(out, data[anchor:pos], pos - ref, length)
+            pos += length
+            anchor = pos
+    _write_sequence(out, data[anchor:], 0, 0)
+    return bytes(out)
+
+
+def _read_length(data, pos, length):
+    """Reads the extra bytes of a length starting at `pos`.
+
+    Returns:
+        A tuple of the length and the position after it.
+    """
+    if length == _RUN_MASK:
+        while True:
+            byte = data[pos]
+            pos += 1
+            length += byte
+            if byte != 255:
+                break
+    return length, pos
+
+
+def decompress_reference(data, size):
+    """Decompresses an LZ4 block with the reference decoder of this module.
+
+    Args:
+        data: The LZ4 block.
+        size: Size of the decompressed data.
+
+    Returns:
+        The decompressed data as bytes.
+    """
+    out = bytearray()
+    pos = 0
+    try:
+        while True:
+            token = data[pos]
+            length, pos = _read_length(data, pos + 1, token >> 4)
+            if pos + length > len(data):
+                raise Lz4Error('Literals exceed block')
+            out += data[pos : pos + length]
+            pos += length
+            if pos == len(data):
+                break
+
+            offset = int.from_bytes(data[pos : pos + 2], 'little')
+            if not 0 < offset <= len(out):
+                raise Lz4Error(f'Invalid offset {offset}')
+            length, pos = _read_length(data, pos + 2, token & _RUN_MASK)
+            length += _MIN_MATCH
+            start = len(out) - offset
+            if length <= offset:
+                out += out[start : start + length]
+            else:
+                # The match overlaps the output, repeating the last bytes.
+                repeats, rest = divmod(length, offset)
+                chunk = out[start:]
+                out += chunk * repeats + chunk[:rest]
+            if len(out) > size:
+                raise Lz4Error('Decompressed data exceeds size')
+    except IndexError as e:
+        raise Lz4Error('Truncated block') from e
+    if len(out) != size:
+        raise Lz4Error(f'Decompressed size {len(out)} != {size}')
+    return bytes(out)
+
+
+def decompress(data, size):
+    """Decompresses an LZ4 block.
+
+    Args:
+        data: The LZ4 block.
+        size: Size of the decompressed data.
+
+    Returns:
+        The decompressed data as bytes.
+    """
+    if _lz4 is None:
+        return decompress_reference(data, size)
+    try:
+        out = _lz4.decompress(data, uncompressed_size=size)
+    except _lz4.LZ4BlockError as e:
+        raise Lz4Error(str(e)) from e
+    if len(out) != size:
+        raise Lz4Error(f'Decompressed size {len(out)} != {size}')
+    return out
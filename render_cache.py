@@ -0,0 +1,160 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Persistent content-addressed cache of rendered bitmaps."""
+
+from collections import Counter
+import hashlib
+import json
+import os
+import tempfile
+
+
+# Bump this whenever the rendering pipeline changes in a way that affects the
+# output bitmaps, to invalidate all existing cache entries.
+CACHE_VERSION = 2
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+BMP_SUFFIX = '.bmp'
+METADATA_SUFFIX = '.json'
+
+STAT_HITS = 'hits'
+STAT_MISSES = 'misses'
+
+
+def hash_bytes(data):
+    """Returns the hex SHA-256 digest of `data`."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(filename):
+    """Returns the hex SHA-256 digest of the content of `filename`."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Cache of rendered bitmaps, keyed by a hash of all rendering parameters.
+
+    Each entry consists of a BMP file and a JSON file of metadata (such as the
+    effective DPI found by the search), stored as
+    `<cache_dir>/<key[:2]>/<key>.{bmp,json}`. Entries are written atomically so
+    that the cache can be shared by concurrent worker processes. The least
+    recently used entries are evicted by `trim()` when the total size exceeds
+    `max_size`.
+
+    Attributes:
+        cache_dir: Directory of the cache.
+        max_size: Maximum total size in bytes.
+        stats: A Counter of cache hits and misses in this process.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.stats = Counter()
+
+    @classmethod
+    def make_key(cls, **params):
+        """Makes a cache key from the keyword arguments.
+
+        All values must be JSON serializable.
+        """
+        params['_version'] = CACHE_VERSION
+        data = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hash_bytes(data.encode('utf-8'))
+
+    def _get_path(self, key, suffix):
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def get(self, key, output_file):
+        """Looks up `key` and copies the cached bitmap to `output_file`.
+
+        Returns:
+            The metadata dict of the entry, or None if `key` is not found.
+        """
+        bmp_path = self._get_path(key, BMP_SUFFIX)
+        metadata_path = self._get_path(key, METADATA_SUFFIX)
+        try:
+            with open(metadata_path, encoding='utf-8') as f:
+                metadata = json.load(f)
+            with open(bmp_path, 'rb') as f:
+                data = f.read()
+            # Replace the output rather than writing it in place, since it may
+            # be hardlinked to the output of another board.
+            self._write_atomic(output_file, data)
+        except (OSError, ValueError):
+            self.stats[STAT_MISSES] += 1
+            return None
+        # Update modification times for LRU eviction.
+        for path in (bmp_path, metadata_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        self.stats[STAT_HITS] += 1
+        return metadata
+
+    def _write_atomic(self, path, data):
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def put(self, key, bmp_file, metadata=None):
+        """Adds `bmp_file` with `metadata` to the cache as `key`."""
+        with open(bmp_file, 'rb') as f:
+            data = f.read()
+        self._write_atomic(self._get_path(key, BMP_SUFFIX), data)
+        # The metadata file is written last, marking the entry complete.
+        self._write_atomic(
+            self._get_path(key, METADATA_SUFFIX),
+            json.dumps(metadata or {}).encode('utf-8'),
+        )
+
+    def trim(self):
+        """Evicts least recently used entries until within `max_size`.
+
+        Returns:
+            The number of evicted entries.
+        """
+        entries = {}
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.startswith('.tmp'):
+                    continue
+                key, _ = os.path.splitext(filename)
+                path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                mtime, size = entries.get(key, (0, 0))
+                entries[key] = (max(mtime, st.st_mtime), size + st.st_size)
+
+        total_size = sum(size for _, size in entries.values())
+        num_evicted = 0
+        for key, (_, size) in sorted(entries.items(), key=lambda x: x[1][0]):
+            if total_size <= self.max_size:
+                break
+            for suffix in (METADATA_SUFFIX, BMP_SUFFIX):
+                try:
+                    os.unlink(self._get_path(key, suffix))
+                except OSError:
+                    pass
+            total_size -= size
+            num_evicted += 1
+        return num_evicted
@@ -0,0 +1,399 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Text renderer backends for converting strings to images."""
+
+from collections import namedtuple
+import io
+import os
+import subprocess
+import tempfile
+
+from PIL import Image
+
+import tracing
+
+try:
+    import cairo
+    import gi
+
+    gi.require_version('Pango', '1.0')
+    gi.require_version('PangoCairo', '1.0')
+    gi.require_foreign('cairo')
+    from gi.repository import Pango
+    from gi.repository import PangoCairo
+except (ImportError, ValueError):
+    cairo = None
+    Pango = None
+    PangoCairo = None
+
+
+# pango-view's default DPI.
+DEFAULT_DPI = 96
+
+# Text rendered by `TextRenderer.warm_up()` with each font.
+WARM_UP_TEXT = 'Aa'
+
+# The PangoCairo font map of this process as a tuple (pid, font map), shared by
+# all renderers, so that the fonts loaded for one build are reused by the next
+# builds in a long-running worker process.
+_font_map = None
+
+# Rendered text.
+#   image: PIL image in RGB mode, or None if nothing was rendered (which may
+#     happen with very small DPI).
+#   extents: (x, y, width, height) of the image in layout coordinates, in
+#     pixels.
+RenderedText = namedtuple('RenderedText', ['image', 'extents'])
+
+
+class RendererError(Exception):
+    """Exception for errors generated by text renderers."""
+
+
+def get_font_spec(font, height):
+    """Gets the Pango font description string for `font` at `height`."""
+    # Font size should be proportional to the height. Here we use 2 as the
+    # divisor so that setting dpi to 96 (pango-view's default) in boards.yaml
+    # will be roughly equivalent to setting the screen resolution to 1366x768.
+    font_size = height / 2
+    return f'{font} {font_size!r}'
+
+
+def run_pango_view(
+    input_file,
+    output_file,
+    locale,
+    font,
+    height,
+    width_pt,
+    dpi,
+    bgcolor,
+    fgcolor,
+    hinting='full',
+):
+    """Runs pango-view."""
+    command = ['pango-view', '-q']
+    if locale:
+        command += ['--language', locale]
+
+    command += ['--font', get_font_spec(font, height)]
+
+    if width_pt:
+        command.append(f'--width={width_pt:d}')
+    if dpi:
+        command.append(f'--dpi={dpi:d}')
+    command.append('--margin=0')
+    command += ['--background', bgcolor]
+    command += ['--foreground', fgcolor]
+    command += ['--hinting', hinting]
+
+    command += ['--output', output_file]
+    command.append(input_file)
+
+    with tracing.span(
+        'pango-view', 'subprocess', locale=locale, font=font, dpi=dpi
+    ):
+        subprocess.check_call(command, stdout=subprocess.PIPE)
+
+
+class TextRenderer:
+    """Base class of text renderers.
+
+    Renderers must be picklable, because they are shipped to the worker
+    processes together with the converter. Any per-process state (such as
+    loaded fonts) should be created lazily.
+    """
+
+    NAME = None
+
+    def render(
+        self,
+        text,
+        locale,
+        font,
+        height,
+        width_pt,
+        dpi,
+        bgcolor,
+        fgcolor,
+        hinting='full',
+    ):
+        """Renders `text` into an in-memory image.
+
+        Args:
+            text: The text to render.
+            locale: Locale (language) to select implicit rendering options. None
+                for locale-independent strings.
+            font: Font name.
+            height: Image height relative to the screen resolution.
+            width_pt: Width in points for wrapping lines. 0 or None to disable
+                line wrapping.
+            dpi: DPI for rendering. None for the renderer's default.
+            bgcolor: Background color (#rrggbb).
+            fgcolor: Foreground color (#rrggbb).
+            hinting: Font hinting, either 'full' or 'none'.
+
+        Returns:
+            A `RenderedText` object.
+        """
+        raise NotImplementedError
+
+    def render_svg(self, text, locale, font, height, bgcolor, fgcolor):
+        """Renders `text` into an SVG document without hinting.
+
+        Returns:
+            The SVG document as bytes.
+        """
+        raise NotImplementedError
+
+    def warm_up(self, fonts):
+        """Loads `fonts` in this process ahead of the first render.
+
+        This does nothing by default. Renderers keeping per-process state
+        should load the fonts.
+
+        Args:
+            fonts: List of font names.
+        """
+
+
+class PangoViewRenderer(TextRenderer):
+    """Renderer running the pango-view command for each image."""
+
+    NAME = 'pango-view'
+
+    @classmethod
+    def _write_text(cls, text, temp_dir):
+        text_file = os.path.join(temp_dir, 'input.txt')
+        with open(text_file, 'w', encoding='utf-8-sig') as f:
+            f.write(text + '\n')
+        return text_file
+
+    def render(
+        self,
+        text,
+        locale,
+        font,
+        height,
+        width_pt,
+        dpi,
+        bgcolor,
+        fgcolor,
+        hinting='full',
+    ):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            text_file = self._write_text(text, temp_dir)
+            png_file = os.path.join(temp_dir, 'output.png')
+            run_pango_view(
+                text_file,
+                png_file,
+                locale,
+                font,
+                height,
+                width_pt,
+                dpi,
+                bgcolor,
+                fgcolor,
+                hinting=hinting,
+            )
+            # With small DPI, pango-view may generate an empty file
+            if os.path.getsize(png_file) == 0:
+                return RenderedText(None, (0, 0, 0, 0))
+            with Image.open(png_file) as image:
+                image.load()
+                width, height_px = image.size
+                return RenderedText(image, (0, 0, width, height_px))
+
+    def render_svg(self, text, locale, font, height, bgcolor, fgcolor):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            text_file = self._write_text(text, temp_dir)
+            svg_file = os.path.join(temp_dir, 'output.svg')
+            run_pango_view(
+                text_file,
+                svg_file,
+                locale,
+                font,
+                height,
+                0,
+                None,
+                bgcolor,
+                fgcolor,
+                hinting='none',
+            )
+            with open(svg_file, 'rb') as f:
+                return f.read()
+
+
+class PangoCairoRenderer(TextRenderer):
+    """Renderer using PangoCairo in-process via GObject introspection.
+
+    This produces the same layout as pango-view (which is itself built on
+    PangoCairo), but avoids starting a new process and reloading fontconfig
+    and fonts for every image.
+    """
+
+    NAME = 'pangocairo'
+
+    _HINT_STYLES = {
+        'full': 'HINT_STYLE_FULL',
+        'none': 'HINT_STYLE_NONE',
+    }
+
+    def __init__(self):
+        if not self.is_available():
+            raise RendererError(
+                'PangoCairo is not available; install PyGObject and pycairo'
+            )
+
+    @classmethod
+    def is_available(cls):
+        """Returns True if the PangoCairo bindings can be imported."""
+        return Pango is not None
+
+    @classmethod
+    def _parse_color(cls, color):
+        """Converts '#rrggbb' to a tuple of floats for cairo."""
+        value = color.lstrip('#')
+        return tuple(int(value[i : i + 2], 16) / 255 for i in (0, 2, 4))
+
+    @classmethod
+    def _get_font_map(cls):
+        """Gets the font map of this process, which is created lazily."""
+        global _font_map  # pylint: disable=global-statement
+        # A font map inherited from the parent process is not reused.
+        if _font_map is None or _font_map[0] != os.getpid():
+            _font_map = (os.getpid(), PangoCairo.FontMap.new())
+        return _font_map[1]
+
+    def _create_layout(
+        self, text, locale, font, height, width_pt, dpi, hinting
+    ):
+        """Creates a Pango layout following pango-view's setup."""
+        dpi = dpi or DEFAULT_DPI
+        context = self._get_font_map().create_context()
+        PangoCairo.context_set_resolution(context, dpi)
+        font_options = cairo.FontOptions()
+        font_options.set_hint_style(getattr(cairo, self._HINT_STYLES[hinting]))
+        PangoCairo.context_set_font_options(context, font_options)
+        if locale:
+            context.set_language(Pango.Language.from_string(locale))
+
+        layout = Pango.Layout.new(context)
+        layout.set_font_description(
+            Pango.FontDescription.from_string(get_font_spec(font, height))
+        )
+        if width_pt:
+            layout.set_width((width_pt * dpi * Pango.SCALE + 36) // 72)
+        layout.set_text(text, -1)
+        return layout, dpi
+
+    @classmethod
+    def _get_extents(cls, layout):
+        """Gets the (x, y, width, height) of the output image of `layout`.
+
+        Like pango-view, the image spans the whole layout width when lines are
+        wrapped, so that the alignment of the text is kept.
+        """
+        _, logical = layout.get_pixel_extents()
+        if layout.get_width() > 0:
+            width = -(-layout.get_width() // Pango.SCALE)
+            width = max(width, logical.x + logical.width)
+            return 0, logical.y, width, logical.height
+        return logical.x, logical.y, logical.width, logical.height
+
+    def _draw(self, cr, layout, extents, bgcolor, fgcolor):
+        """Draws `layout` on cairo context `cr` with `extents` at (0, 0)."""
+        cr.set_source_rgb(*self._parse_color(bgcolor))
+        cr.paint()
+        cr.set_source_rgb(*self._parse_color(fgcolor))
+        cr.move_to(-extents[0], -extents[1])
+        PangoCairo.show_layout(cr, layout)
+
+    def render(
+        self,
+        text,
+        locale,
+        font,
+        height,
+        width_pt,
+        dpi,
+        bgcolor,
+        fgcolor,
+        hinting='full',
+    ):
+        layout, _ = self._create_layout(
+            text, locale, font, height, width_pt, dpi, hinting
+        )
+        extents = self._get_extents(layout)
+        _, _, width, height_px = extents
+        if width <= 0 or height_px <= 0:
+            return RenderedText(None, extents)
+
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height_px)
+        self._draw(cairo.Context(surface), layout, extents, bgcolor, fgcolor)
+        surface.flush()
+        # FORMAT_RGB24 is stored as native-endian 32-bit words, i.e. BGRX on
+        # little-endian hosts.
+        image = Image.frombuffer(
+            'RGB',
+            (width, height_px),
+            bytes(surface.get_data()),
+            'raw',
+            'BGRX',
+            surface.get_stride(),
+            1,
+        )
+        return RenderedText(image, extents)
+
+    def render_svg(self, text, locale, font, height, bgcolor, fgcolor):
+        layout, dpi = self._create_layout(
+            text, locale, font, height, 0, None, 'none'
+        )
+        extents = self._get_extents(layout)
+        scale = 72 / dpi
+        output = io.BytesIO()
+        surface = cairo.SVGSurface(
+            output, extents[2] * scale, extents[3] * scale
+        )
+        cr = cairo.Context(surface)
+        cr.scale(scale, scale)
+        self._draw(cr, layout, extents, bgcolor, fgcolor)
+        surface.finish()
+        return output.getvalue()
+
+    def warm_up(self, fonts):
+        for font in fonts:
+            # Laying out text loads the font and its fallbacks.
+            layout, _ = self._create_layout(
+                WARM_UP_TEXT, None, font, 24, 0, None, 'full'
+            )
+            layout.get_pixel_extents()
+
+
+RENDERERS = {
+    PangoCairoRenderer.NAME: PangoCairoRenderer,
+    PangoViewRenderer.NAME: PangoViewRenderer,
+}
+
+
+def get_renderer(name=None):
+    """Creates a text renderer.
+
+    Args:
+        name: Name of the renderer backend (a key of `RENDERERS`). If None,
+            the in-process PangoCairo renderer is used when available, and
+            pango-view otherwise.
+
+    Returns:
+        A `TextRenderer` instance.
+    """
+    if name is None:
+        if PangoCairoRenderer.is_available():
+            name = PangoCairoRenderer.NAME
+        else:
+            name = PangoViewRenderer.NAME
+    if name not in RENDERERS:
+        raise RendererError(f'Unknown renderer {name!r}')
+    return RENDERERS[name]()
@@ -0,0 +1,187 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Probing of monotone functions for the DPI and width searches."""
+
+import math
+
+
+# Plain bisection: every comparison probes the function.
+BISECT = 'bisect'
+# Comparisons are inferred from known values where possible, and the points to
+# probe are predicted by linear interpolation.
+INTERPOLATE = 'interpolate'
+
+MODES = (BISECT, INTERPOLATE)
+
+
+class Prober:
+    """Memoizing prober of a non-decreasing integer function.
+
+    The searches in build.py only look at how the function value compares to a
+    target, through `compare()`. In `INTERPOLATE` mode, a comparison whose
+    result follows from the known values (assuming the function is
+    non-decreasing) is answered without probing. Otherwise, before probing the
+    requested point, the point where the function is predicted to cross the
+    target is probed, which often decides the requested comparison as well as
+    many of the following ones. If the function is non-decreasing, a search
+    takes the same path, and returns the same result, as with `BISECT` mode,
+    but with fewer probes. To guard against functions that are not quite
+    non-decreasing, the probed values are checked, and `run()` repeats the
+    search in `BISECT` mode if they are not. Functions that are known not to be
+    non-decreasing should be probed in `BISECT` mode.
+
+    Attributes:
+        func: The function to probe.
+        mode: One of `MODES`.
+        min_x: Minimum valid argument of `func`.
+        values: A dict mapping each probed argument to its value.
+        num_probes: Number of calls of `func`.
+        last_x: Argument of the last call of `func`.
+        monotone: False if the probed values are not non-decreasing.
+    """
+
+    def __init__(self, func, mode=BISECT, min_x=1):
+        if mode not in MODES:
+            raise ValueError(f'Unknown search mode {mode!r}')
+        self.func = func
+        self.mode = mode
+        self.min_x = min_x
+        self.values = {}
+        self.num_probes = 0
+        self.last_x = None
+        self.monotone = True
+
+    def _probe(self, x):
+        value = self.func(x)
+        if any(
+            (y < x and v > value) or (y > x and v < value)
+            for y, v in self.values.items()
+        ):
+            self.monotone = False
+        self.values[x] = value
+        self.num_probes += 1
+        self.last_x = x
+        return value
+
+    def get(self, x):
+        """Gets the value at `x`, probing only if it is not known yet."""
+        if x in self.values:
+            return self.values[x]
+        return self._probe(x)
+
+    def finalize(self, x):
+        """Makes `x` the last probed argument.
+
+        This keeps any side effect of `func` (such as the generated image)
+        consistent with the result of the search.
+        """
+        if self.last_x != x:
+            self._probe(x)
+
+    def _infer(self, x, target):
+        """Infers the result of `compare()` from the known values.
+
+        Returns:
+            -1, 0 or 1, or None if the result cannot be inferred.
+        """
+        lower = [v for y, v in self.values.items() if y <= x]
+        upper = [v for y, v in self.values.items() if y >= x]
+        if upper and min(upper) < target:
+            return -1
+        if lower and max(lower) > target:
+            return 1
+        if lower and upper and max(lower) == min(upper) == target:
+            return 0
+        return None
+
+    def _predict(self, x, target):
+        """Predicts a point to probe for deciding the comparison at `x`.
+
+        The function is linearly interpolated (or extrapolated) between the
+        known points closest to `target`. If `x` is predicted to be below
+        (above) `target`, the largest (smallest) point predicted to be below
+        (above) `target` is returned, so that probing it decides as many
+        comparisons as possible.
+
+        Returns:
+            The point to probe, or None if `x` itself should be probed.
+        """
+        points = sorted(self.values.items())
+        lower = [p for p in points if p[1] <= target]
+        upper = [p for p in points if p[1] > target]
+        if lower and upper:
+            (x0, v0), (x1, v1) = lower[-1], upper[0]
+        elif upper:
+            (x0, v0), (x1, v1) = (0, 0), upper[0]
+        elif len(lower) >= 2:
+            (x0, v0), (x1, v1) = lower[-2], lower[-1]
+        elif lower:
+            (x0, v0), (x1, v1) = (0, 0), lower[-1]
+        else:
+            return None
+        if x1 == x0 or v1 <= v0:
+            return None
+        slope = (v1 - v0) / (x1 - x0)
+        max_below = math.ceil(x0 + (target - 0.5 - v0) / slope) - 1
+        min_above = math.floor(x0 + (target + 0.5 - v0) / slope) + 1
+
+        known_left = [y for y, _ in points if y < x]
+        known_right = [y for y, _ in points if y > x]
+        if x <= max_below:
+            guess = max_below
+            if known_right:
+                guess = min(guess, known_right[0] - 1)
+        elif x >= min_above:
+            guess = max(min_above, self.min_x)
+            if known_left:
+                guess = max(guess, known_left[-1] + 1)
+        else:
+            return None
+        if guess == x:
+            return None
+        return guess
+
+    def compare(self, x, target):
+        """Compares the value at `x` with `target`.
+
+        Returns:
+            -1, 0 or 1 if the value is less than, equal to or greater than
+            `target`, respectively.
+        """
+        if self.mode == INTERPOLATE:
+            result = self._infer(x, target)
+            if result is not None:
+                return result
+            guess = self._predict(x, target)
+            if guess is not None:
+                self.get(guess)
+                result = self._infer(x, target)
+                if result is not None:
+                    return result
+        value = self.get(x)
+        return (value > target) - (value < target)
+
+
+def run(search, prober):
+    """Runs `search(prober)`, falling back to bisection if needed.
+
+    In `INTERPOLATE` mode, comparisons inferred before the probes showed that
+    the function is not non-decreasing may be wrong. In that case, the search is
+    run again in `BISECT` mode, which reuses the probed values, so that it
+    returns the same result as a search in `BISECT` mode.
+
+    Args:
+        search: A function searching with the `Prober` passed to it, and
+            returning the result.
+        prober: The `Prober` to search with.
+
+    Returns:
+        The result of `search`.
+    """
+    result = search(prober)
+    if prober.mode == INTERPOLATE and not prober.monotone:
+        prober.mode = BISECT
+        result = search(prober)
+    return result
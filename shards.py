@@ -0,0 +1,159 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Partitioning of the build of a board into shards.
+
+The build of a board can be spread over several machines, each building one
+shard: a subset of the sprites, strings and glyphs of the board, chosen by
+`ShardPlanner` from estimates of their costs, so that the shards take about the
+same time. Every machine plans the same shards from the same inputs, hence the
+shards are disjoint and cover the whole build. The outputs of the shards are
+then merged into the board output by `build.py merge-shards`.
+"""
+
+import glob
+import json
+import os
+import re
+
+
+# Directory of the shard outputs under the output directory.
+SHARDS_DIR_NAME = '.shards'
+# File describing the shard in the board output directory of a shard.
+SHARD_INFO_FILE = '.shard.json'
+
+KEY_SHARD = 'shard'
+KEY_NUM_SHARDS = 'num_shards'
+KEY_SETTINGS = 'settings'
+
+
+class ShardError(Exception):
+    """Exception for invalid shards."""
+
+
+def parse_shard(spec):
+    """Parses a shard given as 'K/N', for shard K of N shards.
+
+    Returns:
+        A tuple (K, N), where 1 <= K <= N.
+    """
+    match = re.fullmatch(r'(\d+)/(\d+)', spec)
+    if not match:
+        raise ShardError(f'Invalid shard {spec!r}, expected K/N')
+    shard, num_shards = int(match.group(1)), int(match.group(2))
+    if not 1 <= shard <= num_shards:
+        raise ShardError(f'Invalid shard {spec!r}, expected 1 <= K <= N')
+    return shard, num_shards
+
+
+def get_shard_dir(output, shard, num_shards):
+    """Gets the output directory of a shard, containing its board outputs."""
+    return os.path.join(output, SHARDS_DIR_NAME, f'{shard}-of-{num_shards}')
+
+
+class ShardPlanner:
+    """Planner assigning work items to shards.
+
+    Items are assigned greedily, the most expensive first, to the shard with
+    the smallest total cost so far. The totals are kept across calls of
+    `select()`, so that the items of all calls are balanced together. The plan
+    only depends on the items and the order of the calls.
+
+    Attributes:
+        shard: The shard being built, from 1 to `num_shards`.
+        num_shards: Number of shards.
+        costs: Total estimated cost of the items of each shard.
+        num_items: Number of items of each shard.
+    """
+
+    def __init__(self, shard, num_shards):
+        self.shard = shard
+        self.num_shards = num_shards
+        self.costs = [0] * num_shards
+        self.num_items = [0] * num_shards
+
+    def select(self, costs):
+        """Assigns work items to the shards.
+
+        Args:
+            costs: A dict mapping names of work items to their estimated costs.
+
+        Returns:
+            A set of the names of the items assigned to `self.shard`.
+        """
+        selected = set()
+        for name, cost in sorted(costs.items(), key=lambda x: (-x[1], x[0])):
+            index = min(
+                range(self.num_shards), key=lambda i: (self.costs[i], i)
+            )
+            self.costs[index] += cost
+            self.num_items[index] += 1
+            if index + 1 == self.shard:
+                selected.add(name)
+        return selected
+
+
+def write_shard_info(output_dir, shard, num_shards, settings):
+    """Writes the description of a shard to its board output directory.
+
+    Args:
+        output_dir: Board output directory of the shard.
+        shard: The shard, from 1 to `num_shards`.
+        num_shards: Number of shards.
+        settings: A JSON serializable dict of the settings of the build, which
+            must be the same for all shards of the board.
+    """
+    info = {
+        KEY_SHARD: shard,
+        KEY_NUM_SHARDS: num_shards,
+        KEY_SETTINGS: settings,
+    }
+    with open(
+        os.path.join(output_dir, SHARD_INFO_FILE), 'w', encoding='utf-8'
+    ) as f:
+        json.dump(info, f, indent=1, sort_keys=True)
+
+
+def find_shards(output, board):
+    """Finds the outputs of all shards of `board`.
+
+    Args:
+        output: Output directory, containing the shard outputs in
+            `SHARDS_DIR_NAME`.
+        board: Board name.
+
+    Returns:
+        A tuple of a list of the board output directories of shards 1 to N, and
+        the settings of the shards, see `write_shard_info()`.
+    """
+    found = {}
+    pattern = os.path.join(output, SHARDS_DIR_NAME, '*', board, SHARD_INFO_FILE)
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding='utf-8') as f:
+            info = json.load(f)
+        found.setdefault(info[KEY_NUM_SHARDS], {})[info[KEY_SHARD]] = (
+            os.path.dirname(path),
+            info[KEY_SETTINGS],
+        )
+    if not found:
+        raise ShardError(f'No shards of {board} found in {output}')
+    if len(found) > 1:
+        raise ShardError(
+            f'Shards of {board} with different numbers of shards '
+            f'{sorted(found)} found in {output}'
+        )
+    ((num_shards, shards),) = found.items()
+    missing = sorted(set(range(1, num_shards + 1)) - set(shards))
+    if missing:
+        raise ShardError(
+            f'Missing shards {missing} of {num_shards} shards of {board}'
+        )
+    _, settings = shards[1]
+    for shard in range(2, num_shards + 1):
+        if shards[shard][1] != settings:
+            raise ShardError(
+                f'Shards 1/{num_shards} and {shard}/{num_shards} of {board} '
+                'were built with different settings'
+            )
+    return [shards[shard][0] for shard in range(1, num_shards + 1)], settings
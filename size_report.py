@@ -0,0 +1,174 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Size accounting of the bitmaps and archives of a board."""
+
+from collections import Counter
+import json
+import os
+import tempfile
+
+import archive_images
+import bmp
+
+
+REPORT_FILE = 'size_report.json'
+REPORT_VERSION = 1
+
+KEY_VERSION = 'version'
+KEY_RO_TOTAL = 'ro_total'
+KEY_TOTAL = 'total'
+KEY_ARCHIVES = 'archives'
+KEY_LOCALES = 'locales'
+KEY_CATEGORIES = 'categories'
+KEY_BITMAPS = 'bitmaps'
+
+# Locale of the bitmaps not in locale archives.
+NO_LOCALE = '_none_'
+# Category of the bitmaps with unknown style category.
+UNKNOWN_CATEGORY = '_unknown_'
+
+
+class SizeReportError(Exception):
+    """Exception for errors in size reports."""
+
+
+def _get_archive_locale(name):
+    """Gets the locale of archive `name`, or `NO_LOCALE`."""
+    for prefix in ('rw_locale_', 'locale_'):
+        if name.startswith(prefix):
+            return name[len(prefix) : -len('.bin')]
+    return NO_LOCALE
+
+
+def make_report(output_dir, categories):
+    """Makes the size report of a board output directory.
+
+    The bitmaps are not decoded; only their headers are parsed.
+
+    Args:
+        output_dir: The board output directory.
+        categories: A dict mapping bitmap names (without extension) to their
+            style categories in format.yaml.
+
+    Returns:
+        The report as a dict. Sizes are in bytes. Each bitmap is counted with
+        its archive directory entry, so the sizes of the archives are the sums
+        of their bitmaps and their headers.
+    """
+    archives = {}
+    locales = Counter()
+    category_sizes = Counter()
+    bitmaps = {}
+    for name, files in sorted(archive_images.get_archives(output_dir).items()):
+        locale = _get_archive_locale(name)
+        size = archive_images.ARCHIVE_HEADER_SIZE
+        for path in sorted(files):
+            header = bmp.read_header(path)
+            bitmap_size = (
+                os.path.getsize(path) + archive_images.ARCHIVE_ENTRY_SIZE
+            )
+            basename = os.path.splitext(os.path.basename(path))[0]
+            category = categories.get(basename, UNKNOWN_CATEGORY)
+            bitmaps[os.path.relpath(path, output_dir)] = {
+                'archive': name,
+                'category': category,
+                'size': bitmap_size,
+                'width': header.width,
+                'height': header.height,
+                'colors': header.colors,
+                'num_lines': header.num_lines,
+            }
+            size += bitmap_size
+            category_sizes[category] += bitmap_size
+        archives[name] = size
+        locales[locale] += size
+    return {
+        KEY_VERSION: REPORT_VERSION,
+        KEY_RO_TOTAL: sum(
+            size
+            for name, size in archives.items()
+            if not name.startswith('rw_')
+        ),
+        KEY_TOTAL: sum(archives.values()),
+        KEY_ARCHIVES: archives,
+        KEY_LOCALES: dict(sorted(locales.items())),
+        KEY_CATEGORIES: dict(sorted(category_sizes.items())),
+        KEY_BITMAPS: bitmaps,
+    }
+
+
+def save_report(report, path):
+    """Saves `report` to `path` atomically."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def load_report(path):
+    """Loads a report saved by `save_report()`."""
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    if report.get(KEY_VERSION) != REPORT_VERSION:
+        raise SizeReportError(f'{path}: Unsupported size report version')
+    return report
+
+
+def _get_changes(old, new):
+    """Gets the size changes between dicts of sizes `old` and `new`.
+
+    Returns:
+        A list of (key, old size, new size), with the largest growth first.
+    """
+    changes = [
+        (key, old.get(key, 0), new.get(key, 0))
+        for key in set(old) | set(new)
+        if old.get(key, 0) != new.get(key, 0)
+    ]
+    return sorted(
+        changes, key=lambda change: (change[1] - change[2], change[0])
+    )
+
+
+def _get_bitmap_sizes(report):
+    """Gets a dict mapping bitmaps to their sizes from `report`."""
+    return {name: info['size'] for name, info in report[KEY_BITMAPS].items()}
+
+
+def compare_reports(old, new, limit=10):
+    """Formats the size changes from report `old` to `new`.
+
+    Args:
+        old: The previous report.
+        new: The current report.
+        limit: Maximum number of changes listed per section.
+
+    Returns:
+        A list of lines. The largest growth is listed first in each section.
+    """
+
+    def format_change(key, old_size, new_size):
+        delta = new_size - old_size
+        percent = f'{delta / old_size:+.1%}' if old_size else 'new'
+        return f'  {key}: {old_size} -> {new_size} ({delta:+d}, {percent})'
+
+    lines = []
+    for key in (KEY_RO_TOTAL, KEY_TOTAL):
+        lines.append(format_change(key, old[key], new[key]).strip())
+    sections = (
+        ('archive', old[KEY_ARCHIVES], new[KEY_ARCHIVES]),
+        ('locale', old[KEY_LOCALES], new[KEY_LOCALES]),
+        ('category', old[KEY_CATEGORIES], new[KEY_CATEGORIES]),
+        ('bitmap', _get_bitmap_sizes(old), _get_bitmap_sizes(new)),
+    )
+    for title, old_sizes, new_sizes in sections:
+        changes = _get_changes(old_sizes, new_sizes)
+        if not changes:
+            continue
+        lines.append(f'Largest changes by {title}:')
+        lines.extend(format_change(*change) for change in changes[:limit])
+        if len(changes) > limit:
+            lines.append(f'  ... and {len(changes) - limit} more')
+    return lines
@@ -0,0 +1,256 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Compiler of translated strings from GRD and XTB files.
+
+This replaces running `grit build` over firmware_strings.grd, which writes the
+strings of every locale to JSON files. Only the XTB files of the requested
+locales are parsed, and the strings are returned directly.
+
+Translations in XTB files are keyed by message IDs, which are fingerprints of
+the English texts computed as in grit (grit/extern/tclib.py).
+"""
+
+from collections import namedtuple
+import functools
+import hashlib
+import os
+import xml.etree.ElementTree as ET
+
+
+# A message of the GRD file.
+#   name: Name of the message, e.g. 'btn_cancel'.
+#   parts: The text as a list of strings and `Placeholder` objects.
+#   meaning: Meaning of the message, which distinguishes the IDs of messages
+#     with the same text.
+#   fallback_to_english: If True, the message is omitted from locales without
+#     its translation, instead of falling back to the English text.
+Message = namedtuple(
+    'Message', ['name', 'parts', 'meaning', 'fallback_to_english']
+)
+# A placeholder in a message, such as <ph name="count">3</ph>.
+#   name: Presentation name of the placeholder, i.e. its name in upper case.
+#   text: The original text of the placeholder.
+Placeholder = namedtuple('Placeholder', ['name', 'text'])
+
+# Whitespace at the start and end of a message is kept if quoted with this.
+_QUOTE = "'''"
+
+
+class StringCompilerError(Exception):
+    """Exception for errors in compiling strings."""
+
+
+def get_fingerprint(text):
+    """Gets the signed 64-bit fingerprint of `text` like grit's FP module."""
+    fingerprint = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:16], 16)
+    if fingerprint & 0x8000000000000000:
+        fingerprint -= 1 << 64
+    return fingerprint
+
+
+def get_message_id(text, meaning=''):
+    """Gets the grit message ID of `text`.
+
+    Args:
+        text: The presentable text of the message, where placeholders are
+            replaced by their presentation names.
+        meaning: The meaning of the message, if any.
+
+    Returns:
+        The ID as a string of decimal digits.
+    """
+    fingerprint = get_fingerprint(text)
+    if meaning:
+        # Combine the fingerprints by shifting, as in tclib.GenerateMessageId.
+        fingerprint = (
+            get_fingerprint(meaning)
+            + (fingerprint << 1)
+            + (1 if fingerprint < 0 else 0)
+        )
+    return str(fingerprint & 0x7FFFFFFFFFFFFFFF)
+
+
+def _parse_parts(element, placeholder_tag):
+    """Parses the text of `element` with placeholders `placeholder_tag`.
+
+    Returns:
+        A list of strings and `Placeholder` objects.
+    """
+    parts = [element.text or '']
+    for child in element:
+        if child.tag == placeholder_tag:
+            name = child.get('name', '').upper()
+            # The example text (<ex>) of a placeholder is not part of it.
+            text = ''.join(
+                [child.text or ''] + [c.tail or '' for c in child if c.tail]
+            )
+            parts.append(Placeholder(name, text))
+        parts.append(child.tail or '')
+    return parts
+
+
+def _strip_parts(parts):
+    """Strips whitespace around the parts of a message, like grit."""
+    parts = list(parts)
+    if isinstance(parts[0], str):
+        parts[0] = parts[0].lstrip()
+        if parts[0].startswith(_QUOTE):
+            parts[0] = parts[0][len(_QUOTE) :]
+    if isinstance(parts[-1], str):
+        parts[-1] = parts[-1].rstrip()
+        if parts[-1].endswith(_QUOTE):
+            parts[-1] = parts[-1][: -len(_QUOTE)]
+    return parts
+
+
+def get_presentable_text(parts):
+    """Gets the text of `parts` with placeholders replaced by their names."""
+    return ''.join(
+        part.name if isinstance(part, Placeholder) else part for part in parts
+    )
+
+
+def parse_xtb(path):
+    """Parses the translations of XTB file `path`.
+
+    Returns:
+        A dict mapping message IDs to translations, each as a list of strings
+        and `Placeholder` objects with only the names set.
+    """
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError) as e:
+        raise StringCompilerError(f'Failed to parse {path}: {e}') from e
+    return {
+        translation.get('id'): _parse_parts(translation, 'ph')
+        for translation in root.iter('translation')
+    }
+
+
+class StringCompiler:
+    """Compiler of the strings of each locale from a GRD file.
+
+    The GRD file is parsed on first use. Compilers are picklable, so that the
+    strings of several locales can be compiled in parallel.
+    """
+
+    def __init__(self, grd_file):
+        """Inits the compiler.
+
+        Args:
+            grd_file: Path of the GRD file. The XTB files are relative to its
+                directory.
+        """
+        self.grd_file = grd_file
+
+    @functools.cached_property
+    def _grd(self):
+        """Parses the GRD file.
+
+        Returns:
+            A tuple of (source language, a dict mapping locales to languages of
+            the outputs, a dict mapping languages to XTB files, a list of
+            `Message` objects).
+        """
+        try:
+            root = ET.parse(self.grd_file).getroot()
+        except (OSError, ET.ParseError) as e:
+            raise StringCompilerError(
+                f'Failed to parse {self.grd_file}: {e}'
+            ) from e
+        base_dir = os.path.dirname(self.grd_file)
+        # The locale is the name of the output JSON file, which differs from
+        # the language for some locales, e.g. 'he' is translated by 'iw'.
+        locales = {
+            os.path.splitext(output.get('filename'))[0]: output.get('lang')
+            for output in root.iter('output')
+        }
+        xtb_files = {
+            translation.get('lang'): os.path.join(
+                base_dir, translation.get('path')
+            )
+            for translation in root.iter('file')
+        }
+        messages = []
+        for messages_element in root.iter('messages'):
+            fallback = messages_element.get('fallback_to_english') == 'true'
+            for message in messages_element.iter('message'):
+                messages.append(
+                    Message(
+                        message.get('name'),
+                        _strip_parts(_parse_parts(message, 'ph')),
+                        message.get('meaning', ''),
+                        fallback,
+                    )
+                )
+        return root.get('source_lang_id'), locales, xtb_files, messages
+
+    def get_locales(self):
+        """Gets the locales of the outputs of the GRD file."""
+        return sorted(self._grd[1])
+
+    def compile(self, locale):
+        """Compiles the strings of `locale`.
+
+        Only the XTB file of `locale` is parsed.
+
+        Args:
+            locale: A locale of the outputs of the GRD file, e.g. 'pt-BR'.
+
+        Returns:
+            A dict mapping message names to texts. Messages without translation
+            are omitted if they fall back to English, and otherwise in English.
+        """
+        source_lang, locales, xtb_files, messages = self._grd
+        if locale not in locales:
+            raise StringCompilerError(
+                f'Locale {locale!r} not in {self.grd_file}'
+            )
+        lang = locales[locale]
+        if lang in xtb_files:
+            translations = parse_xtb(xtb_files[lang])
+        elif source_lang and lang in (source_lang, source_lang.split('-')[0]):
+            translations = None
+        else:
+            raise StringCompilerError(f'No translations for {lang!r}')
+
+        strings = {}
+        for message in messages:
+            parts = message.parts
+            if translations is not None:
+                message_id = get_message_id(
+                    get_presentable_text(parts), message.meaning
+                )
+                if message_id in translations:
+                    placeholders = {
+                        part.name: part.text
+                        for part in parts
+                        if isinstance(part, Placeholder)
+                    }
+                    parts = translations[message_id]
+                    for part in parts:
+                        if (
+                            isinstance(part, Placeholder)
+                            and part.name not in placeholders
+                        ):
+                            raise StringCompilerError(
+                                f'Locale {locale!r}: Unknown placeholder '
+                                f'{part.name!r} in {message.name!r}'
+                            )
+                    parts = [
+                        (
+                            placeholders[part.name]
+                            if isinstance(part, Placeholder)
+                            else part
+                        )
+                        for part in parts
+                    ]
+                elif message.fallback_to_english:
+                    continue
+            strings[message.name] = ''.join(
+                part.text if isinstance(part, Placeholder) else part
+                for part in parts
+            )
+        return strings
@@ -0,0 +1,330 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""SVG rasterizer backends for converting sprites and glyphs to images."""
+
+import io
+import math
+import re
+import subprocess
+import xml.etree.ElementTree as ET
+
+from PIL import Image
+
+import tracing
+
+try:
+    import cairo
+    import gi
+
+    gi.require_version('Rsvg', '2.0')
+    gi.require_foreign('cairo')
+    from gi.repository import Rsvg
+except (ImportError, ValueError):
+    cairo = None
+    Rsvg = None
+
+try:
+    import cairosvg
+    import cairosvg.parser
+    import cairosvg.surface
+except (ImportError, OSError):
+    # OSError is raised if the cairo library cannot be loaded.
+    cairosvg = None
+
+
+# The SVG files are rasterized at 72DPI. If the width/height of the SVG file is
+# specified in points, rsvg-convert with its default 90DPI will potentially
+# cause the pixels at the right/bottom border of the output image to be
+# transparent (or filled with the specified background color). This seems like
+# an rsvg-convert issue regarding image scaling. Therefore, use 72DPI here to
+# avoid the scaling.
+SVG_DPI = 72
+
+# Sizes of the SVG length units in pixels at `SVG_DPI`.
+_UNIT_SIZES = {
+    '': 1,
+    'px': 1,
+    'pt': SVG_DPI / 72,
+    'pc': SVG_DPI / 6,
+    'in': SVG_DPI,
+    'cm': SVG_DPI / 2.54,
+    'mm': SVG_DPI / 25.4,
+}
+_LENGTH_PATTERN = re.compile(r'\s*([0-9.eE+-]+)\s*([a-z]*)\s*$')
+
+
+class RasterizerError(Exception):
+    """Exception for errors generated by SVG rasterizers."""
+
+
+def get_scaled_width(width, height, height_px):
+    """Gets the width of a `width` x `height` image scaled to `height_px`.
+
+    The aspect ratio is kept.
+    """
+    # Round up like rsvg-convert, tolerating floating-point errors.
+    return max(1, math.ceil(width * height_px / height - 1e-6))
+
+
+def _parse_length(value):
+    """Converts an SVG length to pixels at `SVG_DPI`, or None if invalid."""
+    match = _LENGTH_PATTERN.match(value or '')
+    if not match or match.group(2) not in _UNIT_SIZES:
+        return None
+    return float(match.group(1)) * _UNIT_SIZES[match.group(2)]
+
+
+def get_svg_size(svg_data):
+    """Gets the intrinsic (width, height) of an SVG in pixels at `SVG_DPI`.
+
+    The size is taken from the width and height attributes of the root element,
+    falling back to its viewBox.
+
+    Args:
+        svg_data: The SVG document as bytes.
+    """
+    root = ET.fromstring(svg_data)
+    width = _parse_length(root.get('width'))
+    height = _parse_length(root.get('height'))
+    if width is None or height is None:
+        view_box = (root.get('viewBox') or '').replace(',', ' ').split()
+        if len(view_box) != 4:
+            raise RasterizerError('Unknown size of SVG document')
+        width, height = (float(v) for v in view_box[2:])
+    return width, height
+
+
+def _parse_color(color):
+    """Converts '#rrggbb' to a tuple of floats for cairo."""
+    value = color.lstrip('#')
+    return tuple(int(value[i : i + 2], 16) / 255 for i in (0, 2, 4))
+
+
+def _image_from_surface(surface):
+    """Converts an opaque cairo image surface to a PIL image in RGB mode."""
+    surface.flush()
+    # FORMAT_RGB24 and FORMAT_ARGB32 are stored as native-endian 32-bit words,
+    # i.e. BGRX/BGRA on little-endian hosts. The alpha channel is ignored, since
+    # the background is always painted.
+    return Image.frombuffer(
+        'RGB',
+        (surface.get_width(), surface.get_height()),
+        bytes(surface.get_data()),
+        'raw',
+        'BGRX',
+        surface.get_stride(),
+        1,
+    )
+
+
+class SvgRasterizer:
+    """Base class of SVG rasterizers.
+
+    Rasterizers must be picklable, because they are shipped to the worker
+    processes together with the converter.
+    """
+
+    NAME = None
+
+    def rasterize(self, svg_data, height_px, bgcolor):
+        """Rasterizes an SVG document into an in-memory image.
+
+        Args:
+            svg_data: The SVG document as bytes.
+            height_px: Height of the image in pixels. The width is scaled
+                accordingly.
+            bgcolor: Background color (#rrggbb).
+
+        Returns:
+            A PIL image in RGB mode.
+        """
+        raise NotImplementedError
+
+    def rasterize_cells(self, svg_data, height_px, bgcolor, cells):
+        """Rasterizes horizontal cells of an SVG document into in-memory images.
+
+        By default, the whole image is rasterized once and cropped at the
+        nearest pixels, so a cell with a fractional `left` is anti-aliased
+        slightly differently than if its content were rasterized alone.
+
+        Args:
+            svg_data: The SVG document as bytes.
+            height_px: Height of the image in pixels. The width is scaled
+                accordingly.
+            bgcolor: Background color (#rrggbb).
+            cells: A list of (left, width_px) of the cells, where `left` is the
+                possibly fractional position of the cell in pixels.
+
+        Returns:
+            A list of PIL images in RGB mode, one for each cell.
+        """
+        image = self.rasterize(svg_data, height_px, bgcolor)
+        images = []
+        for left, width_px in cells:
+            left = round(left)
+            right = min(left + width_px, image.size[0])
+            cell = Image.new('RGB', (width_px, height_px), bgcolor)
+            cell.paste(image.crop((left, 0, right, height_px)))
+            images.append(cell)
+        return images
+
+
+class RsvgConvertRasterizer(SvgRasterizer):
+    """Rasterizer running the rsvg-convert command for each image."""
+
+    NAME = 'rsvg-convert'
+
+    def rasterize(self, svg_data, height_px, bgcolor):
+        # The SVG is read from stdin and the PNG is written to stdout.
+        command = [
+            'rsvg-convert',
+            '--background-color',
+            bgcolor,
+            '--dpi-x',
+            str(SVG_DPI),
+            '--dpi-y',
+            str(SVG_DPI),
+            '--height',
+            f'{height_px:d}',
+        ]
+        with tracing.span('rsvg-convert', 'subprocess'):
+            png_data = subprocess.run(
+                command, input=svg_data, check=True, stdout=subprocess.PIPE
+            ).stdout
+        with Image.open(io.BytesIO(png_data)) as image:
+            return image.convert('RGB')
+
+
+class RsvgRasterizer(SvgRasterizer):
+    """Rasterizer using librsvg in-process via GObject introspection.
+
+    This uses the same library as rsvg-convert, but avoids starting a new
+    process and encoding/decoding a PNG file for every image.
+    """
+
+    NAME = 'rsvg'
+
+    def __init__(self):
+        if not self.is_available():
+            raise RasterizerError(
+                'librsvg is not available; install PyGObject and pycairo'
+            )
+
+    @classmethod
+    def is_available(cls):
+        """Returns True if the librsvg bindings can be imported."""
+        return Rsvg is not None
+
+    @classmethod
+    def _get_size(cls, handle):
+        """Gets the intrinsic size of the SVG in pixels."""
+        if hasattr(handle, 'get_intrinsic_size_in_pixels'):
+            ok, width, height = handle.get_intrinsic_size_in_pixels()
+            if ok:
+                return width, height
+        dimensions = handle.get_dimensions()
+        return dimensions.width, dimensions.height
+
+    def _render(self, handle, width_px, height_px, bgcolor, left=0):
+        """Renders `handle` scaled to `height_px` and shifted by `left`."""
+        width, height = self._get_size(handle)
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width_px, height_px)
+        cr = cairo.Context(surface)
+        cr.set_source_rgb(*_parse_color(bgcolor))
+        cr.paint()
+        cr.translate(-left, 0)
+        scale = height_px / height
+        if hasattr(handle, 'render_document'):
+            viewport = Rsvg.Rectangle()
+            viewport.x = 0
+            viewport.y = 0
+            viewport.width = width * scale
+            viewport.height = height_px
+            handle.render_document(cr, viewport)
+        else:
+            cr.scale(scale, scale)
+            handle.render_cairo(cr)
+        return _image_from_surface(surface)
+
+    def _load(self, svg_data):
+        handle = Rsvg.Handle.new_from_data(svg_data)
+        handle.set_dpi(SVG_DPI)
+        width, height = self._get_size(handle)
+        if width <= 0 or height <= 0:
+            raise RasterizerError(f'Invalid size of SVG {width}x{height}')
+        return handle
+
+    def rasterize(self, svg_data, height_px, bgcolor):
+        handle = self._load(svg_data)
+        width, height = self._get_size(handle)
+        width_px = get_scaled_width(width, height, height_px)
+        return self._render(handle, width_px, height_px, bgcolor)
+
+    def rasterize_cells(self, svg_data, height_px, bgcolor, cells):
+        # Each cell is rendered from the vector data at its exact offset, so it
+        # is anti-aliased the same way as if its content were rendered alone.
+        handle = self._load(svg_data)
+        return [
+            self._render(handle, width_px, height_px, bgcolor, left=left)
+            for left, width_px in cells
+        ]
+
+
+class CairoSvgRasterizer(SvgRasterizer):
+    """Rasterizer using the CairoSVG Python package in-process."""
+
+    NAME = 'cairosvg'
+
+    def __init__(self):
+        if not self.is_available():
+            raise RasterizerError('CairoSVG is not available')
+
+    @classmethod
+    def is_available(cls):
+        """Returns True if CairoSVG can be imported."""
+        return cairosvg is not None
+
+    def rasterize(self, svg_data, height_px, bgcolor):
+        tree = cairosvg.parser.Tree(bytestring=svg_data)
+        # The surface is drawn on creation. It is not finished, so no PNG data
+        # is encoded; the pixels are read from the cairo surface directly.
+        surface = cairosvg.surface.PNGSurface(
+            tree,
+            None,
+            SVG_DPI,
+            output_height=height_px,
+            background_color=bgcolor,
+        )
+        return _image_from_surface(surface.cairo)
+
+
+RASTERIZERS = {
+    RsvgRasterizer.NAME: RsvgRasterizer,
+    CairoSvgRasterizer.NAME: CairoSvgRasterizer,
+    RsvgConvertRasterizer.NAME: RsvgConvertRasterizer,
+}
+
+
+def get_rasterizer(name=None):
+    """Creates an SVG rasterizer.
+
+    Args:
+        name: Name of the rasterizer backend (a key of `RASTERIZERS`). If None,
+            the first available in-process rasterizer (librsvg, then CairoSVG)
+            is used, and rsvg-convert otherwise.
+
+    Returns:
+        An `SvgRasterizer` instance.
+    """
+    if name is None:
+        if RsvgRasterizer.is_available():
+            name = RsvgRasterizer.NAME
+        elif CairoSvgRasterizer.is_available():
+            name = CairoSvgRasterizer.NAME
+        else:
+            name = RsvgConvertRasterizer.NAME
+    if name not in RASTERIZERS:
+        raise RasterizerError(f'Unknown rasterizer {name!r}')
+    return RASTERIZERS[name]()
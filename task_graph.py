@@ -0,0 +1,192 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Scheduler running a graph of dependent tasks on one worker pool."""
+
+from concurrent import futures
+import heapq
+import itertools
+import os
+
+
+class TaskGraphError(Exception):
+    """Exception for errors in the task graph."""
+
+
+class Task:
+    """A task in `TaskGraph`.
+
+    Attributes:
+        name: Unique name of the task.
+        func: The function to run.
+        args: Positional arguments of `func`.
+        kwargs: Keyword arguments of `func`.
+        local: True if the task runs in the main process.
+        priority: Tasks with higher priorities are started first.
+        on_done: A function called in the main process with the result of
+            `func` when the task finishes.
+        pending_deps: Names of unfinished tasks this task depends on.
+        dependents: Names of tasks depending on this task.
+        done: True if the task has finished.
+    """
+
+    def __init__(self, name, func, args, kwargs, local, priority, on_done):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.local = local
+        self.priority = priority
+        self.on_done = on_done
+        self.pending_deps = set()
+        self.dependents = []
+        self.done = False
+
+
+class TaskGraph:
+    """A graph of tasks with dependencies.
+
+    Tasks whose dependencies have finished run concurrently on a single
+    process pool, except for local tasks, which run in the main process.
+    Tasks may be added while the graph is running, for example from `on_done`
+    callbacks of other tasks.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.tasks = {}
+        self._ready = []
+        self._sequence = itertools.count()
+        self._num_done = 0
+        # Futures of the running tasks, mapped to the tasks.
+        self._running = {}
+
+    def add_task(
+        self,
+        name,
+        func,
+        *args,
+        deps=(),
+        local=False,
+        priority=0,
+        on_done=None,
+        **kwargs,
+    ):
+        """Adds a task to the graph.
+
+        Args:
+            name: Unique name of the task.
+            func: The function to run. Unless `local` is set, `func` and its
+                arguments must be picklable.
+            *args: Positional arguments of `func`.
+            deps: Names of the tasks this task depends on. They must have been
+                added already.
+            local: If True, run the task in the main process. Local tasks
+                should be short.
+            priority: Tasks with higher priorities are started first.
+            on_done: See `Task`.
+            **kwargs: Keyword arguments of `func`.
+
+        Returns:
+            `name`.
+        """
+        if name in self.tasks:
+            raise TaskGraphError(f'Duplicate task {name!r}')
+        task = Task(name, func, args, kwargs, local, priority, on_done)
+        for dep in deps:
+            if dep not in self.tasks:
+                raise TaskGraphError(f'Unknown dependency {dep!r} of {name!r}')
+            dep_task = self.tasks[dep]
+            if not dep_task.done:
+                task.pending_deps.add(dep)
+                dep_task.dependents.append(name)
+        self.tasks[name] = task
+        if not task.pending_deps:
+            self._push_ready(task)
+        return name
+
+    def _push_ready(self, task):
+        heapq.heappush(
+            self._ready, (-task.priority, next(self._sequence), task.name)
+        )
+
+    def _finish(self, task, result):
+        task.done = True
+        self._num_done += 1
+        if task.on_done:
+            task.on_done(result)
+        for name in task.dependents:
+            dependent = self.tasks[name]
+            dependent.pending_deps.discard(task.name)
+            if not dependent.pending_deps:
+                self._push_ready(dependent)
+
+    def _run(self, executor, progress):
+        """Runs the tasks on `executor`, see `run()`."""
+        # Keep a limited number of tasks in flight, so that priorities also
+        # apply to the tasks added by finished tasks.
+        max_running = self.max_workers * 2
+        running = self._running = {}
+        while self._ready or running:
+            while self._ready and len(running) < max_running:
+                _, _, name = heapq.heappop(self._ready)
+                task = self.tasks[name]
+                if task.local:
+                    self._finish(task, task.func(*task.args, **task.kwargs))
+                    if progress:
+                        progress(self._num_done, len(self.tasks))
+                    continue
+                future = executor.submit(task.func, *task.args, **task.kwargs)
+                running[future] = task
+            if not running:
+                continue
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                self._finish(task, future.result())
+                if progress:
+                    progress(self._num_done, len(self.tasks))
+
+    def _cancel(self):
+        """Cancels the running tasks that have not started yet.
+
+        Returns:
+            The futures of the tasks that could not be cancelled.
+        """
+        return [future for future in self._running if not future.cancel()]
+
+    def run(self, initializer=None, initargs=(), executor=None, progress=None):
+        """Runs all tasks.
+
+        Args:
+            initializer: A function called at the start of each worker process.
+            initargs: Arguments of `initializer`.
+            executor: A `concurrent.futures.ProcessPoolExecutor` of
+                `max_workers` processes to run the tasks on, which is kept
+                running afterwards, or None to start a new pool. `initializer`
+                is not used with an existing pool.
+            progress: A function called with the number of finished tasks and
+                the number of all tasks whenever a task finishes, or None.
+        """
+        if executor:
+            try:
+                self._run(executor, progress)
+            except BaseException:
+                # Wait for the running tasks, so that they do not interfere
+                # with the next tasks run on the pool.
+                futures.wait(self._cancel())
+                raise
+        else:
+            with futures.ProcessPoolExecutor(
+                self.max_workers, initializer=initializer, initargs=initargs
+            ) as executor:
+                try:
+                    self._run(executor, progress)
+                except BaseException:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        unfinished = sorted(n for n, t in self.tasks.items() if not t.done)
+        if unfinished:
+            raise TaskGraphError(f'Tasks not run: {unfinished}')
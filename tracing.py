@@ -0,0 +1,166 @@
+# Copyright 2024 The ChromiumOS Authors
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Tracing of build steps in the Chrome trace event format.
+
+Spans are recorded in memory by each process while tracing is enabled. The
+worker processes return their events together with the task results, and the
+main process merges them and saves one JSON file, which can be loaded in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# Events recorded in this process, or None if tracing is disabled.
+_events = None
+# Thread IDs of the rows of summary spans by name. They are allocated downwards
+# from -1, so that they do not collide with real thread IDs.
+_summary_tids = {}
+
+
+def enable():
+    """Enables tracing in this process."""
+    global _events  # pylint: disable=global-statement
+    if _events is None:
+        _events = []
+
+
+def is_enabled():
+    """Returns True if tracing is enabled in this process."""
+    return _events is not None
+
+
+def _now_us():
+    # The monotonic clock is shared by all processes, so the timestamps of the
+    # worker processes are comparable.
+    return time.monotonic_ns() // 1000
+
+
+@contextlib.contextmanager
+def span(name, category, **args):
+    """Records a span of the enclosed code.
+
+    Args:
+        name: Name of the span.
+        category: Category of the span.
+        **args: Arguments of the span, shown with the span in the viewer.
+
+    Yields:
+        The dict of the arguments, to which results of the enclosed code can
+        be added.
+    """
+    if _events is None:
+        yield args
+        return
+    start = _now_us()
+    try:
+        yield args
+    finally:
+        add_span(
+            name,
+            category,
+            start,
+            _now_us(),
+            tid=threading.get_native_id(),
+            **args,
+        )
+
+
+def add_span(name, category, start, end, tid, **args):
+    """Adds a span of this process from `start` to `end` in microseconds.
+
+    Args:
+        name: Name of the span.
+        category: Category of the span.
+        start: Start time, as in the events returned by `get_events()`.
+        end: End time.
+        tid: Thread ID.
+        **args: Arguments of the span.
+    """
+    if _events is None:
+        return
+    _events.append(
+        {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start,
+            'dur': end - start,
+            'pid': os.getpid(),
+            'tid': tid,
+            'args': args,
+        }
+    )
+
+
+def add_summary_span(name, category, start, end, **args):
+    """Adds a span summarizing other spans, e.g. those of a locale.
+
+    Summary spans may overlap each other, so each name has its own row.
+    Arguments are as in `add_span()`.
+    """
+    tid = _summary_tids.setdefault(name, -1 - len(_summary_tids))
+    add_span(name, category, start, end, tid, **args)
+
+
+def get_events():
+    """Gets the events recorded or merged in this process."""
+    return list(_events or [])
+
+
+def take_events():
+    """Gets and clears the events recorded in this process.
+
+    This is used by the worker processes to send their events to the main
+    process with each task result.
+    """
+    if not _events:
+        return []
+    events = list(_events)
+    _events.clear()
+    return events
+
+
+def merge_events(events):
+    """Merges events taken from another process by `take_events()`."""
+    if _events is not None:
+        _events.extend(events)
+
+
+def save(path):
+    """Saves the events in Chrome trace event format to `path`."""
+    main_pid = os.getpid()
+    pids = sorted({event['pid'] for event in _events or []} | {main_pid})
+    metadata = [
+        {
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': pid,
+            'args': {'name': 'main' if pid == main_pid else f'worker {pid}'},
+        }
+        for pid in pids
+    ]
+    metadata.extend(
+        {
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': main_pid,
+            'tid': tid,
+            'args': {'name': name},
+        }
+        for name, tid in _summary_tids.items()
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                'traceEvents': metadata + (_events or []),
+                'displayTimeUnit': 'ms',
+            },
+            f,
+        )
@@ -6,10 +6,16 @@
 """Script for strings updating."""
 
 import argparse
+from concurrent import futures
+import csv
 import glob
+import itertools
+import json
 import logging
 import os
 import re
+import shutil
+import tempfile
 from xml.etree import ElementTree
 
 
@@ -20,6 +26,16 @@ DEFAULT_DEST_STRINGS_PATH = os.path.join(
     os.path.dirname(__file__), 'strings', 'locale'
 )
 
+# Kinds of changes of message ids from the destination to the source.
+CHANGE_NEW = 'new'
+CHANGE_UPDATED = 'updated'
+CHANGE_DELETED = 'deleted'
+CHANGES = (CHANGE_NEW, CHANGE_UPDATED, CHANGE_DELETED)
+# Message ids not changed in a locale.
+UNCHANGED = 'unchanged'
+
+REPORT_FORMATS = ('json', 'csv')
+
 
 def get_locales_from_dir(src_dir):
     """Gets a set of locales of xtb files in src_dir."""
@@ -31,31 +47,42 @@ def get_locales_from_dir(src_dir):
     return locales
 
 
-def load_xtb_to_dict(xtb_dir, locale):
+def load_xtb_to_dict(xtb_dir, locale, message_ids=None):
     """Loads xtb file to dict.
 
     Args:
         xtb_dir: The directory of xtb files.
         locale: The locale of the xtb file to be loaded.
+        message_ids: If not None, only load the messages with these ids.
 
     Returns:
         A dict of message_id => message.
     """
     xtb_file = os.path.join(xtb_dir, f'firmware_strings_{locale}.xtb')
-    xtb_root = ElementTree.parse(xtb_file).getroot()
     res = {}
-    for item in xtb_root:
-        res[item.attrib['id']] = item.text
+    # Stream the file, clearing each translation once it is read, so that the
+    # whole tree is never built.
+    for _, item in ElementTree.iterparse(xtb_file):
+        if item.tag == 'translation':
+            message_id = item.attrib['id']
+            if message_ids is None or message_id in message_ids:
+                res[message_id] = item.text
+            item.clear()
     return res
 
 
 def save_dict_to_xtb(data, out_dir, locale):
     """Saves the dict to xtb file.
 
+    The file is replaced atomically, and only if its content changes.
+
     Args:
         data: The dict of message_id => message.
         out_dir: The directory of xtb files.
         locale: The locale of the xtb file to be saved.
+
+    Returns:
+        True if the file was written, False if it was unchanged.
     """
     out_xtb = ElementTree.Element('translationbundle', {'lang': locale})
     out_xtb.text = '\n'
@@ -64,15 +91,29 @@ def save_dict_to_xtb(data, out_dir, locale):
         e.text = text
         e.tail = '\n'
     out_file = os.path.join(out_dir, f'firmware_strings_{locale}.xtb')
+    with open(out_file, 'rb') as f:
+        old_content = f.read()
+    # From chromium/src/tools/grit/grit/xtb_reader.py.
+    # Keep the header and replace the data of the <translationbundle> tag.
+    header_size = old_content[:1024].find(b'<translationbundle')
+    if header_size < 0:
+        raise RuntimeError(f'No <translationbundle> tag in {out_file!r}')
+    header = old_content[:header_size]
+    content = header + ElementTree.tostring(out_xtb, encoding='utf-8')
+    if content == old_content:
+        logging.info('Unchanged %r', out_file)
+        return False
     logging.info('Saving %r', out_file)
-    with open(out_file, 'rb+') as f:
-        # From chromium/src/tools/grit/grit/xtb_reader.py.
-        # Skip the header and write the data of the <translationbundle> tag.
-        front_of_file = f.read(1024)
-        f.seek(front_of_file.find(b'<translationbundle'))
-        out = ElementTree.tostring(out_xtb, encoding='utf-8')
-        f.write(out)
-        f.truncate()
+    fd, temp_file = tempfile.mkstemp(dir=out_dir, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        shutil.copymode(out_file, temp_file)
+        os.replace(temp_file, out_file)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+    return True
 
 
 def merge_xtb_data(locale, in_dir, out_dir, message_ids):
@@ -94,7 +135,7 @@ def merge_xtb_data(locale, in_dir, out_dir, message_ids):
     update_ids = set()
     del_ids = set()
 
-    in_data = load_xtb_to_dict(in_dir, locale)
+    in_data = load_xtb_to_dict(in_dir, locale, set(message_ids))
     out_data = load_xtb_to_dict(out_dir, locale)
     for message_id in message_ids:
         if message_id in in_data and message_id not in out_data:
@@ -122,9 +163,110 @@ def merge_xtb_data(locale, in_dir, out_dir, message_ids):
     return new_ids, update_ids, del_ids
 
 
+def diff_xtb_data(locale, in_dir, out_dir):
+    """Diffs the xtb data of `locale`.
+
+    Args:
+        locale: The locale of the xtb files to be diffed.
+        in_dir: The source.
+        out_dir: The destination.
+
+    Returns:
+        A dict mapping each of `CHANGES` to a sorted list of message ids.
+    """
+    in_data = load_xtb_to_dict(in_dir, locale)
+    out_data = load_xtb_to_dict(out_dir, locale)
+    return {
+        CHANGE_NEW: sorted(set(in_data) - set(out_data)),
+        CHANGE_UPDATED: sorted(
+            key
+            for key, value in in_data.items()
+            if key in out_data and value != out_data[key]
+        ),
+        CHANGE_DELETED: sorted(set(out_data) - set(in_data)),
+    }
+
+
+def get_change_matrix(changes):
+    """Gets the changes of each message id by locale.
+
+    Args:
+        changes: A dict mapping locales to the results of `diff_xtb_data()`.
+
+    Returns:
+        A dict mapping each changed message id to a dict, which maps locales
+        to the change of the id in the locale.
+    """
+    matrix = {}
+    for locale, locale_changes in changes.items():
+        for change, message_ids in locale_changes.items():
+            for message_id in message_ids:
+                matrix.setdefault(message_id, {})[locale] = change
+    return dict(sorted(matrix.items()))
+
+
+def get_inconsistent_ids(changes):
+    """Gets the message ids whose change differs between locales.
+
+    Args:
+        changes: A dict mapping locales to the results of `diff_xtb_data()`.
+
+    Returns:
+        A dict mapping each inconsistent message id to a dict, which maps each
+        of `CHANGES` and `UNCHANGED` to the sorted list of locales with that
+        change of the id.
+    """
+    inconsistent = {}
+    for message_id, locale_changes in get_change_matrix(changes).items():
+        by_change = {}
+        for locale in sorted(changes):
+            change = locale_changes.get(locale, UNCHANGED)
+            by_change.setdefault(change, []).append(locale)
+        if len(by_change) > 1:
+            inconsistent[message_id] = by_change
+    return inconsistent
+
+
+def save_diff_report(path, report_format, changes, inconsistent):
+    """Saves the diff of all locales.
+
+    Args:
+        path: The output file.
+        report_format: One of `REPORT_FORMATS`. A JSON report has the changes
+            of each locale and the inconsistent ids. A CSV report is a matrix
+            of the changes, with a row for each changed id and a column for
+            each locale.
+        changes: A dict mapping locales to the results of `diff_xtb_data()`.
+        inconsistent: The result of `get_inconsistent_ids()`.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if report_format == 'json':
+            json.dump(
+                {'locales': changes, 'inconsistent': inconsistent},
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+            f.write('\n')
+            return
+        locales = sorted(changes)
+        writer = csv.writer(f)
+        writer.writerow(['id'] + locales)
+        for message_id, row in get_change_matrix(changes).items():
+            writer.writerow(
+                [message_id] + [row.get(locale, '') for locale in locales]
+            )
+
+
 def get_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('--verbosity', '-v', action='count', default=0)
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        type=int,
+        help='The number of worker processes (default: number of CPUs).',
+    )
     parser.add_argument(
         '--from',
         dest='in_dir',
@@ -155,7 +297,26 @@ def get_arguments():
     diff_parser.add_argument(
         '--id-only', action='store_true', help="Don't show the message content."
     )
-    diff_parser.add_argument('locale', help='The locale file to diff.')
+    diff_parser.add_argument(
+        '--all',
+        action='store_true',
+        help='Diff all locales in parallel and summarize the ids whose change '
+        'differs between locales.',
+    )
+    diff_parser.add_argument(
+        '--output',
+        '-o',
+        help='With --all, write the changes of all locales to this file.',
+    )
+    diff_parser.add_argument(
+        '--format',
+        choices=REPORT_FORMATS,
+        help='With --output, the format of the file (default: from the file '
+        'extension, or json).',
+    )
+    diff_parser.add_argument(
+        'locale', nargs='?', help='The locale file to diff.'
+    )
 
     return parser.parse_args(), parser
 
@@ -200,6 +361,63 @@ def diff(args):
     )
 
 
+def diff_all(args):
+    in_locales = get_locales_from_dir(args.in_dir)
+    out_locales = get_locales_from_dir(args.out_dir)
+    if in_locales != out_locales:
+        logging.warning(
+            'Ignoring locales not in both input and output xtb files: %s',
+            in_locales ^ out_locales,
+        )
+    locales = sorted(in_locales & out_locales)
+    with futures.ProcessPoolExecutor(args.jobs) as executor:
+        changes = dict(
+            zip(
+                locales,
+                executor.map(
+                    diff_xtb_data,
+                    locales,
+                    itertools.repeat(args.in_dir),
+                    itertools.repeat(args.out_dir),
+                ),
+            )
+        )
+    inconsistent = get_inconsistent_ids(changes)
+
+    print(f'{"Locale":<10}' + ''.join(f'{c.capitalize():>9}' for c in CHANGES))
+    for locale in locales:
+        print(
+            f'{locale:<10}'
+            + ''.join(f'{len(changes[locale][c]):>9}' for c in CHANGES)
+        )
+    print(
+        '---------------------------------------------------------------------'
+    )
+    for change in CHANGES:
+        # Ids with the same change in all locales can be merged directly.
+        message_ids = sorted(
+            set.intersection(
+                *(set(changes[locale][change]) for locale in locales)
+            )
+            if locales
+            else ()
+        )
+        print(f'{change.capitalize()} in all locales: {" ".join(message_ids)}')
+    print(f'Ids with different changes between locales: {len(inconsistent)}')
+    for message_id, by_change in inconsistent.items():
+        print(f'{message_id}:')
+        for change, change_locales in by_change.items():
+            print(f'  {change}: {" ".join(change_locales)}')
+
+    if args.output:
+        report_format = args.format
+        if not report_format:
+            extension = os.path.splitext(args.output)[1].lstrip('.')
+            report_format = extension if extension in REPORT_FORMATS else 'json'
+        save_diff_report(args.output, report_format, changes, inconsistent)
+        print(f'Report written to {args.output}')
+
+
 def merge(args):
     in_locales = get_locales_from_dir(args.in_dir)
     out_locales = get_locales_from_dir(args.out_dir)
@@ -213,11 +431,20 @@ def merge(args):
             in_locales - out_locales,
         )
 
-    prev_id_sets = None
-    for locale in sorted(out_locales):
-        id_sets = merge_xtb_data(
-            locale, args.in_dir, args.out_dir, args.message_ids
+    # Locales are merged in parallel, and compared in order afterwards.
+    locales = sorted(out_locales)
+    with futures.ProcessPoolExecutor(args.jobs) as executor:
+        all_id_sets = executor.map(
+            merge_xtb_data,
+            locales,
+            itertools.repeat(args.in_dir),
+            itertools.repeat(args.out_dir),
+            itertools.repeat(args.message_ids),
         )
+        all_id_sets = list(all_id_sets)
+
+    prev_id_sets = None
+    for locale, id_sets in zip(locales, all_id_sets):
         if prev_id_sets and id_sets != prev_id_sets:
             logging.warning(
                 'Locale %r: Updated ids are different with the previous '
@@ -233,7 +460,14 @@ def main():
     args, parser = get_arguments()
     logging.basicConfig(level=logging.WARNING - 10 * args.verbosity)
     if args.cmd == 'diff':
-        diff(args)
+        if args.all == bool(args.locale):
+            parser.error('Specify exactly one of locale and --all')
+        if args.output and not args.all:
+            parser.error('--output requires --all')
+        if args.all:
+            diff_all(args)
+        else:
+            diff(args)
     elif args.cmd == 'merge':
         merge(args)
     else: